@@ -1,17 +1,29 @@
 import logging
+import os
 import sys
-import textwrap
+from typing import Optional
 
 import yaml
-from erc3 import ERC3, DemoClient
+from erc3 import ERC3
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool, render_text_description
-from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import ToolNode
 
+from erc.checkpoint import CompactSqliteSaver, SessionJournal
+from erc.experts.coding import CodingExpert
 from erc.experts.constraint import ConstraintExpert
+from erc.experts.decision import DecisionEngine
 from erc.experts.planning import PlanningExpert
-from erc.experts.tool import ExecutorExpert
+from erc.experts.reflection import ReflectionExpert
+from erc.experts.schemas import constrained_plan_schema
+from erc.experts.tool import ToolExpert
+from erc.experts.validator import PlanValidator
+from erc.experts.executor import ExecutorExpert
+from erc.metrics import MetricsRecorder
+from erc.plan_cache import PlanCache
+from erc.router import ModelEndpoint, ModelRouter
+from erc.sandbox import SandboxPool, python_tool
+from erc.session import run_session, task_api, task_id
 from erc.workflow import workflow
 
 logging.basicConfig(
@@ -22,28 +34,29 @@ logging.basicConfig(
     ]
 )
 
-DEMO_API: DemoClient = None  # TODO: think of better injection
-CURRENT_TASK = None  # TODO: think of better injection
+SESSION_CONCURRENCY = 4
+SESSION_DB = "session.sqlite"  # checkpoints and task journal; a rerun resumes the unfinished session
+MODELS_CONFIG = "models.yml"  # per-expert endpoints and escalation, see erc/router.py; all on oss-20b without it
 
 
 @tool
-def provide_answer(answer: str) -> str:  # TODO: task id passed though LLM, this is bad, MB shall go into state
+def provide_answer(answer: str, config: RunnableConfig) -> str:
     """
     Provide an answer for the current task.
     Args:
         answer (str): The answer for the current task.
     """
     print("<----- report_task_completion")
-    resp = DEMO_API.provide_answer(CURRENT_TASK, answer)
+    resp = task_api(config).provide_answer(task_id(config), answer)
     print(f"RESPONSE: {resp}")
     return resp  # TODO: this is example only, course you hardcoded SUCCESS
 
 
 @tool
-def get_secret() -> str:
+def get_secret(config: RunnableConfig) -> str:
     """Get the secret value for the current task."""
     print("<----- get_secret")
-    resp = DEMO_API.get_secret()
+    resp = task_api(config).get_secret()
     return resp.value
 
 TOOLS = [provide_answer, get_secret]
@@ -99,62 +112,92 @@ def get_erc3_key() -> str:
 
 #     return workflow(p, c, tool_node)
 
-def create_workflow(meta_callback, tools):
+def create_workflow(meta_callback, tools, cache_prompt: bool = True, compact_personas: bool = False,
+                    plan_cache_path: Optional[str] = None, constrained_decoding: bool = False,
+                    stream_plan: bool = False, metrics: Optional[MetricsRecorder] = None,
+                    direct_dispatch: bool = False, router: Optional[ModelRouter] = None,
+                    decisions: Optional[DecisionEngine] = None, sandbox: Optional[SandboxPool] = None):
 
-    llm = ChatOpenAI(
-        model="oss-20b",
-        base_url="http://localhost:8080/v1",
-        api_key="",
-        temperature=0.0,
-        request_timeout=120.0
-    )
+    if router is None:
+        router = ModelRouter.single(ModelEndpoint(model="oss-20b", base_url="http://localhost:8080/v1",
+                                                  cache_prompt=cache_prompt, request_timeout=120.0))
     
-    llm_with_tools = llm.bind_tools(tools)
+    coding = None
+    if sandbox is not None:
+        # "code" steps get a snippet from the coding expert, run by the tool node in the sandbox
+        python = python_tool(sandbox)
+        tools = list(tools) + [python]
+        coding = CodingExpert(
+            persona_path="prompts/oss-20b-synthetic-persona",
+            tool=python,
+            llm=router.llm("coding"),
+            callback=meta_callback,
+            compact_persona=compact_personas,
+        )
+
     tools_desc_str = render_text_description(tools)
-    
+    plan_cache = PlanCache(tools_desc_str, path=plan_cache_path) if plan_cache_path else None
+    validator = PlanValidator.for_tools(tools)
+
+    e = ExecutorExpert(
+        persona_path="prompts/oss-20b-synthetic-persona",
+        llm=router.llm("executor"),
+        tool_desc=tools_desc_str,
+        callback=meta_callback,
+        compact_persona=compact_personas,
+        fast_path=validator if direct_dispatch else None,
+        decisions=decisions,
+    )
+
     p = PlanningExpert(
         persona_path="prompts/oss-20b-synthetic-persona",
-        llm=llm_with_tools,
-        tools=tools, 
+        llm=router.llm("planner"),
         tool_desc=tools_desc_str,
         callback=meta_callback,
+        compact_persona=compact_personas,
+        plan_cache=plan_cache,
+        plan_schema=constrained_plan_schema(validator.registry) if constrained_decoding else None,
+        skip_review=constrained_decoding,
+        validator=validator,
+        on_step=e.prefetch if stream_plan else None,
     )
     
     c = ConstraintExpert(
         persona_path="prompts/oss-20b-synthetic-persona",
-        llm=llm_with_tools,
-        tools=tools,
+        llm=router.llm("reviewer"),
         tool_desc=tools_desc_str,
         callback=meta_callback,
+        compact_persona=compact_personas,
+        plan_cache=plan_cache,
+        validator=validator,
     )
-    
-    e = ExecutorExpert(
+
+    t = ToolExpert(
         persona_path="prompts/oss-20b-synthetic-persona",
-        llm=llm_with_tools, 
+        llm=router.llm("tool"),
         tools=tools,
-        tool_desc=tools_desc_str,
         callback=meta_callback,
+        compact_persona=compact_personas,
     )
 
-    tool_node_instance = ToolNode(tools)
+    # tool errors come back as error ToolMessages, so reflection (and a direct retry) can see them
+    tool_node_instance = ToolNode(tools, handle_tool_errors=True)
 
-    return workflow(p, c, e, tool_node_instance)
+    return workflow(p, c, e, t, tool_node_instance, ReflectionExpert(), metrics=metrics, coding_expert=coding)
 
 if __name__ == "__main__":
     core = ERC3(key=get_erc3_key())
 
-
-    def meta_callback(meta, started):
-        print(f"METADATA: {meta}")
-        # core.log_llm(
-        #     task_id=CURRENT_TASK,
-        #     model="gpt-oss-20b", #TODO: EXTRANCT CORRECTLY from meta # must match slug from OpenRouter
-        #     duration_sec=time.time() - started,
-        #     usage=meta, # TODO: this is incorrect too
-        # )
-
-
-    app = create_workflow(meta_callback, tools=TOOLS).compile()
+    # records per-node latency and tokens and forwards every LLM call to core.log_llm
+    metrics = MetricsRecorder(core=core)
+    journal = SessionJournal(SESSION_DB)
+    checkpointer = CompactSqliteSaver.from_path(SESSION_DB)
+    router = ModelRouter.from_yaml(MODELS_CONFIG) if os.path.exists(MODELS_CONFIG) else None
+    # registered tools are decided without the executor LLM; only ambiguous steps fall back to it
+    decisions = DecisionEngine(t.name for t in TOOLS)
+    sandbox = SandboxPool().start()
+    app = create_workflow(metrics, tools=TOOLS, metrics=metrics, router=router,
+                          decisions=decisions, sandbox=sandbox).compile(checkpointer=checkpointer)
 
     logging.info("🚀 Starting Demo Agent...")
     # png_bytes = app.get_graph().draw_mermaid_png()
@@ -162,43 +205,34 @@ if __name__ == "__main__":
     # with open('img.png', "wb") as f:
     #     f.write(png_bytes)
 
-    config = RunnableConfig(recursion_limit=50)
-
-    # Start session with metadata
-    res = core.start_session(
-        benchmark="demo",
-        workspace="dev",
-        name=f"connection test",
-        architecture="none")
-
-    status = core.session_status(res.session_id)
+    session_id = journal.value("session_id")
+    if session_id:
+        logging.info(f"Resuming session {session_id}: {journal.counts()}")
+    else:
+        # Start session with metadata
+        res = core.start_session(
+            benchmark="demo",
+            workspace="dev",
+            name=f"connection test",
+            architecture="none")
+        session_id = res.session_id
+        journal.set_value("session_id", session_id)
+
+    status = core.session_status(session_id)
     print(f"Session has {len(status.tasks)} tasks")
-    for task in status.tasks:
-        print("=" * 40)
-        print(f"Starting Task: {task.task_id} ({task.spec_id}): {task.task_text}")
-
-        CURRENT_TASK = task.task_id
-        # start the task
-        core.start_task(task)
-        try:
-            demo_api = core.get_demo_client(task)
-            DEMO_API = demo_api  # TODO: think of better injection
-
-            app.invoke({
-                "input_task": task.task_text,
-                "consecutive_review_failures": 0,
-                "history": [],
-                "iterations": 0,
-                "plan_is_valid": False,
-            }, config)
-
-
-        except Exception as e:
-            print(e)
-
-        result = core.complete_task(task)
-        if result.eval:
-            explain = textwrap.indent(result.eval.logs, "  ")
-            print(f"\nSCORE: {result.eval.score}\n{explain}\n")
-
-    core.submit_session(res.session_id)
+    run_session(core, app, status.tasks, max_workers=SESSION_CONCURRENCY, journal=journal)
+
+    if journal.counts().get("failed"):
+        print(f"Some tasks are still open, rerun to resume them: {journal.counts()}")
+    else:
+        core.submit_session(session_id)
+        journal.set_value("session_id", None)
+
+    print(metrics.summary())
+    print(f"Executor decisions: {decisions.summary()}")
+    print(f"Sandbox: {sandbox.summary()}")
+    sandbox.close()
+    if router is not None:
+        print(router.summary())
+    metrics.export_jsonl("metrics.jsonl")
+    metrics.export_prometheus("metrics.prom")
@@ -0,0 +1,136 @@
+"""
+Planner/reviewer ping-pong vs. single-pass constrained decoding.
+
+Drives the planner and reviewer through the same routing functions the graph
+uses, against the local stub server. In the default mode the stub emits a
+structurally invalid plan (unknown tool, missing argument) at `--invalid-rate`,
+which costs a replan round trip. In constrained mode the plan schema pins tool
+names and argument types, as a grammar-constrained server would, and the
+reviewer call is skipped.
+
+    python -m erc.bench.constrained --tasks 20 --invalid-rate 0.3
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+from erc.bench.stub_server import StubLLMServer
+from erc.experts.constraint import ConstraintExpert
+from erc.experts.planning import PlanningExpert
+from erc.experts.schemas import constrained_plan_schema
+from erc.experts.validator import PlanValidator
+from erc.llm import create_llm
+from erc.store.tools import TOOLS_DESC
+from erc.workflow import plan_review_loop, planner_routing
+
+VALID_PLAN = {"steps": [
+    {"tool_name": "/products/list", "arguments": {"offset": 0, "limit": 10},
+     "reasoning": "Find the product.", "summary": "List products."},
+    {"tool_name": "/basket/add", "arguments": {"sku": "GPU-4090", "quantity": 2},
+     "reasoning": "Add it.", "summary": "Add to basket."},
+    {"tool_name": "/basket/checkout", "arguments": {},
+     "reasoning": "Buy.", "summary": "Checkout."},
+    {"tool_name": "report_completion", "arguments": {"final_message": "Done."},
+     "reasoning": "Report.", "summary": "Report completion."},
+]}
+
+INVALID_PLANS = [
+    {"steps": [{"tool_name": "/basket/buy", "arguments": {"sku": "GPU-4090"},
+                "reasoning": "Buy.", "summary": "Buy."}]},
+    {"steps": [{"tool_name": "/basket/add", "arguments": {"product": "GPU-4090"},
+                "reasoning": "Add.", "summary": "Add."},
+               {"tool_name": "report_completion", "arguments": {},
+                "reasoning": "Report.", "summary": "Report."}]},
+]
+
+
+class PlanResponder:
+    """Answers by the requested response schema name, seeded for repeatable runs."""
+
+    def __init__(self, invalid_rate: float, seed: int):
+        self.invalid_rate = invalid_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def __call__(self, body: dict) -> dict:
+        schema_name = body.get("response_format", {}).get("json_schema", {}).get("name")
+        if schema_name == "ConstraintExpertOutput":
+            return {"content": json.dumps({"is_valid": True, "review_feedback": "All constraints hold."})}
+        if schema_name == "ExecutionPlan":
+            with self.lock:
+                invalid = self.random.random() < self.invalid_rate
+                plan = self.random.choice(INVALID_PLANS) if invalid else VALID_PLAN
+            return {"content": json.dumps(plan)}
+        return {"content": json.dumps(VALID_PLAN)}
+
+
+def plan_task(planner: PlanningExpert, reviewer: ConstraintExpert, task: str) -> dict:
+    state = {"input_task": task, "messages": [], "step_pointer": 0, "plan": None}
+    while True:
+        state = {**state, **planner.node(state)}
+        if planner_routing(state) == "executor":
+            return state
+        state = {**state, **reviewer.node(state)}
+        if plan_review_loop(state) != "planner":
+            return state
+
+
+def measure(server: StubLLMServer, persona_path: str, constrained: bool, tasks: int) -> dict:
+    llm = create_llm(base_url=server.base_url)
+    validator = PlanValidator.for_store()
+    planner = PlanningExpert(
+        persona_path=persona_path,
+        tool_desc=TOOLS_DESC,
+        llm=llm,
+        callback=lambda meta, started: None,
+        plan_schema=constrained_plan_schema(validator.registry) if constrained else None,
+        skip_review=constrained,
+        validator=validator,
+    )
+    reviewer = ConstraintExpert(
+        persona_path=persona_path,
+        tool_desc=TOOLS_DESC,
+        llm=llm,
+        callback=None,
+        validator=validator,
+    )
+
+    requests_before = server.stats["requests"]
+    approved = 0
+    started = time.perf_counter()
+    for i in range(tasks):
+        plan = plan_task(planner, reviewer, f"Buy 2 GPU-4090 and checkout (#{i})").get("plan")
+        approved += bool(plan and plan.review and plan.review.is_valid)
+    elapsed = time.perf_counter() - started
+    return {
+        "calls_per_task": (server.stats["requests"] - requests_before) / tasks,
+        "sec_per_task": elapsed / tasks,
+        "approved": approved,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--invalid-rate", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--persona-path", default="prompts/oss-20b-synthetic-persona")
+    parser.add_argument("--decode-ms-per-token", type=float, default=5.0)
+    args = parser.parse_args()
+
+    responder = PlanResponder(args.invalid_rate, args.seed)
+    with StubLLMServer(responder, decode_ms_per_token=args.decode_ms_per_token) as server:
+        for constrained in (False, True):
+            result = measure(server, args.persona_path, constrained, args.tasks)
+            print(
+                f"constrained={str(constrained):5} "
+                f"llm calls/task={result['calls_per_task']:5.2f} "
+                f"time/task={result['sec_per_task'] * 1000:7.1f}ms "
+                f"approved={result['approved']}/{args.tasks}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+In-process fake of the ERC3 store API for offline benchmarks.
+
+`FakeStore` implements the client methods named in TOOL_TO_METHOD, so
+`call_tool` and STORE_TOOLS run against it unchanged. `FakeCore` and `FakeTask`
+stand in for ERC3 and its session tasks, so `run_session` can drive the graph.
+"""
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class Product(BaseModel):
+    sku: str
+    name: str
+    price: float
+    stock: int
+
+
+DEFAULT_PRODUCTS = [
+    Product(sku="GPU-4090", name="NVIDIA RTX 4090 graphics card", price=1599.0, stock=5),
+    Product(sku="GPU-4070", name="NVIDIA RTX 4070 graphics card", price=599.0, stock=12),
+    Product(sku="CPU-7950X", name="AMD Ryzen 9 7950X processor", price=549.0, stock=8),
+    Product(sku="LAPTOP-X1", name="ThinkPad X1 Carbon laptop", price=1899.0, stock=3),
+    Product(sku="LAPTOP-AIR", name="MacBook Air 13 laptop", price=1099.0, stock=6),
+    Product(sku="MON-27", name="27 inch 4K monitor", price=329.0, stock=10),
+    Product(sku="USB-C-1M", name="USB-C cable 1m", price=9.0, stock=200),
+    Product(sku="SSD-2TB", name="NVMe SSD 2TB", price=149.0, stock=25),
+]
+
+DEFAULT_COUPONS = {"SAVE10": 0.10, "HALF": 0.50}
+
+
+class StoreError(Exception):
+    pass
+
+
+class FakeStore:
+    """
+    One task's store: catalog, basket and coupon held in memory. Every call
+    sleeps `latency_ms` to stand in for the network round trip.
+    """
+
+    def __init__(
+            self,
+            products: Optional[List[Product]] = None,
+            coupons: Optional[Dict[str, float]] = None,
+            latency_ms: float = 0.0,
+    ):
+        self.products = {p.sku: p.model_copy() for p in (products or DEFAULT_PRODUCTS)}
+        self.coupons = dict(DEFAULT_COUPONS if coupons is None else coupons)
+        self.latency_ms = latency_ms
+        self.basket: Dict[str, int] = {}
+        self.coupon: Optional[str] = None
+        self.orders: List[dict] = []
+        self.calls: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def _call(self, method: str):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def _product(self, sku: str) -> Product:
+        product = self.products.get(sku)
+        if product is None:
+            raise StoreError(f"Unknown SKU: {sku}")
+        return product
+
+    def list_products(self, offset: int = 0, limit: int = 10) -> dict:
+        self._call("list_products")
+        products = list(self.products.values())
+        page = products[offset:offset + max(0, min(limit, 100))]
+        next_offset = offset + len(page)
+        return {
+            "products": [p.model_dump() for p in page],
+            "next_offset": next_offset if next_offset < len(products) else -1,
+        }
+
+    def view_basket(self) -> dict:
+        self._call("view_basket")
+        return self._basket()
+
+    def _basket(self) -> dict:
+        items = [
+            {"sku": sku, "quantity": quantity, "price": self.products[sku].price}
+            for sku, quantity in self.basket.items()
+        ]
+        subtotal = sum(item["price"] * item["quantity"] for item in items)
+        discount = round(subtotal * self.coupons.get(self.coupon, 0.0), 2)
+        return {
+            "items": items,
+            "subtotal": subtotal,
+            "coupon": self.coupon,
+            "discount": discount,
+            "total": subtotal - discount,
+        }
+
+    def add_product_to_basket(self, sku: str, quantity: int) -> dict:
+        self._call("add_product_to_basket")
+        product = self._product(sku)
+        if quantity <= 0:
+            raise StoreError("Quantity must be positive")
+        if self.basket.get(sku, 0) + quantity > product.stock:
+            raise StoreError(f"Only {product.stock} of {sku} in stock")
+        self.basket[sku] = self.basket.get(sku, 0) + quantity
+        return self._basket()
+
+    def remove_item_from_basket(self, sku: str, quantity: int = 0) -> dict:
+        self._call("remove_item_from_basket")
+        if sku not in self.basket:
+            raise StoreError(f"{sku} is not in the basket")
+        remaining = 0 if quantity <= 0 else self.basket[sku] - quantity
+        if remaining > 0:
+            self.basket[sku] = remaining
+        else:
+            del self.basket[sku]
+        return self._basket()
+
+    def apply_coupon(self, coupon: str) -> dict:
+        self._call("apply_coupon")
+        if coupon not in self.coupons:
+            raise StoreError(f"Invalid coupon: {coupon}")
+        self.coupon = coupon
+        return self._basket()
+
+    def remove_coupon(self) -> dict:
+        self._call("remove_coupon")
+        self.coupon = None
+        return self._basket()
+
+    def checkout_basket(self) -> dict:
+        self._call("checkout_basket")
+        if not self.basket:
+            raise StoreError("Basket is empty")
+        order = {"order_id": uuid.uuid4().hex[:8], **self._basket()}
+        for sku, quantity in self.basket.items():
+            self.products[sku].stock -= quantity
+        self.orders.append(order)
+        self.basket = {}
+        self.coupon = None
+        return order
+
+
+class FakeTask(BaseModel):
+    task_id: str
+    spec_id: str = "fake"
+    task_text: str
+
+
+class FakeCore:
+    """Enough of ERC3 for `run_session`: one FakeStore per task, log_llm counted."""
+
+    def __init__(self, store_latency_ms: float = 0.0):
+        self.store_latency_ms = store_latency_ms
+        self.stores: Dict[str, FakeStore] = {}
+        self.llm_logs = 0
+        self.lock = threading.Lock()
+
+    def start_task(self, task):
+        pass
+
+    def complete_task(self, task):
+        return None
+
+    def get_demo_client(self, task) -> FakeStore:
+        store = FakeStore(latency_ms=self.store_latency_ms)
+        with self.lock:
+            self.stores[task.task_id] = store
+        return store
+
+    def log_llm(self, **kwargs):
+        with self.lock:
+            self.llm_logs += 1
@@ -0,0 +1,116 @@
+"""
+Per-step overhead of the workflow graph itself.
+
+Runs plans of growing length through the compiled graph with an instant
+in-process LLM and a no-op tool, so the time measured is LangGraph, the state
+updates and the experts' own bookkeeping. Reports time per plan step, peak
+traced memory and the final number of messages.
+
+    python -m erc.bench.graph_overhead --steps 10 50 200
+"""
+import argparse
+import itertools
+import time
+import tracemalloc
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.tools import render_text_description, tool
+from langgraph.prebuilt import ToolNode
+
+from erc.experts.constraint import ConstraintExpert
+from erc.experts.executor import ExecutorExpert
+from erc.experts.planning import PlanningExpert
+from erc.experts.reflection import ReflectionExpert
+from erc.experts.schemas import ConstraintExpertOutput, ExecutionPlan, ExecutorExpertOutput, PlanStep
+from erc.experts.tool import ToolExpert
+from erc.workflow import workflow
+
+
+@tool
+def noop() -> str:
+    """Does nothing."""
+    return "OK"
+
+
+class InstantLLM:
+    """Answers every structured output and tool call immediately."""
+
+    def __init__(self, steps: int):
+        self.steps = steps
+        self.call_ids = itertools.count()
+
+    def with_structured_output(self, schema, **kwargs):
+        replies = {
+            ExecutionPlan: lambda: ExecutionPlan(steps=[
+                PlanStep(tool_name="noop", arguments={}, reasoning="r", summary="s") for _ in range(self.steps)
+            ]),
+            ConstraintExpertOutput: lambda: ConstraintExpertOutput(is_valid=True, review_feedback="OK"),
+            ExecutorExpertOutput: lambda: ExecutorExpertOutput(decision="tool"),
+        }
+        return RunnableLambda(lambda messages: replies[schema]())
+
+    def bind_tools(self, tools, **kwargs):
+        return RunnableLambda(lambda messages: AIMessage(
+            content="", tool_calls=[{"name": "noop", "args": {}, "id": f"call_{next(self.call_ids)}"}]
+        ))
+
+
+def build_app(steps: int, persona_path: str):
+    llm = InstantLLM(steps)
+    tools_desc = render_text_description([noop])
+
+    def callback(meta, started):
+        pass
+
+    kwargs = dict(persona_path=persona_path, tool_desc=tools_desc, llm=llm, callback=callback)
+    return workflow(
+        PlanningExpert(**kwargs),
+        ConstraintExpert(**kwargs),
+        ExecutorExpert(**kwargs),
+        ToolExpert(persona_path=persona_path, tools=[noop], llm=llm, callback=callback),
+        ToolNode([noop]),
+        ReflectionExpert(),
+    ).compile()
+
+
+def measure(steps: int, persona_path: str) -> dict:
+    app = build_app(steps, persona_path)
+    config = RunnableConfig(recursion_limit=4 * steps + 10)
+    state = {"input_task": "benchmark", "messages": [], "step_pointer": 0}
+
+    started = time.perf_counter()
+    result = app.invoke(state, config)
+    elapsed = time.perf_counter() - started
+
+    # separate run, tracing slows everything down
+    tracemalloc.start()
+    app.invoke(state, config)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "steps": result["step_pointer"],
+        "ms_per_step": elapsed * 1000 / steps,
+        "peak_mb": peak / 2 ** 20,
+        "messages": len(result["messages"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--persona-path", default="prompts/oss-20b-synthetic-persona")
+    args = parser.parse_args()
+
+    for steps in args.steps:
+        result = measure(steps, args.persona_path)
+        print(
+            f"steps={steps:4} done={result['steps']:4} "
+            f"per step={result['ms_per_step']:7.2f}ms "
+            f"peak={result['peak_mb']:7.1f}MB "
+            f"messages={result['messages']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
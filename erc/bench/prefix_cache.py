@@ -0,0 +1,81 @@
+"""
+Time-to-first-token with and without KV prefix reuse.
+
+Runs the planner's real message layout (persona + instructions + tool
+descriptions, then the task) against the local stub server, once with
+`cache_prompt` off and once on.
+
+    python -m erc.bench.prefix_cache --requests 20
+"""
+import argparse
+import statistics
+import time
+
+from erc.bench.stub_server import StubLLMServer
+from erc.experts.planning import PlanningExpert
+from erc.experts.schemas import ConstraintExpertOutput, ExecutionPlan, PlanStep
+from erc.llm import create_llm
+from erc.state import Plan
+from erc.store.tools import TOOLS_DESC
+
+TASKS = [
+    "Buy 2 GPU-4090 and apply coupon SAVE10",
+    "Find the cheapest laptop and add it to the basket",
+    "Remove all monitors from the basket and checkout",
+    "Count characters in word raspberry",
+    "Add three USB cables, view the basket and report the total",
+]
+
+
+def planner_states():
+    rejected = Plan(
+        plan=ExecutionPlan(steps=[PlanStep(tool_name="/basket/checkout", arguments={}, reasoning="", summary="")]),
+        is_validated=True,
+        validation_attempts=1,
+        review=ConstraintExpertOutput(is_valid=False, review_feedback="Checkout on an empty basket."),
+    )
+    for i, task in enumerate(TASKS):
+        yield {"input_task": task, "plan": None}
+        if i % 2:
+            yield {"input_task": task, "plan": rejected}
+
+
+def measure(base_url: str, persona_path: str, cache_prompt: bool, requests: int) -> list[float]:
+    llm = create_llm(base_url=base_url, cache_prompt=cache_prompt, slot_id=0 if cache_prompt else None)
+    planner = PlanningExpert(persona_path=persona_path, tool_desc=TOOLS_DESC, llm=llm, callback=None)
+    states = list(planner_states())
+    ttfts = []
+    for i in range(requests):
+        messages = planner._messages(states[i % len(states)])
+        started = time.perf_counter()
+        for _ in llm.stream(messages):
+            ttfts.append(time.perf_counter() - started)
+            break
+    return ttfts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--persona-path", default="prompts/oss-20b-synthetic-persona")
+    parser.add_argument("--prefill-ms-per-kchar", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with StubLLMServer(prefill_ms_per_kchar=args.prefill_ms_per_kchar) as server:
+        for cache_prompt in (False, True):
+            server.reset_cache()
+            ttfts = measure(server.base_url, args.persona_path, cache_prompt, args.requests)
+            # the first request always pays the full prefill
+            warm = ttfts[1:] or ttfts
+            print(
+                f"cache_prompt={str(cache_prompt):5} "
+                f"ttft first={ttfts[0] * 1000:7.1f}ms "
+                f"p50={statistics.median(warm) * 1000:7.1f}ms "
+                f"mean={statistics.mean(warm) * 1000:7.1f}ms"
+            )
+        stats = server.stats
+        print(f"prompt chars={stats['prompt_chars']} cached chars={stats['cached_chars']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Offline end-to-end benchmark of the workflow graph.
+
+Replays N store tasks through the full graph (planner, reviewer, executor, tool
+expert, tool node, reflection) with `run_session`. The LLM is the local stub
+server with scripted structured outputs and tool calls; the store is FakeStore
+behind STORE_TOOLS (plus CATALOG_TOOLS with `--catalog` and the batch tool with
+`--batch`). With `--sandbox` some tasks plan a `run_python` step, which the
+coding expert sends to the sandbox worker pool. Reports throughput, per-node
+latency and LLM calls per task.
+
+    python -m erc.bench.replay --tasks 40 --concurrency 8 --store-latency-ms 20
+"""
+import argparse
+import ast
+import asyncio
+import json
+import re
+import time
+from typing import Optional
+
+from langchain_core.tools import render_text_description
+from langgraph.prebuilt import ToolNode
+
+from erc.bench.fake_store import FakeCore, FakeTask
+from erc.bench.stub_server import ScriptedResponder, StubLLMServer, last_user_text
+from erc.experts.coding import CodingExpert
+from erc.experts.constraint import ConstraintExpert
+from erc.experts.decision import DecisionEngine
+from erc.experts.executor import ExecutorExpert
+from erc.experts.planning import PlanningExpert
+from erc.experts.reflection import ReflectionExpert
+from erc.experts.schemas import constrained_plan_schema
+from erc.experts.tool import ToolExpert
+from erc.experts.validator import PlanValidator
+from erc.metrics import MetricsRecorder
+from erc.router import ModelEndpoint, ModelRouter
+from erc.sandbox import PYTHON_TOOL, SandboxPool, python_tool
+from erc.session import arun_session, run_session
+from erc.store.batch import BATCH_TOOL, BATCH_TOOL_DESC
+from erc.store.catalog import CATALOG_TOOLS, CATALOG_TOOLS_DESC, prefetch_catalog
+from erc.store.memo import MemoizingClientFactory
+from erc.store.tools import STORE_TOOLS, STORE_TOOLS_DESC, TOOL_MODELS, tool_function_name
+from erc.workflow import workflow
+
+# task text -> planned (tool, arguments) steps
+SCENARIOS = {
+    "Buy 2 GPU-4090 and apply coupon SAVE10": [
+        ("products_list", {"offset": 0, "limit": 10}),
+        ("basket_add", {"sku": "GPU-4090", "quantity": 2}),
+        ("coupon_apply", {"coupon": "SAVE10"}),
+        ("basket_checkout", {}),
+        ("report_completion", {"final_message": "Bought 2 GPU-4090 with SAVE10."}),
+    ],
+    "Find the cheapest laptop and add it to the basket": [
+        ("products_list", {"offset": 0, "limit": 100}),
+        ("basket_add", {"sku": "LAPTOP-AIR", "quantity": 1}),
+        ("basket_view", {}),
+        ("report_completion", {"final_message": "Added LAPTOP-AIR to the basket."}),
+    ],
+    "Add three USB cables, view the basket and report the total": [
+        ("basket_add", {"sku": "USB-C-1M", "quantity": 3}),
+        ("basket_view", {}),
+        ("report_completion", {"final_message": "The total is 27.0."}),
+    ],
+    "Add an SSD and a monitor, drop the monitor again and checkout": [
+        ("basket_add", {"sku": "SSD-2TB", "quantity": 1}),
+        ("basket_add", {"sku": "MON-27", "quantity": 1}),
+        ("basket_remove", {"sku": "MON-27", "quantity": 0}),
+        ("basket_checkout", {}),
+        ("report_completion", {"final_message": "Bought one SSD-2TB."}),
+    ],
+    "Buy one each of GPU-4070, CPU-7950X, SSD-2TB, MON-27 and USB-C-1M": [
+        ("basket_add", {"sku": "GPU-4070", "quantity": 1}),
+        ("basket_add", {"sku": "CPU-7950X", "quantity": 1}),
+        ("basket_add", {"sku": "SSD-2TB", "quantity": 1}),
+        ("basket_add", {"sku": "MON-27", "quantity": 1}),
+        ("basket_add", {"sku": "USB-C-1M", "quantity": 1}),
+        ("basket_checkout", {}),
+        ("report_completion", {"final_message": "Bought the five items."}),
+    ],
+    "Check the GPU prices, add the cheaper GPU, check the prices again and checkout": [
+        ("products_list", {"offset": 0, "limit": 10}),
+        ("basket_add", {"sku": "GPU-4070", "quantity": 1}),
+        ("products_list", {"offset": 0, "limit": 10}),
+        ("basket_view", {}),
+        ("basket_view", {}),
+        ("basket_checkout", {}),
+        ("report_completion", {"final_message": "Bought GPU-4070."}),
+    ],
+}
+
+# with --sandbox, tasks answered by running code
+CODE_SCENARIOS = {
+    "Count characters in word raspberry": [
+        (PYTHON_TOOL, {"code": "len('raspberry')"}),
+        ("report_completion", {"final_message": "The word raspberry has 9 characters."}),
+    ],
+    "Count the letter r in strawberry": [
+        (PYTHON_TOOL, {"code": "print('strawberry'.count('r'))"}),
+        ("report_completion", {"final_message": "strawberry has 3 r."}),
+    ],
+}
+
+# with --catalog, the /products/list step of these tasks becomes one catalog search
+CATALOG_SEARCHES = {
+    "Buy 2 GPU-4090 and apply coupon SAVE10": {"query": "GPU-4090"},
+    "Find the cheapest laptop and add it to the basket": {"query": "laptop", "limit": 1},
+}
+
+TOOL_LINE = re.compile(r"TOOL:\s*(\S+)")
+ARGUMENTS_LINE = re.compile(r"PLANNED ARGUMENTS:\s*(.*)")
+
+
+# function name of a store tool -> its path, e.g. "basket_add" -> "/basket/add"
+STORE_PATHS = {tool_function_name(path): path for path in TOOL_MODELS}
+
+
+def batched(steps: list) -> list:
+    """Runs of consecutive store steps merged into one `batch` step each."""
+    merged = []
+    for name, arguments in steps:
+        if name in STORE_PATHS and name != "report_completion":
+            operation = {"tool": STORE_PATHS[name], **arguments}
+            if merged and merged[-1][0] == "batch":
+                merged[-1][1]["operations"].append(operation)
+            else:
+                merged.append(("batch", {"operations": [operation]}))
+        else:
+            merged.append((name, arguments))
+    return merged
+
+
+def scenario_steps(text: str, catalog: bool = False, batch: bool = False) -> list:
+    scenarios = {**SCENARIOS, **CODE_SCENARIOS}
+    task = next((task for task in scenarios if task in text), None)
+    if task is None:
+        return []
+    steps = scenarios[task]
+    if catalog and task in CATALOG_SEARCHES:
+        steps = [
+            ("catalog_search", CATALOG_SEARCHES[task]) if name == "products_list" else (name, arguments)
+            for name, arguments in steps
+        ]
+    return batched(steps) if batch else steps
+
+
+def scenario_plan(body: dict, catalog: bool = False, batch: bool = False) -> dict:
+    steps = scenario_steps(last_user_text(body), catalog, batch)
+    return {"content": json.dumps({"steps": [
+        {"tool_name": name, "arguments": arguments, "reasoning": f"Call {name}.", "summary": name}
+        for name, arguments in steps
+    ]})}
+
+
+def planned_tool_call(body: dict) -> dict:
+    """Tool call for the step the ToolExpert is asked to execute."""
+    text = last_user_text(body)
+    name = TOOL_LINE.search(text).group(1)
+    arguments = ast.literal_eval(ARGUMENTS_LINE.search(text).group(1).strip() or "{}")
+    return {"tool_calls": [{"name": name, "arguments": arguments or {}}]}
+
+
+def planned_code(body: dict) -> dict:
+    """The coding expert's reply: the step's planned code as a python block."""
+    arguments = ast.literal_eval(ARGUMENTS_LINE.search(last_user_text(body)).group(1).strip() or "{}")
+    return {"content": f"```python\n{(arguments or {}).get('code', '')}\n```"}
+
+
+def store_script(catalog: bool = False, batch: bool = False) -> dict:
+    def plan(body):
+        return scenario_plan(body, catalog, batch)
+
+    return {
+        "ExecutionPlan": plan,
+        "ConstrainedExecutionPlan": plan,
+        "ConstraintExpertOutput": {"content": json.dumps({"is_valid": True, "review_feedback": "OK"})},
+        "ExecutorExpertOutput": {"content": json.dumps({"decision": "tool"})},
+        "tool_calls": planned_tool_call,
+        "content": planned_code,
+    }
+
+
+def build_app(base_url: str, persona_path: str, metrics: MetricsRecorder, constrained: bool = False,
+              stream_plan: bool = False, catalog: bool = False, batch: bool = False, direct: bool = False,
+              checkpointer=None, router: Optional[ModelRouter] = None,
+              decisions: Optional[DecisionEngine] = None, sandbox: Optional[SandboxPool] = None):
+    """With `router` every expert gets the model routed to its node and `base_url` is unused."""
+    if router is None:
+        router = ModelRouter.single(ModelEndpoint(base_url=base_url))
+    tools, descriptions = list(STORE_TOOLS), [STORE_TOOLS_DESC]
+    if catalog:
+        tools += CATALOG_TOOLS
+        descriptions.append(CATALOG_TOOLS_DESC)
+    if batch:
+        tools.append(BATCH_TOOL)
+        descriptions.append(BATCH_TOOL_DESC)
+    coding = None
+    if sandbox is not None:
+        python = python_tool(sandbox)
+        tools.append(python)
+        descriptions.append(render_text_description([python]))
+        coding = CodingExpert(persona_path=persona_path, tool=python, llm=router.llm("coding"), callback=metrics)
+    tools_desc = "\n\n".join(descriptions)
+    validator = PlanValidator.for_tools(tools)
+    e = ExecutorExpert(
+        persona_path=persona_path,
+        tool_desc=tools_desc,
+        llm=router.llm("executor"),
+        callback=metrics,
+        fast_path=validator if direct else None,
+        decisions=decisions,
+    )
+    p = PlanningExpert(
+        persona_path=persona_path,
+        tool_desc=tools_desc,
+        llm=router.llm("planner"),
+        callback=metrics,
+        plan_schema=constrained_plan_schema(validator.registry) if constrained else None,
+        skip_review=constrained,
+        validator=validator,
+        on_step=e.prefetch if stream_plan else None,
+    )
+    c = ConstraintExpert(
+        persona_path=persona_path, tool_desc=tools_desc, llm=router.llm("reviewer"), callback=metrics,
+        validator=validator,
+    )
+    t = ToolExpert(persona_path=persona_path, tools=tools, llm=router.llm("tool"), callback=metrics)
+    # store errors come back as error ToolMessages, so reflection (and a direct retry) can see them
+    tool_node = ToolNode(tools, handle_tool_errors=True)
+    return workflow(p, c, e, t, tool_node, ReflectionExpert(), metrics=metrics,
+                    coding_expert=coding).compile(checkpointer=checkpointer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--use-async", action="store_true", help="drive the graph with arun_session")
+    parser.add_argument("--constrained", action="store_true")
+    parser.add_argument("--stream-plan", action="store_true")
+    parser.add_argument("--catalog", action="store_true", help="prefetch the catalog and search it instead of paging")
+    parser.add_argument("--batch", action="store_true", help="plan consecutive store calls as one batch call")
+    parser.add_argument("--direct", action="store_true", help="dispatch fully specified steps without the LLM")
+    parser.add_argument("--heuristic", action="store_true", help="decide tool/code without the LLM when sure")
+    parser.add_argument("--sandbox", action="store_true", help="add code tasks run in the sandbox worker pool")
+    parser.add_argument("--memoize", action="store_true", help="cache idempotent store reads per task")
+    parser.add_argument("--persona-path", default="prompts/oss-20b-synthetic-persona")
+    parser.add_argument("--decode-ms-per-token", type=float, default=1.0)
+    parser.add_argument("--prefill-ms-per-kchar", type=float, default=10.0)
+    parser.add_argument("--store-latency-ms", type=float, default=10.0)
+    parser.add_argument("--jsonl", help="write metrics events to this file")
+    parser.add_argument("--prometheus", help="write metrics in Prometheus text format to this file")
+    args = parser.parse_args()
+
+    responder = ScriptedResponder(store_script(args.catalog, args.batch))
+    core = FakeCore(store_latency_ms=args.store_latency_ms)
+    metrics = MetricsRecorder(core=core)
+    scenarios = list(SCENARIOS) + (list(CODE_SCENARIOS) if args.sandbox else [])
+    tasks = [
+        FakeTask(task_id=f"task-{i}", task_text=f"{scenarios[i % len(scenarios)]} (#{i})")
+        for i in range(args.tasks)
+    ]
+
+    # workers are forked before the graph starts its threads and warm by the time a code step comes
+    sandbox = SandboxPool().start() if args.sandbox else None
+    with StubLLMServer(
+            responder,
+            decode_ms_per_token=args.decode_ms_per_token,
+            prefill_ms_per_kchar=args.prefill_ms_per_kchar,
+            n_slots=args.concurrency,
+    ) as server:
+        decisions = DecisionEngine(tool.name for tool in STORE_TOOLS + CATALOG_TOOLS + [BATCH_TOOL]) \
+            if args.heuristic else None
+        app = build_app(server.base_url, args.persona_path, metrics, args.constrained, args.stream_plan,
+                        args.catalog, args.batch, args.direct, decisions=decisions, sandbox=sandbox)
+        catalog_factory = prefetch_catalog if args.catalog else None
+        client_factory = MemoizingClientFactory(core.get_demo_client) if args.memoize else None
+        started = time.perf_counter()
+        if args.use_async:
+            outcomes = asyncio.run(
+                arun_session(core, app, tasks, max_concurrency=args.concurrency, on_outcome=None,
+                             client_factory=client_factory, catalog_factory=catalog_factory)
+            )
+        else:
+            outcomes = run_session(core, app, tasks, max_workers=args.concurrency, on_outcome=None,
+                                   client_factory=client_factory, catalog_factory=catalog_factory)
+        elapsed = time.perf_counter() - started
+    if sandbox is not None:
+        sandbox.close()
+
+    errors = sum(1 for outcome in outcomes if outcome.error)
+    orders = sum(len(store.orders) for store in core.stores.values())
+    llm_calls = sum(responder.calls.values())
+    saved = sum(sum(task.saved_llm_calls.values()) for task in metrics.tasks.values())
+    print(f"tasks={len(tasks)} errors={errors} orders={orders} wall={elapsed:.2f}s "
+          f"throughput={len(tasks) / elapsed:.2f} tasks/s")
+    print(f"llm calls/task={llm_calls / len(tasks):.2f} saved/task={saved / len(tasks):.2f} "
+          + " ".join(f"{kind}={count / len(tasks):.2f}" for kind, count in sorted(responder.calls.items())))
+    print(metrics.summary())
+    if client_factory is not None:
+        print(client_factory.summary())
+    if decisions is not None:
+        print(f"executor decisions: {decisions.summary()}")
+    if sandbox is not None:
+        print(f"sandbox: {sandbox.summary()}")
+    if args.jsonl:
+        metrics.export_jsonl(args.jsonl)
+    if args.prometheus:
+        metrics.export_prometheus(args.prometheus)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Cost and latency per task with and without per-expert model routing.
+
+Replays the same store tasks twice through the full graph: once with every
+expert on the large model, once with the executor and reviewer on a small
+model that escalates to the large one below `--min-confidence`. Both models
+are local stub servers; the small one decodes and prefills faster and answers
+a share (`--uncertain`) of its decisions with low confidence. Cost is priced
+per model from the token counts.
+
+    python -m erc.bench.routing --tasks 40 --concurrency 8 --uncertain 0.1
+"""
+import argparse
+import time
+import zlib
+
+from erc.bench.fake_store import FakeCore, FakeTask
+from erc.bench.replay import SCENARIOS, build_app, store_script
+from erc.bench.stub_server import ScriptedResponder, StubLLMServer, last_user_text
+from erc.metrics import MetricsRecorder, percentile
+from erc.router import ExpertRoute, ModelEndpoint, ModelRouter
+from erc.session import run_session
+
+DECISIONS = ("ExecutorExpertOutput", "ConstraintExpertOutput")
+LOW_CONFIDENCE = 0.4
+
+
+def small_script(uncertain: float) -> dict:
+    """The replay script, with the decisions of a stable `uncertain` share of the requests at LOW_CONFIDENCE."""
+    script = store_script()
+
+    def unsure(reply):
+        def answer(body):
+            # the executor prompt repeats per step, so include the history length to vary within a task
+            key = f"{last_user_text(body)}|{len(body.get('messages', []))}"
+            confident = zlib.crc32(key.encode()) % 1000 >= uncertain * 1000
+            return {**reply, "confidence": 1.0 if confident else LOW_CONFIDENCE}
+
+        return answer
+
+    return {**script, **{kind: unsure(script[kind]) for kind in DECISIONS}}
+
+
+def run(router: ModelRouter, persona_path: str, tasks: list, concurrency: int, store_latency_ms: float) -> dict:
+    core = FakeCore(store_latency_ms=store_latency_ms)
+    metrics = MetricsRecorder(core=core)
+    app = build_app("", persona_path, metrics, router=router)
+    started = time.perf_counter()
+    outcomes = run_session(core, app, tasks, max_workers=concurrency, on_outcome=None)
+    elapsed = time.perf_counter() - started
+
+    calls, cost = {}, 0.0
+    for (_, model), totals in metrics.llm_totals.items():
+        calls[model] = calls.get(model, 0) + totals["calls"]
+        cost += router.cost(model, totals["input_tokens"], totals["output_tokens"])
+    walls = [task.wall_sec for task in metrics.tasks.values()]
+    return {
+        "errors": sum(1 for outcome in outcomes if outcome.error),
+        "throughput": len(tasks) / elapsed,
+        "p50": percentile(walls, 0.5),
+        "p95": percentile(walls, 0.95),
+        "calls": {model: count / len(tasks) for model, count in calls.items()},
+        "cost": cost / len(tasks),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--persona-path", default="prompts/oss-20b-synthetic-persona")
+    parser.add_argument("--store-latency-ms", type=float, default=10.0)
+    parser.add_argument("--uncertain", type=float, default=0.1, help="share of small-model decisions below 0.5")
+    parser.add_argument("--min-confidence", type=float, default=0.9)
+    parser.add_argument("--large-decode-ms-per-token", type=float, default=1.0)
+    parser.add_argument("--large-prefill-ms-per-kchar", type=float, default=10.0)
+    parser.add_argument("--small-decode-ms-per-token", type=float, default=0.25)
+    parser.add_argument("--small-prefill-ms-per-kchar", type=float, default=2.5)
+    parser.add_argument("--large-cost", type=float, nargs=2, default=(0.10, 0.50), metavar=("INPUT", "OUTPUT"),
+                        help="USD per 1M prompt and completion tokens")
+    parser.add_argument("--small-cost", type=float, nargs=2, default=(0.02, 0.10), metavar=("INPUT", "OUTPUT"))
+    args = parser.parse_args()
+
+    scenarios = list(SCENARIOS)
+    tasks = [
+        FakeTask(task_id=f"task-{i}", task_text=f"{scenarios[i % len(scenarios)]} (#{i})")
+        for i in range(args.tasks)
+    ]
+    large_server = StubLLMServer(
+        ScriptedResponder(store_script()),
+        decode_ms_per_token=args.large_decode_ms_per_token,
+        prefill_ms_per_kchar=args.large_prefill_ms_per_kchar,
+        n_slots=args.concurrency,
+    )
+    small_server = StubLLMServer(
+        ScriptedResponder(small_script(args.uncertain)),
+        decode_ms_per_token=args.small_decode_ms_per_token,
+        prefill_ms_per_kchar=args.small_prefill_ms_per_kchar,
+        n_slots=args.concurrency,
+    )
+    with large_server, small_server:
+        large = ModelEndpoint(model="oss-20b", base_url=large_server.base_url,
+                              input_cost=args.large_cost[0], output_cost=args.large_cost[1])
+        small = ModelEndpoint(model="small", base_url=small_server.base_url, max_tokens=256,
+                              input_cost=args.small_cost[0], output_cost=args.small_cost[1])
+        routed = ModelRouter(
+            {"large": large, "small": small},
+            default="large",
+            routes={
+                node: ExpertRoute(endpoint="small", escalate_to="large", min_confidence=args.min_confidence)
+                for node in ("executor", "reviewer")
+            },
+        )
+        results = {
+            "single model": run(ModelRouter.single(large), args.persona_path, tasks, args.concurrency,
+                                args.store_latency_ms),
+            "routed": run(routed, args.persona_path, tasks, args.concurrency, args.store_latency_ms),
+        }
+
+    print(f"{'setup':14} {'errors':>6} {'tasks/s':>7} {'p50 s':>7} {'p95 s':>7} {'$/1k tasks':>10}  llm calls/task")
+    for setup, result in results.items():
+        calls = " ".join(f"{model}={count:.2f}" for model, count in sorted(result["calls"].items()))
+        print(f"{setup:14} {result['errors']:6} {result['throughput']:7.2f} {result['p50']:7.3f} "
+              f"{result['p95']:7.3f} {result['cost'] * 1000:10.4f}  {calls}")
+    print(routed.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Plan-to-first-action latency with and without a streamed plan.
+
+Runs the planner and then the executor for every plan step against the local
+stub server. With `--stream` off the executor starts after the whole plan is
+decoded; with it on, each finished step is handed to `ExecutorExpert.prefetch`
+while the planner is still generating the rest.
+
+    python -m erc.bench.streaming_plan --tasks 10
+"""
+import argparse
+import json
+import statistics
+import time
+
+from erc.bench.constrained import VALID_PLAN
+from erc.bench.stub_server import StubLLMServer
+from erc.experts.executor import ExecutorExpert
+from erc.experts.planning import PlanningExpert
+from erc.experts.validator import PlanValidator
+from erc.llm import create_llm
+from erc.store.tools import TOOLS_DESC
+
+
+def responder(body: dict) -> dict:
+    schema_name = body.get("response_format", {}).get("json_schema", {}).get("name")
+    if schema_name == "ExecutorExpertOutput":
+        return {"content": json.dumps({"decision": "tool"})}
+    return {"content": json.dumps(VALID_PLAN)}
+
+
+def measure(base_url: str, persona_path: str, stream: bool, tasks: int) -> tuple[list[float], list[float]]:
+    llm = create_llm(base_url=base_url)
+
+    def callback(meta, started):
+        pass
+
+    executor = ExecutorExpert(persona_path=persona_path, tool_desc=TOOLS_DESC, llm=llm, callback=callback)
+    planner = PlanningExpert(
+        persona_path=persona_path,
+        tool_desc=TOOLS_DESC,
+        llm=llm,
+        callback=callback,
+        validator=PlanValidator.for_store(),
+        on_step=executor.prefetch if stream else None,
+    )
+
+    first_action, all_decisions = [], []
+    for i in range(tasks):
+        state = {"input_task": f"Buy 2 GPU-4090 and checkout (#{i})", "messages": [], "step_pointer": 0, "plan": None}
+        started = time.perf_counter()
+        state = {**state, **planner.node(state)}
+        for pointer in range(len(state["plan"].plan.steps)):
+            executor.node({**state, "step_pointer": pointer})
+            if pointer == 0:
+                first_action.append(time.perf_counter() - started)
+        all_decisions.append(time.perf_counter() - started)
+    return first_action, all_decisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=10)
+    parser.add_argument("--persona-path", default="prompts/oss-20b-synthetic-persona")
+    parser.add_argument("--decode-ms-per-token", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with StubLLMServer(responder, decode_ms_per_token=args.decode_ms_per_token) as server:
+        for stream in (False, True):
+            first_action, all_decisions = measure(server.base_url, args.persona_path, stream, args.tasks)
+            print(
+                f"stream={str(stream):5} "
+                f"first action p50={statistics.median(first_action) * 1000:7.1f}ms "
+                f"all decisions p50={statistics.median(all_decisions) * 1000:7.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
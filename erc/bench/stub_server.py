@@ -0,0 +1,278 @@
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+
+def default_responder(body: dict) -> dict:
+    return {"content": "OK"}
+
+
+def schema_name(body: dict) -> Optional[str]:
+    """Name of the requested structured output, e.g. "ExecutionPlan"."""
+    return ((body.get("response_format") or {}).get("json_schema") or {}).get("name")
+
+
+def last_user_text(body: dict) -> str:
+    for message in reversed(body.get("messages", [])):
+        if message.get("role") == "user":
+            content = message.get("content") or ""
+            if isinstance(content, list):
+                content = "".join(c.get("text", "") for c in content if isinstance(c, dict))
+            return content
+    return ""
+
+
+class ScriptedResponder:
+    """
+    Responder keyed by request kind: the structured output name (`ExecutionPlan`,
+    `ConstraintExpertOutput`, ...), "tool_calls" when tools are offered, and
+    "content" otherwise. `script` maps a kind to a reply or to a callable
+    `(body) -> reply`; `delays` adds extra latency in seconds per kind on top of
+    the server's simulated prefill/decode. Requests are counted per kind.
+    """
+
+    def __init__(self, script: dict, delays: Optional[dict] = None):
+        self.script = script
+        self.delays = delays or {}
+        self.calls: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, body: dict) -> dict:
+        kind = schema_name(body) or ("tool_calls" if body.get("tools") else "content")
+        with self.lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+        reply = self.script.get(kind, default_responder)
+        if callable(reply):
+            reply = reply(body)
+        reply = dict(reply)
+        reply.setdefault("delay", self.delays.get(kind, 0.0))
+        return reply
+
+
+def render_prompt(body: dict) -> str:
+    """
+    Flattens a chat completion request the way a chat template would: tool and
+    response schemas first, then every message in order.
+    """
+    parts = []
+    if body.get("tools"):
+        parts.append(json.dumps(body["tools"], sort_keys=True))
+    if body.get("response_format"):
+        parts.append(json.dumps(body["response_format"], sort_keys=True))
+    for message in body.get("messages", []):
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = "".join(c.get("text", "") for c in content if isinstance(c, dict))
+        parts.append(f"<|{message.get('role')}|>{content}")
+        if message.get("tool_calls"):
+            parts.append(json.dumps(message["tool_calls"], sort_keys=True))
+    return "\n".join(parts)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class StubLLMServer:
+    """
+    Local OpenAI-compatible /v1/chat/completions server for offline benchmarks.
+
+    Latency is simulated: `base_latency_ms` per request, `prefill_ms_per_kchar`
+    for every prompt character not covered by a cached prefix, and
+    `decode_ms_per_token` per generated token. Requests carrying
+    `cache_prompt: true` (llama.cpp) reuse the longest common prefix held by
+    one of `n_slots` slots; `always_cache=True` mimics vLLM automatic prefix
+    caching. `responder(body)` returns {"content": str} or
+    {"tool_calls": [{"name": str, "arguments": dict}]}; requests with
+    `logprobs` get every content token at the reply's "confidence" (default 1.0).
+    """
+
+    def __init__(
+            self,
+            responder: Callable[[dict], dict] = default_responder,
+            base_latency_ms: float = 5.0,
+            prefill_ms_per_kchar: float = 10.0,
+            decode_ms_per_token: float = 1.0,
+            n_slots: int = 4,
+            always_cache: bool = False,
+            host: str = "127.0.0.1",
+            port: int = 0,
+    ):
+        self.responder = responder
+        self.base_latency_ms = base_latency_ms
+        self.prefill_ms_per_kchar = prefill_ms_per_kchar
+        self.decode_ms_per_token = decode_ms_per_token
+        self.always_cache = always_cache
+        self.slots: list[str] = [""] * n_slots
+        self.slot_used = [0.0] * n_slots
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "prompt_chars": 0, "cached_chars": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubLLMServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_cache(self):
+        with self.lock:
+            self.slots = [""] * len(self.slots)
+            self.slot_used = [0.0] * len(self.slots)
+
+    def _cached_prefix(self, body: dict, prompt: str) -> int:
+        use_cache = self.always_cache or body.get("cache_prompt")
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["prompt_chars"] += len(prompt)
+            if not use_cache:
+                return 0
+            slot_id = body.get("id_slot")
+            if slot_id is None or not 0 <= slot_id < len(self.slots):
+                # best prefix match, falling back to the least recently used slot
+                prefixes = [len(os.path.commonprefix([s, prompt])) for s in self.slots]
+                best = max(range(len(self.slots)), key=lambda i: (prefixes[i], -self.slot_used[i]))
+                slot_id = best if prefixes[best] else min(range(len(self.slots)), key=self.slot_used.__getitem__)
+            cached = len(os.path.commonprefix([self.slots[slot_id], prompt]))
+            self.slots[slot_id] = prompt
+            self.slot_used[slot_id] = time.monotonic()
+            self.stats["cached_chars"] += cached
+            return cached
+
+    def _prefill_delay(self, body: dict, prompt: str) -> tuple[float, int]:
+        cached = self._cached_prefix(body, prompt)
+        delay = self.base_latency_ms + (len(prompt) - cached) / 1000 * self.prefill_ms_per_kchar
+        return delay / 1000, cached
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._send_json({"object": "list", "data": [{"id": "stub", "object": "model"}]})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                stub.handle_completion(self, body)
+
+            def _send_json(self, payload: dict, status: int = 200):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def handle_completion(self, handler, body: dict):
+        prompt = render_prompt(body)
+        prefill, cached = self._prefill_delay(body, prompt)
+        reply = self.responder(body) or {}
+        content = reply.get("content")
+        tool_calls = [
+            {
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}))},
+            }
+            for call in reply.get("tool_calls", [])
+        ]
+        generated = (content or "") + "".join(c["function"]["arguments"] for c in tool_calls)
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": estimate_tokens(generated),
+            "total_tokens": estimate_tokens(prompt) + estimate_tokens(generated),
+            "prompt_tokens_details": {"cached_tokens": cached // 4},
+        }
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        decode = usage["completion_tokens"] * self.decode_ms_per_token / 1000
+        model = body.get("model", "stub")
+
+        time.sleep(reply.get("delay", 0.0) + prefill)
+        if not body.get("stream"):
+            time.sleep(decode)
+            message = {"role": "assistant", "content": content}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            choice = {"index": 0, "message": message, "finish_reason": finish_reason}
+            if body.get("logprobs") and content:
+                logprob = math.log(max(reply.get("confidence", 1.0), 1e-9))
+                choice["logprobs"] = {"content": [
+                    {"token": content[i:i + 4], "logprob": logprob, "bytes": None, "top_logprobs": []}
+                    for i in range(0, len(content), 4)
+                ]}
+            handler._send_json({
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [choice],
+                "usage": usage,
+            })
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        def send(delta: dict, finish: Optional[str] = None, chunk_usage: Optional[dict] = None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}] if delta is not None else [],
+            }
+            if chunk_usage:
+                chunk["usage"] = chunk_usage
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            handler.wfile.flush()
+
+        try:
+            pieces = [content[i:i + 16] for i in range(0, len(content or ""), 16)] or [""]
+            per_piece = decode / len(pieces)
+            send({"role": "assistant", "content": pieces[0]})
+            for piece in pieces[1:]:
+                time.sleep(per_piece)
+                send({"content": piece})
+            for i, call in enumerate(tool_calls):
+                send({"tool_calls": [{"index": i, **call}]})
+            send({}, finish_reason)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                send(None, chunk_usage=usage)
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.wfile.flush()
+            handler.close_connection = True
+        except (BrokenPipeError, ConnectionResetError):
+            # client stopped reading, e.g. after the first token
+            handler.close_connection = True
@@ -0,0 +1,288 @@
+"""
+Persistent, resumable sessions.
+
+`CompactSqliteSaver` is the LangGraph checkpointer: one thread per task, so a
+crashed task resumes from its last completed node. `SessionJournal` records
+which tasks of a session were started and completed, so a rerun skips the
+finished ones. Both live in the same SQLite file.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from erc.experts.schemas import ConstraintExpertOutput, ExecutionPlan, PlanStep
+from erc.state import ExecutionTool, Plan
+
+# our models kept in the graph state; msgpack loads no other types besides LangChain's own (messages)
+STATE_MODELS = (Plan, ExecutionTool, ExecutionPlan, PlanStep, ConstraintExpertOutput)
+EMPTY_CHANNEL = "empty"  # blob type of a channel version without a value
+LIST_CHANNEL = "list"  # blob type of a list value stored item by item; the blob is its length
+
+
+def connect(path: str) -> sqlite3.Connection:
+    # graph threads share the connection; the saver and the journal serialize access with their locks
+    return sqlite3.connect(path, check_same_thread=False)
+
+
+class CompactSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver that stores every channel value once per version instead of
+    the full state in every checkpoint: a super-step that only moves
+    `step_pointer` does not serialize `messages` again. List values (the
+    append-only `messages`) are stored item by item, so a step that adds a
+    message serializes just that message. Older checkpoints of a thread are
+    pruned as new ones arrive (the graph only ever resumes from the latest),
+    with their writes and the blobs no longer referenced. Values go through
+    msgpack, not pickle, with `STATE_MODELS` as the allowlist of our types.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, keep_history: bool = False, **kwargs):
+        kwargs.setdefault("serde", JsonPlusSerializer(allowed_msgpack_modules=STATE_MODELS))
+        super().__init__(conn, **kwargs)
+        self.keep_history = keep_history
+        # (thread_id, checkpoint_ns, channel) -> ids of the list items already stored, in order
+        self.stored_items: Dict[tuple, List[int]] = {}
+
+    @classmethod
+    def from_path(cls, path: str, **kwargs) -> "CompactSqliteSaver":
+        return cls(connect(path), **kwargs)
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                channel TEXT NOT NULL,
+                version TEXT NOT NULL,
+                type TEXT NOT NULL,
+                blob BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+            );
+            CREATE TABLE IF NOT EXISTS items (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                channel TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                item BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, channel, idx)
+            );
+            """
+        )
+
+    def put(
+            self,
+            config: RunnableConfig,
+            checkpoint: Checkpoint,
+            metadata: CheckpointMetadata,
+            new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        values = checkpoint["channel_values"]
+        with self.cursor() as cur:
+            for channel, version in new_versions.items():
+                if channel not in values:
+                    blob = (EMPTY_CHANNEL, None)
+                elif isinstance(values[channel], list):
+                    blob = self._put_items(cur, (thread_id, checkpoint_ns, channel), values[channel])
+                else:
+                    blob = self.serde.dumps_typed(values[channel])
+                cur.execute(
+                    "INSERT OR REPLACE INTO blobs (thread_id, checkpoint_ns, channel, version, type, blob) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, channel, str(version), *blob),
+                )
+        saved = super().put(config, {**checkpoint, "channel_values": {}}, metadata, new_versions)
+        if not self.keep_history:
+            self._prune(thread_id, checkpoint_ns, checkpoint)
+        return saved
+
+    def _put_items(self, cur, key: tuple, value: list) -> tuple:
+        """Stores the items not stored yet; a list that is not an extension of the stored one is rewritten."""
+        stored = self.stored_items.get(key, [])
+        appended = len(stored) <= len(value) and all(id(item) == i for item, i in zip(value, stored))
+        start = len(stored) if appended else 0
+        if not appended:
+            cur.execute("DELETE FROM items WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ?", key)
+        cur.executemany(
+            "INSERT OR REPLACE INTO items (thread_id, checkpoint_ns, channel, idx, type, item) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(*key, idx, *self.serde.dumps_typed(value[idx])) for idx in range(start, len(value))],
+        )
+        self.stored_items[key] = [id(item) for item in value]
+        return LIST_CHANNEL, str(len(value)).encode()
+
+    def _prune(self, thread_id: str, checkpoint_ns: str, checkpoint: Checkpoint):
+        with self.cursor() as cur:
+            thread = (thread_id, checkpoint_ns, checkpoint["id"])
+            cur.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?", thread
+            )
+            cur.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?", thread)
+            cur.executemany(
+                "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version != ?",
+                [
+                    (thread_id, checkpoint_ns, channel, str(version))
+                    for channel, version in checkpoint["channel_versions"].items()
+                ],
+            )
+
+    def _with_values(self, saved: Optional[CheckpointTuple]) -> Optional[CheckpointTuple]:
+        if saved is None:
+            return None
+        configurable = saved.config["configurable"]
+        versions = saved.checkpoint["channel_versions"]
+        values = {}
+        with self.cursor(transaction=False) as cur:
+            for channel, version in versions.items():
+                cur.execute(
+                    "SELECT type, blob FROM blobs "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                    (str(configurable["thread_id"]), configurable.get("checkpoint_ns", ""), channel, str(version)),
+                )
+                row = cur.fetchone()
+                if row is None or row[0] == EMPTY_CHANNEL:
+                    continue
+                if row[0] == LIST_CHANNEL:
+                    cur.execute(
+                        "SELECT type, item FROM items "
+                        "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND idx < ? ORDER BY idx",
+                        (str(configurable["thread_id"]), configurable.get("checkpoint_ns", ""), channel, int(row[1])),
+                    )
+                    values[channel] = [self.serde.loads_typed(item) for item in cur.fetchall()]
+                else:
+                    values[channel] = self.serde.loads_typed(row)
+        return saved._replace(checkpoint={**saved.checkpoint, "channel_values": values})
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self._with_values(super().get_tuple(config))
+
+    def list(self, config: Optional[RunnableConfig], **kwargs) -> Iterator[CheckpointTuple]:
+        for saved in list(super().list(config, **kwargs)):
+            yield self._with_values(saved)
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM blobs WHERE thread_id = ?", (str(thread_id),))
+            cur.execute("DELETE FROM items WHERE thread_id = ?", (str(thread_id),))
+        for key in [key for key in self.stored_items if key[0] == str(thread_id)]:
+            del self.stored_items[key]
+
+    # sqlite3 is blocking; under ainvoke the calls run in a worker thread
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], **kwargs) -> AsyncIterator[CheckpointTuple]:
+        for saved in await asyncio.to_thread(lambda: list(self.list(config, **kwargs))):
+            yield saved
+
+    async def aput(
+            self,
+            config: RunnableConfig,
+            checkpoint: Checkpoint,
+            metadata: CheckpointMetadata,
+            new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+            self,
+            config: RunnableConfig,
+            writes: Sequence[tuple[str, Any]],
+            task_id: str,
+            task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+class SessionJournal:
+    """
+    Task ledger of a session, keyed by task_id: "started" once ERC3 knows about
+    the task, "failed" after a crash that left it open for a rerun, "done" once
+    it was completed with ERC3. A task that failed `max_attempts` times is
+    completed anyway, so a broken task cannot hold the session open. Small
+    session-level values (the ERC3 session id) are kept next to the tasks.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 2):
+        self.conn = connect(path)
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.executescript(
+                """
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                """
+            )
+
+    def value(self, key: str) -> Optional[str]:
+        """Session-level setting, e.g. the ERC3 session id to resume."""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_value(self, key: str, value: Optional[str]):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def status(self, task_id: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT status FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return row[0] if row else None
+
+    def start(self, task_id: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO tasks (task_id, status, updated) VALUES (?, 'started', ?) "
+                "ON CONFLICT(task_id) DO UPDATE SET status = 'started', updated = excluded.updated",
+                (task_id, time.time()),
+            )
+
+    def fail(self, task_id: str, error: str) -> int:
+        """Records a crash; returns how many times the task has failed."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE tasks SET status = 'failed', attempts = attempts + 1, error = ?, updated = ? "
+                "WHERE task_id = ?",
+                (error, time.time(), task_id),
+            )
+            return self.conn.execute("SELECT attempts FROM tasks WHERE task_id = ?", (task_id,)).fetchone()[0]
+
+    def finish(self, task_id: str, error: Optional[str] = None):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE tasks SET status = 'done', error = ?, updated = ? WHERE task_id = ?",
+                (error, time.time(), task_id),
+            )
+
+    def counts(self) -> dict:
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
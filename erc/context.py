@@ -0,0 +1,150 @@
+import json
+import logging
+import threading
+from typing import List, Optional
+
+import tiktoken
+from langchain_core.messages import BaseMessage, ToolMessage
+
+DEFAULT_ENCODING = "o200k_base"
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators of the chat template
+TRUNCATION_MARK = "[...]"
+
+
+def tool_exchanges(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """
+    Groups the tool loop history into exchanges: an AI message followed by the
+    ToolMessages answering its tool calls. Exchanges are kept or dropped whole,
+    since a ToolMessage without its tool call is rejected by the API.
+    """
+    groups = []
+    for message in messages:
+        if isinstance(message, ToolMessage) and groups:
+            groups[-1].append(message)
+        else:
+            groups.append([message])
+    return groups
+
+
+def shrink_json(value, max_items: int, max_string: int = 80):
+    if isinstance(value, list):
+        head = [shrink_json(item, max_items, max_string) for item in value[:max_items]]
+        if len(value) > max_items:
+            head.append(f"... {len(value) - max_items} more")
+        return head
+    if isinstance(value, dict):
+        return {key: shrink_json(item, max_items, max_string) for key, item in value.items()}
+    if isinstance(value, str) and len(value) > max_string:
+        return value[:max_string] + TRUNCATION_MARK
+    return value
+
+
+def summarize_tool_content(content: str, max_chars: int, max_items: int = 3) -> str:
+    """
+    Compact form of a tool result: JSON lists cut to their first `max_items`
+    entries with a count of the rest (a 100-item product page becomes three
+    products and "... 97 more"), then a hard cut at `max_chars`.
+    """
+    try:
+        compact = json.dumps(shrink_json(json.loads(content), max_items), separators=(",", ":"))
+    except (TypeError, ValueError):
+        compact = content
+    if len(compact) > max_chars:
+        compact = compact[:max_chars] + TRUNCATION_MARK
+    return compact
+
+
+class ToolContextWindow:
+    """
+    Bounded history for the tool loop. The last `keep_last` exchanges are sent
+    verbatim, older tool results are collapsed with `summarize_tool_content`,
+    and the whole prompt is held under `token_budget` tokens: the oldest
+    exchanges are dropped first, then the tool results of the newest one are
+    truncated.
+    """
+
+    def __init__(
+            self,
+            keep_last: int = 2,
+            token_budget: int = 12000,
+            summary_chars: int = 400,
+            summary_items: int = 3,
+            encoding_name: str = DEFAULT_ENCODING,
+    ):
+        self.keep_last = keep_last
+        self.token_budget = token_budget
+        self.summary_chars = summary_chars
+        self.summary_items = summary_items
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._encoding_loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        if not self._encoding_loaded:
+            with self._lock:
+                if not self._encoding_loaded:
+                    try:
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        # the BPE file is downloaded on first use; estimate instead of failing the step
+                        logging.warning(f"tiktoken encoding {self.encoding_name} unavailable ({e}), estimating")
+                    self._encoding_loaded = True
+        return self._encoding
+
+    def count_text(self, text: str) -> int:
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate_text(self, text: str, tokens: int) -> str:
+        if self.count_text(text) <= tokens:
+            return text
+        keep = max(0, tokens - self.count_text(TRUNCATION_MARK))
+        if self.encoding is None:
+            return text[:keep * 4] + TRUNCATION_MARK
+        return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:keep]) + TRUNCATION_MARK
+
+    def count(self, message: BaseMessage) -> int:
+        text = message.content if isinstance(message.content, str) else json.dumps(message.content)
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            text += json.dumps([{"name": c["name"], "args": c["args"]} for c in tool_calls])
+        return self.count_text(text) + MESSAGE_OVERHEAD_TOKENS
+
+    def _collapse(self, message: BaseMessage) -> BaseMessage:
+        if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+            return message
+        if len(message.content) <= self.summary_chars:
+            return message
+        summary = summarize_tool_content(message.content, self.summary_chars, self.summary_items)
+        return message.model_copy(update={"content": summary})
+
+    def _truncate_tools(self, group: List[BaseMessage], budget: int) -> List[BaseMessage]:
+        tools = {id(m) for m in group if isinstance(m, ToolMessage) and isinstance(m.content, str)}
+        fixed = sum(self.count(m) for m in group if id(m) not in tools)
+        per_tool = (budget - fixed) // max(1, len(tools)) - MESSAGE_OVERHEAD_TOKENS
+        return [
+            m.model_copy(update={"content": self.truncate_text(m.content, per_tool)}) if id(m) in tools else m
+            for m in group
+        ]
+
+    def fit(self, system: BaseMessage, history: List[BaseMessage], request: Optional[BaseMessage]) -> list:
+        """`[system] + windowed history + [request]` within the token budget."""
+        groups = tool_exchanges(history)
+        split = max(0, len(groups) - self.keep_last)
+        groups = [[self._collapse(m) for m in group] for group in groups[:split]] + groups[split:]
+
+        budget = self.token_budget - self.count(system) - (self.count(request) if request else 0)
+        sizes = [sum(self.count(m) for m in group) for group in groups]
+        while len(groups) > 1 and sum(sizes) > budget:
+            groups.pop(0)
+            sizes.pop(0)
+        if groups and sum(sizes) > budget:
+            groups[-1] = self._truncate_tools(groups[-1], budget)
+
+        window = [system] + [m for group in groups for m in group]
+        if len(window) - 1 < len(history):
+            logging.info(f"TOOL CONTEXT: {len(history)} messages -> {len(window) - 1} within {self.token_budget} tokens")
+        return window + ([request] if request else [])
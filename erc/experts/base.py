@@ -1,3 +1,6 @@
+from langchain_core.messages import SystemMessage
+from langchain_core.runnables import RunnableLambda
+
 from erc.state import AgentState
 
 
@@ -5,3 +8,29 @@ class BaseExpert(object):
 
     def node(self, state: AgentState):
         raise NotImplementedError()
+
+    async def anode(self, state: AgentState):
+        # experts without LLM calls are cheap enough to run inline on the event loop
+        return self.node(state)
+
+    def system_message(self, instructions: str) -> SystemMessage:
+        """
+        Static prompt prefix: persona, fixed instructions and tool descriptions.
+        It is byte-identical across calls (the same object until the persona file
+        changes), so the server can reuse its KV cache. Anything task specific
+        belongs in the messages after it.
+        """
+        persona = self.persona_provider.get_primary_persona()
+        cached = getattr(self, "_system_message", None)
+        if cached is None or cached[0] is not persona or cached[1] != instructions:
+            content = f"{persona}\n\n{instructions}\n\nAvailable Tools:\n{self.tools_desc}"
+            cached = (persona, instructions, SystemMessage(content=content))
+            self._system_message = cached
+        return cached[2]
+
+    def runnable(self) -> RunnableLambda:
+        """
+        Graph node that dispatches to `node` under invoke/stream and to `anode`
+        under ainvoke/astream.
+        """
+        return RunnableLambda(self.node, afunc=self.anode, name=type(self).__name__)
@@ -0,0 +1,94 @@
+import logging
+import re
+import time
+import uuid
+from typing import Optional
+
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import BaseTool, render_text_description
+from langchain_openai import ChatOpenAI
+
+from erc.context import ToolContextWindow
+from erc.experts.base import BaseExpert
+from erc.persona import PersonaProvider
+from erc.state import AgentState
+
+CODING_INSTRUCTIONS = (
+    "Write Python code that carries out the current step of the task. It runs in a sandbox: standard library "
+    "only, no network or processes, files only in the working directory, and a few seconds of CPU time. Print "
+    "the answer or end with an expression whose value is the answer."
+)
+CODE_BLOCK = re.compile(r"```(?:python|py)?[^\n]*\n(.*?)```", re.S)
+
+
+def extract_code(text: str) -> str:
+    """The first fenced code block of a reply, or the whole reply when it has none."""
+    match = CODE_BLOCK.search(text or "")
+    return (match.group(1) if match else text or "").strip()
+
+
+class CodingExpert(BaseExpert):
+    """
+    Handles steps the executor decided as "code": the LLM writes a snippet
+    (the coding_expert persona answers with a ```python block) and the expert
+    turns it into a call of the sandbox tool, so the tool node runs it and the
+    output comes back as a ToolMessage like any other tool result.
+    """
+
+    def __init__(self, persona_path, tool: BaseTool, llm: ChatOpenAI, callback, compact_persona: bool = False,
+                 context_window: Optional[ToolContextWindow] = None):
+        self.persona_provider = PersonaProvider("coding_expert", persona_path, compact=compact_persona)
+        self.tool_name = tool.name
+        self.tools_desc = render_text_description([tool])
+        self.llm = llm
+        self.callback = callback
+        self.context_window = context_window or ToolContextWindow()
+
+    def _messages(self, state: AgentState) -> Optional[list]:
+        executor = state.get('executor')
+        if not executor:
+            logging.info("CodingExpert: No steps left.")
+            return None
+
+        step = executor.step
+        user_text = (
+            f"TASK: {state['input_task']}\n"
+            f"STEP: {step.summary or step.tool_name}\n"
+            f"PLANNED ARGUMENTS: {step.arguments}\n"
+            f"REASONING: {step.reasoning}"
+        )
+        # earlier tool results are the snippet's inputs
+        return self.context_window.fit(
+            self.system_message(CODING_INSTRUCTIONS), state.get('messages', []), HumanMessage(content=user_text)
+        )
+
+    def _tool_call(self, response) -> AIMessage:
+        code = extract_code(response.content)
+        logging.info(f"CODING EXPERT CODE:\n{code}")
+        tool_call = {"name": self.tool_name, "args": {"code": code}, "id": f"call_code_{uuid.uuid4().hex[:12]}"}
+        return AIMessage(content="", tool_calls=[tool_call])
+
+    def node(self, state: AgentState):
+        logging.info("CodingExpert Started")
+        messages = self._messages(state)
+        if messages is None:
+            return {}
+
+        started = time.time()
+        usage_meta_data = UsageMetadataCallbackHandler()
+        response = self.llm.invoke(messages, config={"callbacks": [usage_meta_data]})
+        self.callback(usage_meta_data, started)
+        return {"messages": [self._tool_call(response)]}
+
+    async def anode(self, state: AgentState):
+        logging.info("CodingExpert Started")
+        messages = self._messages(state)
+        if messages is None:
+            return {}
+
+        started = time.time()
+        usage_meta_data = UsageMetadataCallbackHandler()
+        response = await self.llm.ainvoke(messages, config={"callbacks": [usage_meta_data]})
+        self.callback(usage_meta_data, started)
+        return {"messages": [self._tool_call(response)]}
@@ -2,107 +2,134 @@ import json
 import logging
 import sys
 import time
+from typing import Optional
 
 import yaml
 from langchain_core.callbacks import UsageMetadataCallbackHandler
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage
 from langchain_openai import ChatOpenAI
 
 from erc.experts.base import BaseExpert
 from erc.experts.schemas import ConstraintExpertOutput, PlanStep
+from erc.experts.validator import PlanValidator
 from erc.persona import PersonaProvider
+from erc.plan_cache import PlanCache
 from erc.state import AgentState, ExecutionPlan, Plan
 from erc.store.tools import TOOLS_DESC
 
+REVIEWER_INSTRUCTIONS = (
+    "You are an expert reviewer that checks whether the proposed execution plan meets all constraints "
+    "for the given task."
+)
+
 
 class ConstraintExpert(BaseExpert):
 
-    def __init__(self, persona_path, tool_desc: str, llm: ChatOpenAI, callback):
-        self.persona_provider = PersonaProvider("constraint_expert", persona_path)
+    def __init__(self, persona_path, tool_desc: str, llm: ChatOpenAI, callback, compact_persona: bool = False,
+                 plan_cache: Optional[PlanCache] = None, validator: Optional[PlanValidator] = None):
+        self.persona_provider = PersonaProvider("constraint_expert", persona_path, compact=compact_persona)
         self.tools_desc = tool_desc
         self.llm = llm.with_structured_output(ConstraintExpertOutput)
         self.callback = callback
+        self.plan_cache = plan_cache
+        self.validator = validator
+
+    def _auto_reject(self, state: AgentState, plan: Plan):
+        attempts = (plan.validation_attempts if plan else 0) + 1
+        logging.warning("No plan found, auto-rejecting.")
+        new_plan = Plan(
+            plan=ExecutionPlan(steps=[]),
+            is_validated=True,
+            validation_attempts=attempts,
+            review=ConstraintExpertOutput(
+                is_valid=False,
+                review_feedback="Auto-rejected (no plan found). Please generate a plan."
+            )
+        )
+        return {"plan": new_plan}
+
+    def _messages(self, state: AgentState, plan: Plan) -> list:
+        plan_str = json.dumps(plan.model_dump(), indent=2)
+
+        user_text = f"TASK: {state['input_task']}\n\nPLAN:\n{plan_str}"
+        return [self.system_message(REVIEWER_INSTRUCTIONS), HumanMessage(content=user_text)]
+
+    def _review_state(self, state: AgentState, plan: Plan, response) -> dict:
+        logging.info(f"REVIEWER RESPONSE: {response}")
+        if response is None:
+            response = ConstraintExpertOutput(
+                is_valid=False,
+                review_feedback="Auto-rejected (no response from reviewer). Please generate a plan."
+            )
+
+        if not response.is_valid:
+            logging.warning(f"Plan Rejected: {response.review_feedback}")
+        elif self.plan_cache is not None:
+            self.plan_cache.put(state['input_task'], plan.plan)
+        return {"plan": self._reviewed(plan, response)}
+
+    @staticmethod
+    def _reviewed(plan: Plan, review: ConstraintExpertOutput) -> Plan:
+        # shallow, unvalidated copy: the ExecutionPlan itself is shared, not copied
+        return plan.model_copy(update={
+            "review": review,
+            "is_validated": True,
+            "validation_attempts": plan.validation_attempts + 1,
+        })
+
+    def _crash_state(self, state: AgentState, plan: Plan, e: Exception) -> dict:
+        logging.error(f"Reviewer Logic Crash ({e}). Allowing plan to proceed.")
+        review = ConstraintExpertOutput(
+            is_valid=False,
+            review_feedback=f"Auto-rejected due to error crash. {e}"
+        )
+        return {"plan": self._reviewed(plan, review)}
 
     def node(self, state: AgentState):
         logging.info("REVIEWER Checking...")
 
         plan = state.get("plan", None)
         if not plan or not plan.plan.steps:
-            attempts = plan.validation_attempts + 1
-            logging.warning("No plan found, auto-rejecting.")
-            new_plan = Plan(
-                plan=ExecutionPlan(steps=[]),
-                is_validated=True,
-                validation_attempts=attempts,
-                review=ConstraintExpertOutput(
-                    is_valid=False,
-                    review_feedback="Auto-rejected (no plan found). Please generate a plan."
-                )
-            )
-            return state.copy(
-                plan=new_plan,
-            )
-
-        plan_str = json.dumps(plan.model_dump(), indent=2)
+            return self._auto_reject(state, plan)
 
-        system_text = self.persona_provider.get_primary_persona()
+        if self.validator is not None:
+            rejection = self.validator.review(plan.plan)
+            if rejection is not None:
+                return self._review_state(state, plan, rejection)
 
-        user_text = f"""
-            You are an expert reviewer that checks whether the proposed execution plan meets all constraints for the given task.
-            Available Tools: {self.tools_desc}
-            PLAN:\n{plan_str}
-            Task: {state['input_task']}
-        """
+        messages = self._messages(state, plan)
         try:
             started = time.time()
-            messages = [SystemMessage(content=system_text), HumanMessage(content=user_text)]
             usage_meta_data = UsageMetadataCallbackHandler()
-
             response = self.llm.invoke(messages, config={"callbacks": [usage_meta_data]})
-            logging.info(f"REVIEWER RESPONSE: {response}")
             if self.callback:
                 self.callback(usage_meta_data, started)
+            return self._review_state(state, plan, response)
+        except Exception as e:
+            return self._crash_state(state, plan, e)
 
-            state_copy = state.copy()
-
-            plan_copy = plan.model_copy()
-            if response is None:
-                plan_copy.review = ConstraintExpertOutput(
-                    is_valid=False,
-                    review_feedback="Auto-rejected (no response from reviewer). Please generate a plan."
-                )
-                plan_copy.is_validated = True
-                plan_copy.validation_attempts += 1
-
-            if response.is_valid:
-                plan_copy.review = response
-                plan_copy.is_validated = True
-                plan_copy.validation_attempts += 1
+    async def anode(self, state: AgentState):
+        logging.info("REVIEWER Checking...")
 
-            else:
-                logging.warning(f"Plan Rejected: {response.review_feedback}")
-                plan_copy.review = response
-                plan_copy.is_validated = True
-                plan_copy.validation_attempts += 1
+        plan = state.get("plan", None)
+        if not plan or not plan.plan.steps:
+            return self._auto_reject(state, plan)
 
-            state_copy["plan"] = plan_copy
-            return state_copy
+        if self.validator is not None:
+            rejection = self.validator.review(plan.plan)
+            if rejection is not None:
+                return self._review_state(state, plan, rejection)
 
+        messages = self._messages(state, plan)
+        try:
+            started = time.time()
+            usage_meta_data = UsageMetadataCallbackHandler()
+            response = await self.llm.ainvoke(messages, config={"callbacks": [usage_meta_data]})
+            if self.callback:
+                self.callback(usage_meta_data, started)
+            return self._review_state(state, plan, response)
         except Exception as e:
-            logging.error(f"Reviewer Logic Crash ({e}). Allowing plan to proceed.")
-
-            state_copy = state.copy()
-            plan_copy = plan.model_copy()
-
-            plan_copy.review = ConstraintExpertOutput(
-                is_valid=False,
-                review_feedback=f"Auto-rejected due to error crash. {e}"
-            )
-            plan_copy.is_validated = True
-            plan_copy.validation_attempts += 1
-            state_copy["plan"] = plan_copy
-            return state_copy
-
+            return self._crash_state(state, plan, e)
 
 if __name__ == "__main__":
     def meta_callback(meta, started):
@@ -134,6 +161,7 @@ if __name__ == "__main__":
         llm=llm,
         tool_desc=TOOLS_DESC,
         callback=meta_callback,
+        validator=PlanValidator.for_store(),
     )
     print("""---- GENERATE PLAN ----""")
     state = AgentState(
@@ -0,0 +1,159 @@
+"""
+Executor decisions without the LLM.
+
+The executor only picks "tool" or "code" for the current plan step, and most
+steps name a registered tool, which settles it. `DecisionEngine` answers in
+order from:
+
+1. rules: a step for the sandbox tool (`code_tools`) is "code", a step whose
+   `tool_name` is another registered tool is "tool";
+2. a small naive Bayes classifier over the words of the step (tool name,
+   reasoning, summary), trusted only above `min_probability`;
+3. otherwise None, and the executor asks the LLM. Its answer is fed back to
+   the classifier, so the fallbacks become rarer within a session.
+"""
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from erc.experts.schemas import PlanStep
+from erc.sandbox import PYTHON_TOOL
+from erc.store.tools import TOOL_TO_METHOD
+
+DECISIONS = ("tool", "code")
+DEFAULT_MIN_PROBABILITY = 0.9
+LOG_EVERY = 50  # decisions between fallback-rate log lines
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# phrases of plan steps per decision; the classifier starts from these and learns from the LLM's answers
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    ("list products in the store catalog", "tool"),
+    ("find the product sku and price", "tool"),
+    ("view the basket contents", "tool"),
+    ("add the item to the basket", "tool"),
+    ("add product quantity to cart", "tool"),
+    ("remove item from basket", "tool"),
+    ("apply the coupon code discount", "tool"),
+    ("remove the coupon", "tool"),
+    ("checkout the basket and place the order", "tool"),
+    ("report completion with the final message", "tool"),
+    ("call the api to fetch the secret", "tool"),
+    ("submit the answer", "tool"),
+    ("count the characters in the word", "code"),
+    ("count letters vowels or occurrences in a string", "code"),
+    ("calculate the sum total of the numbers", "code"),
+    ("compute the arithmetic result", "code"),
+    ("reverse the string", "code"),
+    ("sort the list alphabetically", "code"),
+    ("convert and format the number", "code"),
+    ("run python code to evaluate the expression", "code"),
+    ("write a script to parse the text", "code"),
+    ("calculate average minimum maximum", "code"),
+]
+
+
+def step_text(step: PlanStep) -> str:
+    return " ".join(str(part) for part in (step.tool_name, step.reasoning, step.summary) if part)
+
+
+def words(text: str) -> List[str]:
+    return WORD_PATTERN.findall(text.lower())
+
+
+class NaiveBayesClassifier:
+    """Multinomial naive Bayes over words with add-one smoothing; `learn` updates it online."""
+
+    def __init__(self, labels: Iterable[str] = DECISIONS, examples: Iterable[Tuple[str, str]] = ()):
+        self.word_counts: Dict[str, Counter] = {label: Counter() for label in labels}
+        self.doc_counts: Counter = Counter()
+        self.vocabulary = set()
+        for text, label in examples:
+            self.learn(text, label)
+
+    def learn(self, text: str, label: str):
+        tokens = words(text)
+        self.word_counts[label].update(tokens)
+        self.doc_counts[label] += 1
+        self.vocabulary.update(tokens)
+
+    def probabilities(self, text: str) -> Dict[str, float]:
+        tokens = [t for t in words(text) if t in self.vocabulary]
+        total_docs = sum(self.doc_counts.values())
+        scores = {}
+        for label, counts in self.word_counts.items():
+            denominator = sum(counts.values()) + len(self.vocabulary)
+            scores[label] = math.log((self.doc_counts[label] + 1) / (total_docs + len(self.word_counts))) + sum(
+                math.log((counts[t] + 1) / denominator) for t in tokens
+            )
+        top = max(scores.values())
+        exp = {label: math.exp(score - top) for label, score in scores.items()}
+        norm = sum(exp.values())
+        return {label: value / norm for label, value in exp.items()}
+
+
+class DecisionEngine:
+    """
+    Decides "tool" or "code" for a plan step when the rule or the classifier
+    is sure, and counts how each decision was made. Shared by the graph's
+    worker threads.
+    """
+
+    def __init__(self, tool_names: Optional[Iterable[str]] = None,
+                 min_probability: float = DEFAULT_MIN_PROBABILITY,
+                 examples: Iterable[Tuple[str, str]] = SEED_EXAMPLES, code_tools: Iterable[str] = (PYTHON_TOOL,)):
+        self.tool_names = set(TOOL_TO_METHOD if tool_names is None else tool_names)
+        self.code_tools = set(code_tools)
+        self.min_probability = min_probability
+        self.classifier = NaiveBayesClassifier(DECISIONS, examples)
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def _count(self, source: str):
+        with self.lock:
+            self.stats[source] += 1
+            decided = sum(self.stats.values())
+            if decided % LOG_EVERY == 0:
+                logging.info(f"EXECUTOR DECISIONS: {self.summary()}")
+
+    def decide(self, step: PlanStep, count: bool = True) -> Optional[str]:
+        """The decision for `step`, or None when the LLM should decide. `count=False` only peeks."""
+        if step.tool_name in self.code_tools:
+            if count:
+                self._count("rule")
+            return "code"
+        if step.tool_name in self.tool_names:
+            if count:
+                self._count("rule")
+            return "tool"
+        text = step_text(step)
+        with self.lock:
+            probabilities = self.classifier.probabilities(text)
+        decision, probability = max(probabilities.items(), key=lambda item: item[1])
+        if probability >= self.min_probability:
+            if count:
+                self._count("classifier")
+            return decision
+        if count:
+            logging.info(f"EXECUTOR DECISION FALLBACK: {step.tool_name!r} ({decision} at {probability:.2f})")
+            self._count("llm")
+        return None
+
+    def learn(self, step: PlanStep, decision: str):
+        """Teaches the classifier the LLM's decision for a step it could not decide."""
+        if decision in DECISIONS:
+            with self.lock:
+                self.classifier.learn(step_text(step), decision)
+
+    def fallback_rate(self) -> float:
+        with self.lock:
+            total = sum(self.stats.values())
+            return self.stats["llm"] / total if total else 0.0
+
+    def summary(self) -> str:
+        total = sum(self.stats.values())
+        counts = ", ".join(f"{source} {self.stats[source]}" for source in ("rule", "classifier", "llm"))
+        return f"{counts}; LLM fallback {self.stats['llm'] / total if total else 0.0:.1%} of {total}"
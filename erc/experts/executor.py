@@ -1,62 +1,179 @@
+import asyncio
+import contextvars
 import logging
 import sys
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
 
 import yaml
 from langchain_core.callbacks import UsageMetadataCallbackHandler
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage
 from langchain_openai import ChatOpenAI
 
 from erc.experts.base import BaseExpert
+from erc.experts.decision import DecisionEngine
 from erc.experts.schemas import ExecutorExpertOutput, ExecutionPlan, PlanStep
+from erc.experts.validator import PlanValidator
+from erc.metrics import CURRENT_NODE
 from erc.persona import PersonaProvider
 from erc.state import AgentState, ExecutionTool, Plan
 from erc.store.tools import TOOLS_DESC
 
+EXECUTOR_INSTRUCTIONS = (
+    "You are an expert executor that decides the next action to take in order to complete the given task.\n"
+    "You can write code, use tools, or decide that nothing more is needed."
+)
+PREFETCH_WORKERS = 4
+PREFETCH_LIMIT = 256  # pending decisions kept per executor; the oldest are dropped first
+
 
 class ExecutorExpert(BaseExpert):
-    def __init__(self, persona_path, tool_desc: str, llm: ChatOpenAI, callback):
-        self.persona_provider = PersonaProvider("execution_expert", persona_path)
+    def __init__(self, persona_path, tool_desc: str, llm: ChatOpenAI, callback, compact_persona: bool = False,
+                 fast_path: Optional[PlanValidator] = None, decisions: Optional[DecisionEngine] = None):
+        """
+        With `fast_path`, steps it finds fully specified are decided as "tool"
+        without an LLM call and marked `direct`, so the ToolExpert dispatches
+        them as planned too. A direct call that fails is retried through the LLM.
+        With `decisions`, the LLM is only asked for the steps the engine cannot
+        decide, and its answers train the engine.
+        """
+        self.fast_path = fast_path
+        self.decisions = decisions
+        self.persona_provider = PersonaProvider("execution_expert", persona_path, compact=compact_persona)
         self.tools_desc = tool_desc
         self.llm = llm.with_structured_output(ExecutorExpertOutput)
         self.callback = callback
+        self.prefetched: OrderedDict[tuple, Future] = OrderedDict()
+        self.prefetch_pool: Optional[ThreadPoolExecutor] = None
+        self.prefetch_lock = threading.Lock()
+
+    def _messages(self, state, step: PlanStep) -> list:
+        user_text = f"TASK: {state['input_task']}\nCURRENT STEP: {step.model_dump_json(exclude_none=True)}"
+        return [self.system_message(EXECUTOR_INSTRUCTIONS), HumanMessage(content=user_text)]
+
+    def _decide(self, messages: list) -> ExecutorExpertOutput:
+        started = time.time()
+        usage_meta_data = UsageMetadataCallbackHandler()
+        response = self.llm.invoke(messages, config={"callbacks": [usage_meta_data]})
+        self.callback(usage_meta_data, started)
+        return response
+
+    @staticmethod
+    def _prefetch_key(state, index: int, step: PlanStep) -> tuple:
+        return state['input_task'], index, step.model_dump_json()
+
+    def _direct(self, state, index: int, step: PlanStep) -> bool:
+        if self.fast_path is None:
+            return False
+        previous = state.get('executor')
+        if previous is not None and previous.direct and previous.status == 'ERROR' and previous.step == step:
+            # the planned call failed; let the LLM look at the error
+            return False
+        return self.fast_path.is_fully_specified(step, index)
+
+    def prefetch(self, state, index: int, step: PlanStep):
+        """
+        Starts the decision for `step` in the background, e.g. while the planner is
+        still streaming later steps. `node` picks it up when it reaches the same
+        step of the same task; a plan that changes on review simply misses.
+        """
+        if self._direct(state, index, step) or (self.decisions and self.decisions.decide(step, count=False)):
+            return
+        key = self._prefetch_key(state, index, step)
+        with self.prefetch_lock:
+            if key in self.prefetched:
+                return
+            if self.prefetch_pool is None:
+                self.prefetch_pool = ThreadPoolExecutor(PREFETCH_WORKERS, thread_name_prefix="executor-prefetch")
+            # keep the task for metrics, but book the call to the executor rather than the planner
+            context = contextvars.copy_context()
+            context.run(CURRENT_NODE.set, "executor")
+            self.prefetched[key] = self.prefetch_pool.submit(context.run, self._decide, self._messages(state, step))
+            while len(self.prefetched) > PREFETCH_LIMIT:
+                self.prefetched.popitem(last=False)[1].cancel()
+
+    def _take_prefetched(self, state, index: int, step: PlanStep) -> Optional[Future]:
+        with self.prefetch_lock:
+            future = self.prefetched.pop(self._prefetch_key(state, index, step), None)
+        if future is not None:
+            logging.info(f"EXECUTOR PREFETCH HIT: step {index + 1}")
+        return future
+
+    def _decision_state(self, state, step: PlanStep, response):
+        logging.info(f"EXECUTOR RESPONSE: {response}")
+        execution_decision: ExecutorExpertOutput = response
+        if self.decisions is not None:
+            self.decisions.learn(step, execution_decision.decision)
+
+        return {'executor': ExecutionTool(step=step, tool=execution_decision.decision)}
 
     def node(self, state):
         logging.info("Executor DECIDING...")
-        system_text = self.persona_provider.get_primary_persona()
-        user_text = f"""
-            You are an expert executor that decides the next action to take in order to complete the given task.
-            You can write code, use tools, or decide that nothing more is needed.
-            Available Tools: {self.tools_desc}
-            Task: {state['input_task']}
-        """
         plan = state.get('plan', None)
         pointer = state.get('step_pointer', None)
         if not plan:
             logging.error("No plan found in state.")
-            return state
+            return {}
 
         exec_plan = plan.plan
         step = exec_plan.steps[pointer]
-        
-        started = time.time()
-        messages = [SystemMessage(content=system_text), HumanMessage(content=user_text)]
-        usage_meta_data = UsageMetadataCallbackHandler()
 
-        response = self.llm.invoke(messages, config={"callbacks": [usage_meta_data]})
+        if self._direct(state, pointer, step):
+            logging.info(f"EXECUTOR DIRECT: step {pointer + 1} ({step.tool_name}) is fully specified")
+            return {'executor': ExecutionTool(step=step, tool='tool', direct=True)}
 
-        logging.info(f"EXECUTOR RESPONSE: {response}")
-        self.callback(usage_meta_data, started)
+        decision = self.decisions.decide(step) if self.decisions is not None else None
+        if decision is not None:
+            logging.info(f"EXECUTOR HEURISTIC: step {pointer + 1} ({step.tool_name}) -> {decision}")
+            return {'executor': ExecutionTool(step=step, tool=decision, heuristic=True)}
 
-        execution_decision: ExecutorExpertOutput = response
+        future = self._take_prefetched(state, pointer, step)
+        if future is not None:
+            try:
+                return self._decision_state(state, step, future.result())
+            except Exception as e:
+                logging.warning(f"EXECUTOR PREFETCH FAILED: {e}")
+
+        return self._decision_state(state, step, self._decide(self._messages(state, step)))
+
+    async def anode(self, state):
+        logging.info("Executor DECIDING...")
+        plan = state.get('plan', None)
+        pointer = state.get('step_pointer', None)
+        if not plan:
+            logging.error("No plan found in state.")
+            return {}
+
+        exec_plan = plan.plan
+        step = exec_plan.steps[pointer]
+
+        if self._direct(state, pointer, step):
+            logging.info(f"EXECUTOR DIRECT: step {pointer + 1} ({step.tool_name}) is fully specified")
+            return {'executor': ExecutionTool(step=step, tool='tool', direct=True)}
 
+        decision = self.decisions.decide(step) if self.decisions is not None else None
+        if decision is not None:
+            logging.info(f"EXECUTOR HEURISTIC: step {pointer + 1} ({step.tool_name}) -> {decision}")
+            return {'executor': ExecutionTool(step=step, tool=decision, heuristic=True)}
 
-        state_copy = state.copy()
-        tool = ExecutionTool(step=step, tool=execution_decision.decision, status='')
-        state_copy['executor'] = tool
+        future = self._take_prefetched(state, pointer, step)
+        if future is not None:
+            try:
+                return self._decision_state(state, step, await asyncio.wrap_future(future))
+            except Exception as e:
+                logging.warning(f"EXECUTOR PREFETCH FAILED: {e}")
 
-        return state_copy
+        started = time.time()
+        messages = self._messages(state, step)
+        usage_meta_data = UsageMetadataCallbackHandler()
+
+        response = await self.llm.ainvoke(messages, config={"callbacks": [usage_meta_data]})
+        self.callback(usage_meta_data, started)
 
+        return self._decision_state(state, step, response)
 
 if __name__ == "__main__":
     def meta_callback(meta, started):
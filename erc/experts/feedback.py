@@ -6,8 +6,8 @@ from erc.persona import PersonaProvider
 
 class FeedbackExpert(BaseExpert):
 
-    def __init__(self, persona_path, tool_desc: str, llm: ChatOpenAI, callback):
-        self.persona_provider = PersonaProvider("feedback_expert", persona_path)
+    def __init__(self, persona_path, tool_desc: str, llm: ChatOpenAI, callback, compact_persona: bool = False):
+        self.persona_provider = PersonaProvider("feedback_expert", persona_path, compact=compact_persona)
         self.tools_desc = tool_desc
         # self.llm = llm.with_structured_output(ConstraintExpertOutput)
         self.callback = callback
@@ -1,89 +1,240 @@
+import json
 import logging
 import sys
 import time
+from typing import Callable, List, Optional, Type
 
 import yaml
 from langchain_core.callbacks import UsageMetadataCallbackHandler
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage
+from langchain_core.utils.json import parse_partial_json
 from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
 
 from erc.experts.base import BaseExpert
 from erc.experts.schemas import ExecutionPlan, PlanStep, ConstraintExpertOutput
+from erc.experts.validator import PlanValidator
+from erc.llm import json_schema_format
 from erc.persona import PersonaProvider
+from erc.plan_cache import PlanCache
 from erc.state import AgentState, Plan
 from erc.store.tools import TOOLS_DESC
 
+PLANNER_INSTRUCTIONS = "Generate a detailed multi-step execution plan to complete the user's task using the tools provided."
+
+# Called with (planner input state, step index, step) for every finished step of a streamed plan.
+StepCallback = Callable[[AgentState, int, PlanStep], None]
+
+
+class PlanStepStream:
+    """
+    Incremental parse of a streamed plan. `feed` takes the next content chunk and
+    returns the steps it completed; a step is complete once the next one has
+    started, the last one when the stream ends (`close`).
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.steps: List[PlanStep] = []
+        self.dispatching = True
+
+    def feed(self, chunk: str) -> List[PlanStep]:
+        self.text += chunk
+        if not self.dispatching or "}" not in chunk:
+            return []
+        try:
+            partial = parse_partial_json(self.text)
+        except ValueError:
+            return []
+        steps = partial.get("steps") if isinstance(partial, dict) else None
+        return self._take((steps or [])[:-1])
+
+    def close(self) -> List[PlanStep]:
+        return self._take(json.loads(self.text).get("steps") or [])
+
+    def _take(self, steps: list) -> List[PlanStep]:
+        new = [PlanStep.model_validate(step) for step in steps[len(self.steps):]]
+        self.steps.extend(new)
+        return new
+
 
 class PlanningExpert(BaseExpert):
 
-    def __init__(self, persona_path, tool_desc: str, llm: ChatOpenAI, callback):
-        self.persona_provider = PersonaProvider("planning_expert", persona_path)
+    def __init__(self, persona_path, tool_desc: str, llm: ChatOpenAI, callback, compact_persona: bool = False,
+                 plan_cache: Optional[PlanCache] = None, plan_schema: Optional[Type[BaseModel]] = None,
+                 skip_review: bool = False, validator: Optional[PlanValidator] = None,
+                 on_step: Optional[StepCallback] = None):
+        """
+        `plan_schema` (see `constrained_plan_schema`) switches to grammar-constrained
+        decoding: the schema goes to the server as a json_schema response format,
+        which llama.cpp/vLLM compile into a sampling grammar. With `skip_review`
+        such plans go straight to the executor once `validator` finds no errors,
+        and into `plan_cache` as the reviewer would have put them.
+
+        With `on_step` the plan is streamed and every step is passed to it as soon
+        as it is generated, provided the plan up to that step passes `validator`.
+        """
+        self.persona_provider = PersonaProvider("planning_expert", persona_path, compact=compact_persona)
         self.tools_desc = tool_desc
-        self.llm = llm.with_structured_output(ExecutionPlan)
+        if plan_schema is not None:
+            self.llm = llm.with_structured_output(plan_schema, method="json_schema", strict=True)
+        else:
+            self.llm = llm.with_structured_output(ExecutionPlan)
         self.callback = callback
+        self.plan_cache = plan_cache
+        self.skip_review = skip_review
+        self.validator = validator
+        self.on_step = on_step
+        self.plan_schema = plan_schema or ExecutionPlan
+        self.stream_llm = None
+        if on_step is not None:
+            self.stream_llm = llm.bind(
+                response_format=json_schema_format(self.plan_schema, strict=True if plan_schema else None),
+                stream_usage=True,
+            )
 
-    def node(self, state: AgentState):
-        logging.info(f"Planner node started.")
+    def _cached_plan_state(self, state: AgentState) -> Optional[dict]:
+        """
+        A cache hit on the first attempt skips the planner call, and an exact hit
+        the reviewer call too. A near hit is another task's plan, possibly with
+        its SKU or quantity, so the reviewer still checks it against this task.
+        """
+        if self.plan_cache is None or state.get("plan", None):
+            return None
+        hit = self.plan_cache.lookup(state['input_task'])
+        if hit is None:
+            return None
+        cached, exact = hit
+        if not exact:
+            return {"plan": Plan(plan=cached, from_cache=True)}
+        return {"plan": Plan(
+            plan=cached,
+            is_validated=True,
+            review=ConstraintExpertOutput(is_valid=True, review_feedback="Reviewed plan served from plan cache."),
+            from_cache=True,
+        )}
 
+    def _messages(self, state: AgentState) -> list:
         plan = state.get("plan", None)
-        # 1. note main persona is taken from generation
-        system_text = self.persona_provider.get_primary_persona()
-        # 2. secondary persona is takes from generation
+        # 1. note main persona is taken from generation; it leads the static prefix
+        system_msg = self.system_message(PLANNER_INSTRUCTIONS)
+        # 2. per-task content goes last so the prefix stays cacheable
         if not plan:
-            user_text = f"""
-                Generate a detailed multi-step execution plan to complete the user's task using the tools provided.
-                Available Tools:
-                {self.tools_desc}
-                
-                TASK: {state['input_task']}
-            """
+            user_text = f"TASK: {state['input_task']}"
         else:
-            user_text = f"""
-                The previous execution plan attempt was invalid.
-                Please generate a revised and improved multi-step execution plan to complete the user's task using the tools provided.
-                Available Tools:
-                {self.tools_desc}
-                
-                TASK: {state['input_task']}
-                
-                PREVIOUS PLAN:
-                {plan.plan}
-                
-                REVIEW COMMENTS:
-                {plan.review}
-            """
-
-        messages = [SystemMessage(content=system_text), HumanMessage(content=user_text)]
-        state_copy = state.copy()
+            user_text = (
+                f"TASK: {state['input_task']}\n\n"
+                "The previous execution plan attempt was invalid.\n"
+                "Please generate a revised and improved multi-step execution plan to complete the user's task "
+                "using the tools provided.\n\n"
+                f"PREVIOUS PLAN:\n{plan.plan}\n\n"
+                f"REVIEW COMMENTS:\n{plan.review}"
+            )
 
-        try:
-            started = time.time()
-            usage_meta_data = UsageMetadataCallbackHandler()
-            response = self.llm.invoke(messages, config={"callbacks": [usage_meta_data]})
-            logging.info(f"PLANNER RESPONSE: {response}")
-            self.callback(usage_meta_data, started)
+        return [system_msg, HumanMessage(content=user_text)]
 
+    def _plan_state(self, state: AgentState, response) -> dict:
+        logging.info(f"PLANNER RESPONSE: {response}")
+        if isinstance(response, ExecutionPlan):
             execution_candidate: ExecutionPlan = response
+        else:
+            execution_candidate = ExecutionPlan.model_validate(response.model_dump())
 
-            logging.info(f"STRATEGIC PLAN:")
-            for i, step in enumerate(execution_candidate.steps):
-                logging.info(f"     {i + 1}. {step.tool_name} (Args: {str(step.arguments)[:40]}...)")
-                logging.info(f"       Why: {step.reasoning}")
-            logging.info("-" * 30)
+        logging.info(f"STRATEGIC PLAN:")
+        for i, step in enumerate(execution_candidate.steps):
+            logging.info(f"     {i + 1}. {step.tool_name} (Args: {str(step.arguments)[:40]}...)")
+            logging.info(f"       Why: {step.reasoning}")
+        logging.info("-" * 30)
 
-            plan = Plan(
+        # attempts carry over replans, so the reviewer's attempt limit can trigger
+        previous = state.get("plan", None)
+        attempts = previous.validation_attempts if previous else 0
+        if self.skip_review and not (self.validator and self.validator.validate(execution_candidate)):
+            # approved without the reviewer, which is where plans are cached otherwise
+            if self.plan_cache is not None:
+                self.plan_cache.put(state['input_task'], execution_candidate)
+            return {"plan": Plan(
                 plan=execution_candidate,
-                is_validated=False,
-                validation_attempts=0,
-                review=None,
-            )
-            state_copy["plan"] = plan
-            return state_copy
+                is_validated=True,
+                validation_attempts=attempts,
+                review=ConstraintExpertOutput(is_valid=True, review_feedback="Constrained decoding, review skipped."),
+            )}
+
+        return {"plan": Plan(plan=execution_candidate, validation_attempts=attempts)}
+
+    def _dispatch(self, state: AgentState, stream: PlanStepStream, new_steps: List[PlanStep]):
+        first = len(stream.steps) - len(new_steps)
+        for index in range(first, len(stream.steps)):
+            if not stream.dispatching:
+                return
+            if self.validator and self.validator.validate(ExecutionPlan(steps=stream.steps[:index + 1])):
+                # later steps depend on this one, so nothing after it is dispatched either
+                logging.info(f"STREAMED STEP {index + 1} FAILED VALIDATION. Dispatch stopped.")
+                stream.dispatching = False
+                return
+            logging.info(f"STREAMED STEP {index + 1}: {stream.steps[index].tool_name}")
+            self.on_step(state, index, stream.steps[index])
+
+    def _streamed_plan(self, stream: PlanStepStream) -> ExecutionPlan:
+        # validate against the requested schema, but keep the very steps handed to on_step
+        self.plan_schema.model_validate_json(stream.text)
+        return ExecutionPlan(steps=stream.steps)
+
+    def _stream_plan(self, state: AgentState, messages: list, config: dict):
+        stream = PlanStepStream()
+        for chunk in self.stream_llm.stream(messages, config=config):
+            self._dispatch(state, stream, stream.feed(chunk.content))
+        self._dispatch(state, stream, stream.close())
+        return self._streamed_plan(stream)
+
+    async def _astream_plan(self, state: AgentState, messages: list, config: dict):
+        stream = PlanStepStream()
+        async for chunk in self.stream_llm.astream(messages, config=config):
+            self._dispatch(state, stream, stream.feed(chunk.content))
+        self._dispatch(state, stream, stream.close())
+        return self._streamed_plan(stream)
+
+    def node(self, state: AgentState):
+        logging.info(f"Planner node started.")
+        cached_state = self._cached_plan_state(state)
+        if cached_state is not None:
+            return cached_state
+        messages = self._messages(state)
+
+        try:
+            started = time.time()
+            usage_meta_data = UsageMetadataCallbackHandler()
+            config = {"callbacks": [usage_meta_data]}
+            if self.on_step is not None:
+                response = self._stream_plan(state, messages, config)
+            else:
+                response = self.llm.invoke(messages, config=config)
+            self.callback(usage_meta_data, started)
+            return self._plan_state(state, response)
         except Exception as e:
             logging.error(f"PLANNER CRASH: {e}")
-            state_copy["plan"] = plan
-            return state_copy
+            return {}
 
+    async def anode(self, state: AgentState):
+        logging.info(f"Planner node started.")
+        cached_state = self._cached_plan_state(state)
+        if cached_state is not None:
+            return cached_state
+        messages = self._messages(state)
+
+        try:
+            started = time.time()
+            usage_meta_data = UsageMetadataCallbackHandler()
+            config = {"callbacks": [usage_meta_data]}
+            if self.on_step is not None:
+                response = await self._astream_plan(state, messages, config)
+            else:
+                response = await self.llm.ainvoke(messages, config=config)
+            self.callback(usage_meta_data, started)
+            return self._plan_state(state, response)
+        except Exception as e:
+            logging.error(f"PLANNER CRASH: {e}")
+            return {}
 
 if __name__ == "__main__":
     def meta_callback(meta, started):
@@ -4,7 +4,7 @@ import time
 
 import yaml
 from langchain_core.callbacks import UsageMetadataCallbackHandler
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
 from langchain_openai import ChatOpenAI
 
 from erc.experts.base import BaseExpert
@@ -32,10 +32,17 @@ class ReflectionExpert(BaseExpert):
         logging.info("ReflectionExpert")
 
 
-        state_copy = state.copy()
-        if state_copy['executor'].status == 'SUCCESS': #TODO hardcoded?
-            logging.info(f"state: {state}")
-            state_copy['step_pointer'] += 1
+        update = {}
+        executor = state['executor']
+        messages = state.get('messages', [])
+        if not executor.status and messages and isinstance(messages[-1], ToolMessage):
+            status = 'SUCCESS' if messages[-1].status == 'success' else 'ERROR'
+            executor = executor.model_copy(update={'status': status})
+            update['executor'] = executor
 
-        return state_copy
+        if executor.status == 'SUCCESS': #TODO hardcoded?
+            logging.info(f"step {state['step_pointer'] + 1} done: {executor.step.tool_name}")
+            update['step_pointer'] = state['step_pointer'] + 1
+
+        return update
 
@@ -1,7 +1,8 @@
 # python
-from typing import Union, Dict, Any, List, Literal
+import re
+from typing import Union, Dict, Any, List, Literal, Optional, Type
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, create_model
 
 
 class PlanStep(BaseModel):
@@ -10,8 +11,8 @@ class PlanStep(BaseModel):
     """
     tool_name: str = Field(None, description="Tool Name to be used in order to finish the task")
     arguments: Union[Dict[str, Any], str, None] = Field(None, description="Arguments to be passed to the tool")
-    reasoning: str = Field(None, description="Reasoning to be shown when executing the task. Keep in short")
-    summary: str = Field(None, description="Summary of the execution step")
+    reasoning: Optional[str] = Field(None, description="Reasoning to be shown when executing the task. Keep in short")
+    summary: Optional[str] = Field(None, description="Summary of the execution step")
     
 
 
@@ -19,6 +20,34 @@ class ExecutionPlan(BaseModel):
     steps: List[PlanStep] = Field(None, description="List of execution steps")
 
 
+def constrained_plan_schema(registry: Dict[str, Optional[Type[BaseModel]]]) -> Type[BaseModel]:
+    """
+    ExecutionPlan variant for grammar-constrained decoding. Each step is a union
+    member with `tool_name` fixed to one registered tool and `arguments` typed by
+    that tool's model, so the server can only sample structurally valid plans.
+    """
+    variants = []
+    for tool_name, model in registry.items():
+        suffix = re.sub(r"\W+", "_", tool_name).strip("_")
+        fields = {
+            name: (field.annotation, field)
+            for name, field in (model.model_fields.items() if model else [])
+            if name != "tool"
+        }
+        arguments = create_model(f"Args_{suffix}", **fields)
+        variants.append(create_model(
+            f"Step_{suffix}",
+            tool_name=(Literal[tool_name], Field(description="Tool Name to be used in order to finish the task")),
+            arguments=(arguments, Field(description="Arguments to be passed to the tool")),
+            reasoning=(str, Field(description="Reasoning to be shown when executing the task. Keep in short")),
+            summary=(str, Field(description="Summary of the execution step")),
+        ))
+    return create_model(
+        "ConstrainedExecutionPlan",
+        steps=(List[Union[tuple(variants)]], Field(description="List of execution steps")),
+    )
+
+
 class ConstraintExpertOutput(BaseModel):
     is_valid: bool = Field(description="Indicates whether the current plan satisfies all constraints.")
     review_feedback: str = Field(description="Detailed feedback on any constraint violations or confirmations.")
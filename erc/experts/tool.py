@@ -1,33 +1,39 @@
 import logging
 import sys
 import time
+import uuid
+from typing import Optional
 
 import yaml
 from langchain_core.callbacks import UsageMetadataCallbackHandler
-from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
+from langchain_core.messages import AIMessage, SystemMessage, HumanMessage, ToolMessage
 from langchain_core.tools import tool
 from langchain_openai import ChatOpenAI
 
+from erc.context import ToolContextWindow
 from erc.experts.base import BaseExpert
+from erc.experts.validator import step_arguments
+from erc.metrics import DIRECT_DISPATCH
 from erc.persona import PersonaProvider
 from erc.state import AgentState
 
 
 class ToolExpert(BaseExpert):
-    def __init__(self, persona_path, tools: list, llm: ChatOpenAI, callback):
-        self.persona_provider = PersonaProvider("feedback_expert", persona_path)
+    def __init__(self, persona_path, tools: list, llm: ChatOpenAI, callback, compact_persona: bool = False,
+                 context_window: Optional[ToolContextWindow] = None):
+        self.persona_provider = PersonaProvider("tool_expert", persona_path, compact=compact_persona)
         self.llm = llm.bind_tools(tools)
+        self.tool_names = {t.name for t in tools}
         self.callback = callback
+        self.context_window = context_window or ToolContextWindow()
 
-    def node(self, state: AgentState):
-        logging.info(f"ToolExpert Started")
-
+    def _messages(self, state: AgentState):
         executor = state.get('executor')
         messages = state.get('messages', [])
 
         if not executor:
             logging.info("Executor: No steps left.")
-            return state
+            return None
 
         logging.info(f'executor: {executor}')
         current_step = executor.step
@@ -37,8 +43,6 @@ class ToolExpert(BaseExpert):
 
         system_msg = SystemMessage(content=self.persona_provider.get_primary_persona())
 
-        context_messages = [system_msg] + messages
-
         user_text = f"""
         TASK: Execute the next step.
         TOOL: {current_step.tool_name}
@@ -46,7 +50,31 @@ class ToolExpert(BaseExpert):
         REASONING: {current_step.reasoning}
         """
 
-        context_messages.append(HumanMessage(content=user_text))
+        # recent exchanges verbatim, older tool results collapsed, all within the token budget
+        return self.context_window.fit(system_msg, messages, HumanMessage(content=user_text))
+
+    def _direct_call(self, state: AgentState) -> Optional[AIMessage]:
+        """The planned call as-is, for steps the executor marked `direct`."""
+        executor = state.get('executor')
+        if not executor or not executor.direct or executor.step.tool_name not in self.tool_names:
+            return None
+        tool_call = {
+            "name": executor.step.tool_name,
+            "args": step_arguments(executor.step),
+            "id": f"call_direct_{uuid.uuid4().hex[:12]}",
+        }
+        logging.info(f"TOOL DIRECT: {tool_call}")
+        return AIMessage(content="", tool_calls=[tool_call], response_metadata={DIRECT_DISPATCH: True})
+
+    def node(self, state: AgentState):
+        logging.info(f"ToolExpert Started")
+        direct_call = self._direct_call(state)
+        if direct_call is not None:
+            return {"messages": [direct_call]}
+
+        context_messages = self._messages(state)
+        if context_messages is None:
+            return {}
 
         started = time.time()
         usage_meta_data = UsageMetadataCallbackHandler()
@@ -59,6 +87,27 @@ class ToolExpert(BaseExpert):
         logging.info(f"EXECUTOR DECISION: {response.tool_calls}")
         return {"messages": [response]} #TODO better to modify state??
 
+    async def anode(self, state: AgentState):
+        logging.info(f"ToolExpert Started")
+        direct_call = self._direct_call(state)
+        if direct_call is not None:
+            return {"messages": [direct_call]}
+
+        context_messages = self._messages(state)
+        if context_messages is None:
+            return {}
+
+        started = time.time()
+        usage_meta_data = UsageMetadataCallbackHandler()
+
+        response = await self.llm.ainvoke(context_messages, config={"callbacks": [usage_meta_data]})
+
+        if self.callback:
+            self.callback(usage_meta_data, started)
+
+        logging.info(f"EXECUTOR DECISION: {response.tool_calls}")
+        return {"messages": [response]}
+
 if __name__ == "__main__":
     def meta_callback(meta, started):
         print(meta)
@@ -0,0 +1,177 @@
+import json
+import logging
+import re
+from typing import Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+from erc.experts.schemas import ConstraintExpertOutput, ExecutionPlan, PlanStep
+from erc.store.tools import TOOL_MODELS, tool_function_name
+
+# An ordering rule gets the plan steps and returns error messages.
+OrderingRule = Callable[[List[PlanStep]], List[str]]
+
+# the rules compare function names, so they hold for store paths ("/basket/add") and
+# for the LangChain store tools named after them ("basket_add") alike
+BASKET_MUTATIONS = {tool_function_name(p) for p in ("/basket/add", "/basket/remove", "/coupon/apply", "/coupon/remove")}
+BASKET_FILLED = {tool_function_name(p) for p in ("/basket/add", "/basket/view")}
+CHECKOUT = tool_function_name("/basket/checkout")
+REPORT_COMPLETION = "report_completion"
+# tools whose arguments are the task's answer: after other steps they depend on those steps' results
+ANSWER_TOOLS = {REPORT_COMPLETION, "provide_answer"}
+
+
+def step_tool(step: PlanStep) -> str:
+    return tool_function_name(step.tool_name or "")
+
+
+def report_completion_last(steps: List[PlanStep]) -> List[str]:
+    positions = [i for i, step in enumerate(steps) if step_tool(step) == REPORT_COMPLETION]
+    if positions and positions != [len(steps) - 1]:
+        return ["`report_completion` must appear exactly once, as the last step."]
+    return []
+
+
+def checkout_after_basket_filled(steps: List[PlanStep]) -> List[str]:
+    errors = []
+    seen = set()
+    for i, step in enumerate(steps):
+        name = step_tool(step)
+        if name == CHECKOUT and not seen & BASKET_FILLED:
+            errors.append(f"step {i + 1}: `{step.tool_name}` needs an earlier basket add (or basket view).")
+        if name in BASKET_MUTATIONS and CHECKOUT in seen:
+            errors.append(f"step {i + 1}: `{step.tool_name}` after checkout has no effect.")
+        seen.add(name)
+    return errors
+
+
+STORE_ORDERING_RULES: List[OrderingRule] = [report_completion_last, checkout_after_basket_filled]
+
+# argument values standing in for something an earlier step still has to produce,
+# e.g. "<sku of the cheapest laptop>", "{step_1.sku}", "$sku", "from the previous step"
+PLACEHOLDER = re.compile(r"[<>{}]|\$\w|\b(tbd|unknown|placeholder)\b|\b(from|of) (the )?(previous|earlier|step)", re.I)
+
+
+def step_arguments(step: PlanStep) -> dict:
+    """Arguments of a step as a dict; raises ValueError when they are not a JSON object."""
+    arguments = step.arguments
+    if isinstance(arguments, str):
+        arguments = json.loads(arguments) if arguments.strip() else {}
+        if not isinstance(arguments, dict):
+            raise ValueError("arguments are not a JSON object")
+    arguments = dict(arguments or {})
+    arguments.pop("tool", None)
+    return arguments
+
+
+def has_placeholder(value) -> bool:
+    if isinstance(value, str):
+        return bool(PLACEHOLDER.search(value))
+    if isinstance(value, dict):
+        return any(has_placeholder(item) for item in value.values())
+    if isinstance(value, list):
+        return any(has_placeholder(item) for item in value)
+    return False
+
+
+class PlanValidator:
+    """
+    Deterministic pre-review of an ExecutionPlan: tool names against the
+    registry, arguments against each tool's pydantic model, and ordering rules.
+    Only plans that pass go on to the LLM reviewer.
+    """
+
+    def __init__(self, registry: Dict[str, Optional[Type[BaseModel]]], ordering_rules: List[OrderingRule] = ()):
+        self.registry = registry
+        self.ordering_rules = list(ordering_rules)
+
+    @classmethod
+    def for_store(cls) -> "PlanValidator":
+        return cls(TOOL_MODELS, STORE_ORDERING_RULES)
+
+    @classmethod
+    def for_tools(cls, tools: list) -> "PlanValidator":
+        """
+        Registry from LangChain tools, using the schema the LLM sees (injected
+        args excluded), with the store ordering rules.
+        """
+        return cls({t.name: t.tool_call_schema for t in tools}, STORE_ORDERING_RULES)
+
+    def _argument_errors(self, index: int, step: PlanStep) -> List[str]:
+        model = self.registry[step.tool_name]
+        if model is None:
+            return []
+
+        try:
+            arguments = step_arguments(step)
+        except ValueError:
+            return [f"step {index}: arguments of `{step.tool_name}` are not a JSON object."]
+
+        prefix = f"step {index} (`{step.tool_name}`)"
+        allowed = set(model.model_fields) - {"tool"}
+        errors = [f"{prefix}: unknown argument `{name}`." for name in arguments if name not in allowed]
+        try:
+            model.model_validate(arguments)
+        except ValidationError as e:
+            for error in e.errors():
+                field = ".".join(str(loc) for loc in error["loc"]) or "arguments"
+                errors.append(f"{prefix}: `{field}` {error['msg'].lower()}.")
+        return errors
+
+    def validate(self, plan: ExecutionPlan) -> List[str]:
+        steps = plan.steps or []
+        if not steps:
+            return ["The plan has no steps."]
+
+        errors = []
+        for i, step in enumerate(steps, start=1):
+            if step.tool_name not in self.registry:
+                known = ", ".join(f"`{name}`" for name in self.registry)
+                errors.append(f"step {i}: unknown tool `{step.tool_name}`. Available tools: {known}.")
+                continue
+            errors.extend(self._argument_errors(i, step))
+
+        for rule in self.ordering_rules:
+            errors.extend(rule(steps))
+        return errors
+
+    def is_fully_specified(self, step: PlanStep, index: int = 0) -> bool:
+        """
+        True when the step (at `index` in its plan) can be dispatched as
+        planned: a known tool, arguments valid for its model and no placeholder
+        for an earlier step's result. An answer tool after other steps never
+        is: its answer was guessed before the earlier results came in.
+        """
+        if index > 0 and step_tool(step) in ANSWER_TOOLS:
+            return False
+        if step.tool_name not in self.registry or self._argument_errors(0, step):
+            return False
+        try:
+            return not has_placeholder(step_arguments(step))
+        except ValueError:
+            return False
+
+    def review(self, plan: ExecutionPlan) -> Optional[ConstraintExpertOutput]:
+        """Rejection to return instead of an LLM review, or None when the plan is schema-clean."""
+        errors = self.validate(plan)
+        if not errors:
+            return None
+        logging.warning(f"STATIC VALIDATION FAILED: {errors}")
+        feedback = "Static validation failed:\n" + "\n".join(f"- {error}" for error in errors)
+        return ConstraintExpertOutput(is_valid=False, review_feedback=feedback)
+
+
+if __name__ == "__main__":
+    # the validator the graph builds must enforce the ordering rules on the tool names the planner sees
+    add = PlanStep(tool_name="basket_add", arguments={"sku": "GPU-4090", "quantity": 1})
+    checkout = PlanStep(tool_name="basket_checkout", arguments={})
+    report = PlanStep(tool_name="report_completion", arguments={"final_message": "Done."})
+
+    validator = PlanValidator.for_tools([])
+    validator.registry = {tool_function_name(name): model for name, model in TOOL_MODELS.items()}
+    errors = validator.validate(ExecutionPlan(steps=[report, checkout, add]))
+    assert len(errors) == 3, errors
+    assert validator.validate(ExecutionPlan(steps=[add, checkout, report])) == []
+    # a final answer planned after other steps always goes through the LLM
+    assert validator.is_fully_specified(add, 0) and not validator.is_fully_specified(report, 2)
+    print("ordering rules OK:", *errors, sep="\n- ")
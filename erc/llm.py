@@ -0,0 +1,49 @@
+from typing import Optional, Type
+
+from langchain_core.utils.function_calling import convert_to_openai_function
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
+
+
+def create_llm(
+        model: str = "oss-20b",
+        base_url: str = "http://localhost:8080/v1",
+        cache_prompt: bool = False,
+        slot_id: Optional[int] = None,
+        **kwargs,
+) -> ChatOpenAI:
+    """
+    ChatOpenAI client for the local OpenAI-compatible server.
+
+    `cache_prompt` asks llama.cpp to keep the KV cache of the request and reuse
+    its longest common prefix on the next call; `slot_id` pins requests to one
+    server slot so that reuse hits the same cache. vLLM ignores both fields and
+    reuses prefixes when started with --enable-prefix-caching.
+    """
+    extra_body = dict(kwargs.pop("extra_body", None) or {})
+    if cache_prompt:
+        extra_body["cache_prompt"] = True
+    if slot_id is not None:
+        extra_body["id_slot"] = slot_id
+
+    kwargs.setdefault("api_key", "no-key")  # local servers ignore it, the openai client rejects ""
+    kwargs.setdefault("temperature", 0.0)
+    return ChatOpenAI(
+        model=model,
+        base_url=base_url,
+        extra_body=extra_body or None,
+        **kwargs,
+    )
+
+
+def json_schema_format(schema: Type[BaseModel], strict: Optional[bool] = None) -> dict:
+    """
+    `response_format` payload for `schema`, the same one
+    `with_structured_output(schema, method="json_schema")` sends. Bind it directly
+    when the raw completion is needed, e.g. to parse a streamed plan.
+    """
+    function = convert_to_openai_function(schema, strict=strict)
+    json_schema = {"name": function["name"], "description": function["description"], "schema": function["parameters"]}
+    if strict is not None:
+        json_schema["strict"] = strict
+    return {"type": "json_schema", "json_schema": json_schema}
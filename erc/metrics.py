@@ -0,0 +1,323 @@
+import json
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from openai.types import CompletionUsage
+from pydantic import BaseModel, Field
+
+# Set by `MetricsRecorder.instrument` around every node run, so that expert
+# callbacks (which only get usage and a start time) know where they belong.
+CURRENT_TASK: ContextVar[Optional[str]] = ContextVar("erc_task_id", default=None)
+CURRENT_NODE: ContextVar[Optional[str]] = ContextVar("erc_node", default=None)
+
+# usage_metadata model name -> model slug ERC3 expects in log_llm
+DEFAULT_MODEL_SLUGS = {"oss-20b": "openai/gpt-oss-20b"}
+QUANTILES = (0.5, 0.95, 0.99)
+NO_TASK = "-"
+MAX_EVENTS = 100_000  # raw node runs and LLM calls kept for percentiles; the oldest are dropped first
+MAX_TASKS = 10_000  # tasks kept; the least recently active are dropped first
+
+# response_metadata flag of tool calls built from the plan instead of by the LLM
+DIRECT_DISPATCH = "direct_dispatch"
+
+
+def saved_llm_calls(update) -> int:
+    """LLM calls a node update stands in for: a direct or heuristic executor decision or direct tool calls."""
+    if not isinstance(update, dict):
+        return 0
+    executor = update.get("executor")
+    # a fresh decision has no status yet; reflection returns the same step again with one
+    skipped = getattr(executor, "direct", False) or getattr(executor, "heuristic", False)
+    saved = int(bool(skipped and not executor.status))
+    saved += sum(1 for m in update.get("messages", []) if getattr(m, "response_metadata", {}).get(DIRECT_DISPATCH))
+    return saved
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(q * len(ordered))))
+    return ordered[rank - 1]
+
+
+class NodeEvent(BaseModel):
+    kind: str = "node"
+    task_id: str
+    node: str
+    started: float
+    wall_sec: float
+    queue_sec: float
+    visit: int
+
+
+class LLMEvent(BaseModel):
+    kind: str = "llm"
+    task_id: str
+    node: str
+    model: str
+    started: float
+    duration_sec: float
+    input_tokens: int
+    output_tokens: int
+    cached_tokens: int
+    tokens_per_sec: float
+
+
+class TaskMetrics(BaseModel):
+    kind: str = "task"
+    task_id: str
+    started: float
+    finished: float
+    node_visits: Dict[str, int] = Field(default_factory=dict)
+    retries: Dict[str, int] = Field(default_factory=dict)  # repeated runs of a node on the same plan step
+    llm_calls: int = 0
+    saved_llm_calls: Dict[str, int] = Field(default_factory=dict)  # calls skipped by direct dispatch, per node
+    input_tokens: int = 0
+    output_tokens: int = 0
+    validation_attempts: int = 0
+
+    @property
+    def wall_sec(self) -> float:
+        return self.finished - self.started
+
+
+class MetricsRecorder:
+    """
+    Per-node and per-task latency and token metrics of the workflow graph.
+
+    Wrap graph nodes with `instrument` (see `workflow(..., metrics=...)`) and pass
+    the recorder itself as the experts' `callback`. Node runs record wall time
+    and queue time (the gap since the previous node of the same task finished);
+    LLM calls record duration and tokens, and updates made by direct dispatch
+    count the LLM calls they saved. With `core` set every call is also
+    forwarded to `ERC3.log_llm` under the task it belongs to.
+
+    Memory stays bounded in long sessions: only the last `max_events` events
+    and `max_tasks` tasks are kept, so percentiles cover that window, while
+    call, token, retry and saved-call counters are running totals.
+    """
+
+    def __init__(self, core=None, model_slugs: Optional[Dict[str, str]] = None,
+                 max_events: int = MAX_EVENTS, max_tasks: int = MAX_TASKS):
+        self.core = core
+        self.model_slugs = {**DEFAULT_MODEL_SLUGS, **(model_slugs or {})}
+        self.max_tasks = max_tasks
+        self.events: Deque[BaseModel] = deque(maxlen=max_events)
+        self.tasks: OrderedDict[str, TaskMetrics] = OrderedDict()
+        self.node_steps: Dict[str, Set[Tuple[str, Optional[int]]]] = {}  # task_id -> (node, step_pointer) already run
+        # (node, model) -> {"calls", "input_tokens", "output_tokens"}; node -> count
+        self.llm_totals: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self.retries_total: Dict[str, int] = {}
+        self.saved_total: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, usage_meta_data, started: float):
+        """Expert callback: `callback(usage_meta_data, started)`."""
+        finished = time.time()
+        task_id = CURRENT_TASK.get()
+        node = CURRENT_NODE.get() or "unknown"
+        duration = finished - started
+        for model, usage in (usage_meta_data.usage_metadata or {}).items():
+            input_tokens = usage.get("input_tokens", 0)
+            output_tokens = usage.get("output_tokens", 0)
+            event = LLMEvent(
+                task_id=task_id or NO_TASK,
+                node=node,
+                model=model,
+                started=started,
+                duration_sec=duration,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                cached_tokens=(usage.get("input_token_details") or {}).get("cache_read", 0) or 0,
+                tokens_per_sec=output_tokens / duration if duration > 0 else 0.0,
+            )
+            with self.lock:
+                self.events.append(event)
+                task = self._task(event.task_id, started)
+                task.llm_calls += 1
+                task.input_tokens += input_tokens
+                task.output_tokens += output_tokens
+                totals = self.llm_totals.setdefault((node, model), dict.fromkeys(
+                    ("calls", "input_tokens", "output_tokens"), 0))
+                totals["calls"] += 1
+                totals["input_tokens"] += input_tokens
+                totals["output_tokens"] += output_tokens
+            if self.core is not None and task_id is not None:
+                self._log_llm(task_id, model, duration, input_tokens, output_tokens)
+
+    def _log_llm(self, task_id: str, model: str, duration: float, input_tokens: int, output_tokens: int):
+        try:
+            self.core.log_llm(
+                task_id=task_id,
+                model=self.model_slugs.get(model, model),
+                duration_sec=duration,
+                usage=CompletionUsage(
+                    prompt_tokens=input_tokens,
+                    completion_tokens=output_tokens,
+                    total_tokens=input_tokens + output_tokens,
+                ),
+            )
+        except Exception as e:
+            logging.warning(f"log_llm failed for task {task_id}: {e}")
+
+    def _task(self, task_id: str, now: float) -> TaskMetrics:
+        task = self.tasks.get(task_id)
+        if task is None:
+            task = self.tasks[task_id] = TaskMetrics(task_id=task_id, started=now, finished=now)
+            while len(self.tasks) > self.max_tasks:
+                dropped, _ = self.tasks.popitem(last=False)
+                self.node_steps.pop(dropped, None)
+        else:
+            self.tasks.move_to_end(task_id)
+        return task
+
+    def _enter(self, node: str, config: RunnableConfig) -> tuple:
+        task_id = (config or {}).get("configurable", {}).get("task_id")
+        tokens = CURRENT_TASK.set(task_id), CURRENT_NODE.set(node)
+        return task_id or NO_TASK, tokens, time.time()
+
+    def _exit(self, node: str, task_id: str, tokens: tuple, started: float, state, result):
+        finished = time.time()
+        CURRENT_TASK.reset(tokens[0])
+        CURRENT_NODE.reset(tokens[1])
+        plan = result.get("plan") if isinstance(result, dict) else None
+        with self.lock:
+            task = self._task(task_id, started)
+            task.started = min(task.started, started)
+            # the first node has nothing to wait for; later ones wait on routing and the scheduler
+            queue = max(0.0, started - task.finished) if task.node_visits else 0.0
+            task.node_visits[node] = task.node_visits.get(node, 0) + 1
+            node_steps = self.node_steps.setdefault(task_id, set())
+            node_step = (node, state.get("step_pointer"))
+            if node_step in node_steps:
+                task.retries[node] = task.retries.get(node, 0) + 1
+                self.retries_total[node] = self.retries_total.get(node, 0) + 1
+            node_steps.add(node_step)
+            saved = saved_llm_calls(result)
+            if saved:
+                task.saved_llm_calls[node] = task.saved_llm_calls.get(node, 0) + saved
+                self.saved_total[node] = self.saved_total.get(node, 0) + saved
+            task.finished = finished
+            if plan is not None and plan.validation_attempts:
+                task.validation_attempts = max(task.validation_attempts, plan.validation_attempts)
+            self.events.append(NodeEvent(
+                task_id=task_id,
+                node=node,
+                started=started,
+                wall_sec=finished - started,
+                queue_sec=queue,
+                visit=task.node_visits[node],
+            ))
+
+    def instrument(self, node: str, runnable) -> RunnableLambda:
+        """Graph node running `runnable` under this recorder."""
+
+        def invoke(state, config: RunnableConfig):
+            task_id, tokens, started = self._enter(node, config)
+            result = None
+            try:
+                result = runnable.invoke(state, config)
+                return result
+            finally:
+                self._exit(node, task_id, tokens, started, state, result)
+
+        async def ainvoke(state, config: RunnableConfig):
+            task_id, tokens, started = self._enter(node, config)
+            result = None
+            try:
+                result = await runnable.ainvoke(state, config)
+                return result
+            finally:
+                self._exit(node, task_id, tokens, started, state, result)
+
+        return RunnableLambda(invoke, afunc=ainvoke, name=node)
+
+    def histograms(self) -> Dict[str, Dict[str, List[float]]]:
+        """metric -> label -> observed values; labels are node names, or "all" for per-task metrics."""
+        metrics = {
+            "node_wall_seconds": {},
+            "node_queue_seconds": {},
+            "llm_duration_seconds": {},
+            "llm_tokens_per_second": {},
+        }
+        with self.lock:
+            events = list(self.events)
+            tasks = list(self.tasks.values())
+        for event in events:
+            if isinstance(event, NodeEvent):
+                metrics["node_wall_seconds"].setdefault(event.node, []).append(event.wall_sec)
+                metrics["node_queue_seconds"].setdefault(event.node, []).append(event.queue_sec)
+            else:
+                metrics["llm_duration_seconds"].setdefault(event.node, []).append(event.duration_sec)
+                metrics["llm_tokens_per_second"].setdefault(event.node, []).append(event.tokens_per_sec)
+        metrics["task_wall_seconds"] = {"all": [task.wall_sec for task in tasks]}
+        metrics["task_validation_attempts"] = {"all": [float(task.validation_attempts) for task in tasks]}
+        metrics["task_saved_llm_calls"] = {"all": [float(sum(task.saved_llm_calls.values())) for task in tasks]}
+        return metrics
+
+    def summary(self) -> str:
+        lines = [f"{'metric':24} {'label':18} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9}"]
+        for metric, series in self.histograms().items():
+            for label, values in sorted(series.items()):
+                p50, p95, p99 = (percentile(values, q) for q in QUANTILES)
+                lines.append(f"{metric:24} {label:18} {len(values):6} {p50:9.3f} {p95:9.3f} {p99:9.3f}")
+        return "\n".join(lines)
+
+    def export_jsonl(self, path: str):
+        """One line per node run and LLM call, then one per task."""
+        with self.lock:
+            records = list(self.events) + list(self.tasks.values())
+        with open(path, "w") as f:
+            for record in records:
+                data = record.model_dump()
+                if isinstance(record, TaskMetrics):
+                    data["wall_sec"] = record.wall_sec
+                f.write(json.dumps(data) + "\n")
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition: summaries with p50/p95/p99 plus token, call, saved call and retry counters."""
+        lines = []
+        for metric, series in self.histograms().items():
+            name = f"erc_{metric}"
+            lines.append(f"# TYPE {name} summary")
+            for label, values in sorted(series.items()):
+                labels = f'node="{label}"' if metric.startswith(("node_", "llm_")) else ""
+                for q in QUANTILES:
+                    quantile = f'quantile="{q}"'
+                    lines.append(f"{name}{{{', '.join(filter(None, [labels, quantile]))}}} {percentile(values, q)}")
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {sum(values)}")
+                lines.append(f"{name}_count{suffix} {len(values)}")
+
+        calls, tokens = {}, {}
+        with self.lock:
+            for (node, _), totals in self.llm_totals.items():
+                calls[node] = calls.get(node, 0) + totals["calls"]
+                tokens[(node, "input")] = tokens.get((node, "input"), 0) + totals["input_tokens"]
+                tokens[(node, "output")] = tokens.get((node, "output"), 0) + totals["output_tokens"]
+            retries, saved = dict(self.retries_total), dict(self.saved_total)
+
+        lines.append("# TYPE erc_llm_calls_total counter")
+        lines.extend(f'erc_llm_calls_total{{node="{node}"}} {count}' for node, count in sorted(calls.items()))
+        lines.append("# TYPE erc_llm_calls_saved_total counter")
+        lines.extend(f'erc_llm_calls_saved_total{{node="{node}"}} {count}' for node, count in sorted(saved.items()))
+        lines.append("# TYPE erc_llm_tokens_total counter")
+        lines.extend(
+            f'erc_llm_tokens_total{{node="{node}", type="{kind}"}} {count}'
+            for (node, kind), count in sorted(tokens.items())
+        )
+        lines.append("# TYPE erc_node_retries_total counter")
+        lines.extend(f'erc_node_retries_total{{node="{node}"}} {count}' for node, count in sorted(retries.items()))
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path: str):
+        with open(path, "w") as f:
+            f.write(self.prometheus())
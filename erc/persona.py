@@ -1,17 +1,96 @@
-class PersonaProvider:
+import os
+import threading
+import time
+
+RELOAD_CHECK_INTERVAL = 1.0  # seconds between mtime checks of a loaded persona file
+
+
+class PersonaFile:
+    """
+    One persona text file, read lazily and re-read when its mtime changes
+    (e.g. after PromptWizard saves a new prompt).
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.text = None
+        self.mtime_ns = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def read(self) -> str:
+        now = time.monotonic()
+        if self.text is not None and now - self.checked_at < RELOAD_CHECK_INTERVAL:
+            return self.text
+
+        with self.lock:
+            mtime_ns = os.stat(self.file_path).st_mtime_ns
+            if self.text is None or mtime_ns != self.mtime_ns:
+                with open(self.file_path, "r") as f:
+                    self.text = f.read()
+                self.mtime_ns = mtime_ns
+            self.checked_at = now
+        return self.text
+
+
+class PersonaEntry:
+    """
+    Persona files of one expert: `<name>_system.txt`, `<name>_user.txt` and the
+    optional compact `<name>_system.min.txt` written by prompts.compaction.
+    """
+
     def __init__(self, name: str, path: str):
         self.name = name
         self.path = path
-        with open(f"{path}/planning_expert_system.txt", "r") as f:
-            self.primary_persona = f.read()
-        with open(f"{path}/planning_expert_user.txt", "r") as f:
-            self.secondary_persona = f.read()
+        self.files: dict[str, PersonaFile] = {}
+
+    def file(self, suffix: str) -> PersonaFile:
+        persona_file = self.files.get(suffix)
+        if persona_file is None:
+            persona_file = self.files.setdefault(
+                suffix, PersonaFile(os.path.join(self.path, f"{self.name}_{suffix}.txt"))
+            )
+        return persona_file
+
+
+# Process-wide registry keyed by (persona dir, expert name). Loaded entries are
+# inherited by forked workers, so call `preload` before forking to share them.
+_REGISTRY: dict[tuple[str, str], PersonaEntry] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_persona_entry(name: str, path: str) -> PersonaEntry:
+    key = (os.path.abspath(path), name)
+    entry = _REGISTRY.get(key)
+    if entry is None:
+        with _REGISTRY_LOCK:
+            entry = _REGISTRY.setdefault(key, PersonaEntry(name, key[0]))
+    return entry
+
+
+def preload(path: str, names: list[str], compact: bool = False):
+    for name in names:
+        provider = PersonaProvider(name, path, compact=compact)
+        provider.get_primary_persona()
+        provider.get_secondary_persona()
+
+
+class PersonaProvider:
+    def __init__(self, name: str, path: str, compact: bool = False):
+        self.name = name
+        self.path = path
+        entry = get_persona_entry(name, path)
+        primary_suffix = "system"
+        if compact and os.path.exists(entry.file("system.min").file_path):
+            primary_suffix = "system.min"
+        self.primary_file = entry.file(primary_suffix)
+        self.secondary_file = entry.file("user")
 
     def get_primary_persona(self) -> str:
-        return self.primary_persona
+        return self.primary_file.read()
 
     def get_secondary_persona(self) -> str:
-        return self.secondary_persona
+        return self.secondary_file.read()
 
 
 if __name__ == "__main__":
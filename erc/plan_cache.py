@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from erc.experts.schemas import ExecutionPlan
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_task(task_text: str) -> str:
+    return _WHITESPACE.sub(" ", task_text).strip().strip(".!?").lower()
+
+
+def tools_signature(tools_desc: str) -> str:
+    """Fingerprint of the tool set, e.g. of `render_text_description(tools)`."""
+    return hashlib.sha256(tools_desc.encode()).hexdigest()[:16]
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class PlanCache:
+    """
+    On-disk (SQLite) cache of reviewed execution plans.
+
+    Entries are keyed by normalized task text plus the tool-set signature, so a
+    change of tools never serves a stale plan. Only plans that passed review are
+    stored (`put` is called by the reviewer, or by the planner when constrained
+    plans skip review). Eviction is LRU beyond
+    `max_entries` plus a TTL on entry age.
+
+    With `embed` set, an exact miss falls back to the most similar cached task
+    with cosine similarity >= `similarity_threshold`. Keep it high: tasks that
+    differ only in a SKU or quantity embed very close to each other, which is
+    also why `lookup` flags such near hits: their plan was reviewed for
+    another task.
+    """
+
+    def __init__(
+            self,
+            tools_desc: str,
+            path: str = "plan_cache.sqlite",
+            max_entries: int = 1000,
+            ttl_sec: float = 7 * 24 * 3600,
+            embed: Optional[Callable[[str], List[float]]] = None,
+            similarity_threshold: float = 0.97,
+    ):
+        self.tools_sig = tools_signature(tools_desc)
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0, "puts": 0}
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS plans (
+                task_key TEXT NOT NULL,
+                tools_sig TEXT NOT NULL,
+                plan_json TEXT NOT NULL,
+                embedding TEXT,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (task_key, tools_sig)
+            )
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS plans_last_used ON plans (last_used)")
+        self.db.commit()
+
+    def get(self, task_text: str) -> Optional[ExecutionPlan]:
+        hit = self.lookup(task_text)
+        return hit[0] if hit else None
+
+    def lookup(self, task_text: str) -> Optional[Tuple[ExecutionPlan, bool]]:
+        """The cached plan and whether it was stored for this very task (False for an embedding near hit)."""
+        task_key = normalize_task(task_text)
+        now = time.time()
+        with self.lock:
+            self.db.execute("DELETE FROM plans WHERE created < ?", (now - self.ttl_sec,))
+            row = self.db.execute(
+                "SELECT task_key, plan_json FROM plans WHERE task_key = ? AND tools_sig = ?",
+                (task_key, self.tools_sig),
+            ).fetchone()
+            self.db.commit()
+        stat = "hits"
+
+        if row is None and self.embed is not None:
+            # embedding may be a remote call, keep it outside the lock
+            row = self._nearest(self.embed(task_key))
+            stat = "near_hits"
+
+        with self.lock:
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.db.execute(
+                "UPDATE plans SET last_used = ?, hits = hits + 1 WHERE task_key = ? AND tools_sig = ?",
+                (now, row[0], self.tools_sig),
+            )
+            self.db.commit()
+            self.stats[stat] += 1
+
+        logging.info(f"PLAN CACHE {stat.upper()}: {task_key!r}")
+        return ExecutionPlan.model_validate_json(row[1]), stat == "hits"
+
+    def _nearest(self, query: List[float]):
+        best, best_score = None, self.similarity_threshold
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT task_key, plan_json, embedding FROM plans WHERE tools_sig = ? AND embedding IS NOT NULL",
+                (self.tools_sig,),
+            ).fetchall()
+        for cached_key, plan_json, embedding in rows:
+            score = cosine(query, json.loads(embedding))
+            if score >= best_score:
+                best, best_score = (cached_key, plan_json), score
+        return best
+
+    def put(self, task_text: str, plan: ExecutionPlan):
+        task_key = normalize_task(task_text)
+        embedding = json.dumps(self.embed(task_key)) if self.embed is not None else None
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                """
+                INSERT INTO plans (task_key, tools_sig, plan_json, embedding, created, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (task_key, tools_sig) DO UPDATE SET
+                    plan_json = excluded.plan_json,
+                    embedding = excluded.embedding,
+                    created = excluded.created,
+                    last_used = excluded.last_used
+                """,
+                (task_key, self.tools_sig, plan.model_dump_json(exclude_none=True), embedding, now, now),
+            )
+            self.db.execute(
+                "DELETE FROM plans WHERE rowid IN "
+                "(SELECT rowid FROM plans ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self.db.commit()
+            self.stats["puts"] += 1
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,237 @@
+"""
+Per-expert model routing.
+
+The executor only picks "tool" or "code" and the reviewer answers valid/invalid
+plus feedback, yet by default they share the planner's large model. A
+`ModelRouter` maps each graph node ("planner", "reviewer", "executor", "tool",
+"coding") to an endpoint with its own model, server, timeout and max_tokens,
+and can let a small model answer first and escalate to a larger one when it
+is unsure.
+
+    endpoints:
+      large: {model: oss-20b, base_url: "http://localhost:8080/v1", request_timeout: 120}
+      small: {model: qwen3-1.7b, base_url: "http://localhost:8081/v1", request_timeout: 20, max_tokens: 256}
+    default: large
+    routes:
+      executor: {endpoint: small, escalate_to: large, min_confidence: 0.9}
+      reviewer: {endpoint: small, escalate_to: large, min_confidence: 0.8}
+"""
+import logging
+import math
+import re
+import threading
+from typing import Dict, List, Optional
+
+import yaml
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel, Field
+
+from erc.llm import create_llm
+
+NODES = ("planner", "reviewer", "executor", "tool", "coding")
+DEFAULT_MIN_CONFIDENCE = 0.9
+
+
+class ModelEndpoint(BaseModel):
+    model: str = "oss-20b"
+    base_url: str = "http://localhost:8080/v1"
+    request_timeout: float = 120.0
+    max_tokens: Optional[int] = None
+    cache_prompt: bool = True
+    input_cost: float = Field(0.0, description="USD per 1M prompt tokens, for cost reports")
+    output_cost: float = Field(0.0, description="USD per 1M completion tokens")
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens * self.input_cost + output_tokens * self.output_cost) / 1e6
+
+
+class ExpertRoute(BaseModel):
+    endpoint: str
+    escalate_to: Optional[str] = Field(None, description="endpoint asked when `endpoint` is unsure")
+    min_confidence: float = DEFAULT_MIN_CONFIDENCE
+
+
+def field_confidence(logprobs: Optional[List[dict]], field: Optional[str] = None) -> Optional[float]:
+    """
+    Probability of the least likely token of the JSON value of `field` in a
+    structured output (the whole output without `field` or when it is not
+    found). Free-text fields such as review feedback are always uncertain, so
+    the confidence is taken on the decisive field only. None without logprobs.
+    """
+    if not logprobs:
+        return None
+    starts, text = [], ""
+    for token in logprobs:
+        starts.append(len(text))
+        text += token.get("token", "")
+    span = (0, len(text))
+    if field is not None:
+        match = re.search(rf'"{re.escape(field)}"\s*:\s*("(?:[^"\\]|\\.)*"|true|false|null|-?[\d.eE+-]+)', text)
+        if match:
+            span = match.span(1)
+    ends = starts[1:] + [len(text)]
+    in_span = [t["logprob"] for t, start, end in zip(logprobs, starts, ends) if start < span[1] and end > span[0]]
+    return math.exp(min(in_span)) if in_span else None
+
+
+class EscalatingStructuredOutput:
+    """
+    Structured output that asks `small` first and `large` when the small
+    model fails, its answer does not parse or its confidence in the decisive
+    field (the schema's first field) is below `min_confidence`. Both calls
+    report usage through the callbacks of the call's config, under their own
+    model. A server without logprobs never escalates on confidence.
+    """
+
+    def __init__(self, router: "ModelRouter", node: str, small: ChatOpenAI, large: ChatOpenAI, schema,
+                 min_confidence: float, **kwargs):
+        self.router = router
+        self.node = node
+        self.small = small.with_structured_output(schema, include_raw=True, **kwargs)
+        self.large = large.with_structured_output(schema, **kwargs)
+        self.field = next(iter(schema.model_fields), None) if isinstance(schema, type) else None
+        self.min_confidence = min_confidence
+
+    def _escalate(self, answer: dict) -> bool:
+        if answer.get("error") is not None:
+            reason, confidence = f"{type(answer['error']).__name__}: {answer['error']}", None
+        elif answer.get("parsed") is None:
+            reason, confidence = "unparsed answer", None
+        else:
+            logprobs = (answer["raw"].response_metadata.get("logprobs") or {}).get("content")
+            confidence = field_confidence(logprobs, self.field)
+            if confidence is None or confidence >= self.min_confidence:
+                self.router.record(self.node, escalated=False, confidence=confidence)
+                return False
+            reason = f"confidence {confidence:.2f} < {self.min_confidence}"
+        logging.info(f"ROUTER ESCALATING {self.node}: {reason}")
+        self.router.record(self.node, escalated=True, confidence=confidence)
+        return True
+
+    def invoke(self, messages: List[BaseMessage], config: Optional[RunnableConfig] = None):
+        try:
+            answer = self.small.invoke(messages, config=config)
+        except Exception as e:
+            answer = {"parsed": None, "error": e}
+        return self.large.invoke(messages, config=config) if self._escalate(answer) else answer["parsed"]
+
+    async def ainvoke(self, messages: List[BaseMessage], config: Optional[RunnableConfig] = None):
+        try:
+            answer = await self.small.ainvoke(messages, config=config)
+        except Exception as e:
+            answer = {"parsed": None, "error": e}
+        return await self.large.ainvoke(messages, config=config) if self._escalate(answer) else answer["parsed"]
+
+
+class EscalatingChatModel:
+    """
+    What an expert gets for an escalating route: `with_structured_output`
+    returns an EscalatingStructuredOutput; anything else (tool binding,
+    streaming) goes to the small model alone.
+    """
+
+    def __init__(self, router: "ModelRouter", node: str, small: ChatOpenAI, large: ChatOpenAI,
+                 min_confidence: float):
+        self.router = router
+        self.node = node
+        self.small = small
+        self.large = large
+        self.min_confidence = min_confidence
+
+    def with_structured_output(self, schema, **kwargs) -> EscalatingStructuredOutput:
+        return EscalatingStructuredOutput(self.router, self.node, self.small, self.large, schema,
+                                          self.min_confidence, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self.small, name)
+
+
+class ModelRouter:
+    """
+    Chat models per graph node. Nodes without a route use the `default`
+    endpoint. One client is created per endpoint and shared by its nodes;
+    the small model of an escalating route requests logprobs.
+    """
+
+    def __init__(self, endpoints: Dict[str, ModelEndpoint], default: str,
+                 routes: Optional[Dict[str, ExpertRoute]] = None):
+        unknown = {r.endpoint for r in (routes or {}).values()} | {r.escalate_to for r in (routes or {}).values()}
+        unknown = {name for name in unknown | {default} if name is not None and name not in endpoints}
+        if unknown:
+            raise ValueError(f"Unknown endpoints in model routes: {sorted(unknown)}")
+        if set(routes or {}) - set(NODES):
+            raise ValueError(f"Model routes for unknown nodes {sorted(set(routes) - set(NODES))}, expected {NODES}")
+        self.endpoints = endpoints
+        self.default = default
+        self.routes = routes or {}
+        self.clients: Dict[tuple, ChatOpenAI] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def single(cls, endpoint: ModelEndpoint) -> "ModelRouter":
+        """Every node on one model, the setup without routing."""
+        return cls({"default": endpoint}, "default")
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ModelRouter":
+        return cls(
+            endpoints={name: ModelEndpoint(**e) for name, e in config["endpoints"].items()},
+            default=config["default"],
+            routes={node: ExpertRoute(**r) for node, r in (config.get("routes") or {}).items()},
+        )
+
+    @classmethod
+    def from_yaml(cls, path: str) -> "ModelRouter":
+        with open(path, "r") as f:
+            return cls.from_config(yaml.safe_load(f))
+
+    def client(self, name: str, logprobs: bool = False) -> ChatOpenAI:
+        with self.lock:
+            key = (name, logprobs)
+            if key not in self.clients:
+                endpoint = self.endpoints[name]
+                kwargs = {"max_tokens": endpoint.max_tokens} if endpoint.max_tokens else {}
+                if logprobs:
+                    kwargs["logprobs"] = True
+                self.clients[key] = create_llm(
+                    model=endpoint.model,
+                    base_url=endpoint.base_url,
+                    cache_prompt=endpoint.cache_prompt,
+                    request_timeout=endpoint.request_timeout,
+                    **kwargs,
+                )
+            return self.clients[key]
+
+    def llm(self, node: str):
+        """The `llm` argument for the expert of graph node `node`."""
+        route = self.routes.get(node)
+        if route is None:
+            return self.client(self.default)
+        if route.escalate_to is None:
+            return self.client(route.endpoint)
+        return EscalatingChatModel(self, node, self.client(route.endpoint, logprobs=True),
+                                   self.client(route.escalate_to), route.min_confidence)
+
+    def record(self, node: str, escalated: bool, confidence: Optional[float]):
+        with self.lock:
+            counts = self.stats.setdefault(node, {"answered": 0, "escalated": 0, "no_logprobs": 0})
+            counts["escalated" if escalated else "answered"] += 1
+            if confidence is None and not escalated:
+                counts["no_logprobs"] += 1
+
+    def cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        """USD for a call reported under `model` (the usage_metadata key), 0.0 for unknown models."""
+        endpoint = next((e for e in self.endpoints.values() if e.model == model), None)
+        return endpoint.cost(input_tokens, output_tokens) if endpoint else 0.0
+
+    def summary(self) -> str:
+        lines = [f"{'node':10} {'answered':>8} {'escalated':>9} {'rate':>6} {'no logprobs':>11}"]
+        with self.lock:
+            for node, counts in sorted(self.stats.items()):
+                total = counts["answered"] + counts["escalated"]
+                lines.append(f"{node:10} {counts['answered']:8} {counts['escalated']:9} "
+                             f"{counts['escalated'] / total if total else 0.0:6.1%} {counts['no_logprobs']:11}")
+        return "\n".join(lines)
@@ -0,0 +1,389 @@
+"""
+Sandboxed Python execution for "code" steps.
+
+`SandboxPool` keeps a few pre-forked worker processes with warm interpreters
+(the usual stdlib modules already imported), so a snippet runs in
+milliseconds instead of paying interpreter startup per call. Each worker
+restricts itself once at startup:
+
+- address space (`memory_mb`), file size and core dumps via rlimits;
+- no child processes: RLIMIT_NPROC, which root ignores, so `os.fork`,
+  `os.system`, the exec family and subprocess are refused as well;
+- no network: a private network namespace where the kernel allows it,
+  otherwise `socket` refuses to create sockets;
+- files only in its own empty temp directory, which is also the working
+  directory and is removed with the worker: an audit hook refuses writes
+  anywhere else and reads outside it and the Python installation (so
+  stdlib imports keep working).
+
+Every snippet runs in a fresh namespace with a CPU-time limit
+(`cpu_seconds`, RLIMIT_CPU relative to the worker's usage so far) and the
+pool enforces a wall-clock `timeout` by killing and replacing the worker.
+Workers are also replaced after `max_jobs` snippets or when they die.
+
+This guards against runaway and accidental code from the model, not against
+a determined attacker: it is the same user, and native code (ctypes,
+extension modules) is not confined.
+
+    with SandboxPool(workers=2) as pool:
+        print(pool.run("len('raspberry')").as_text())
+"""
+import ast
+import builtins
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Optional
+
+from pydantic import BaseModel
+
+PYTHON_TOOL = "run_python"
+DEFAULT_WORKERS = 2
+DEFAULT_CPU_SECONDS = 5
+DEFAULT_MEMORY_MB = 512
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_JOBS = 200  # snippets per worker before it is replaced
+MAX_OUTPUT_CHARS = 4000
+MAX_FILE_BYTES = 1024 * 1024
+WARM_MODULES = ("collections", "datetime", "decimal", "fractions", "itertools", "json", "math", "re",
+                "statistics", "string")
+
+
+class SandboxError(Exception):
+    pass
+
+
+class CpuTimeExceeded(Exception):
+    pass
+
+
+class SandboxResult(BaseModel):
+    stdout: str = ""
+    result: Optional[str] = None  # repr of the last expression's value
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+    def as_text(self) -> str:
+        parts = [self.stdout.rstrip()] if self.stdout.strip() else []
+        if self.result is not None:
+            parts.append(f"Result: {self.result}")
+        if self.error is not None:
+            parts.append(f"Error: {self.error}")
+        return "\n".join(parts) or "(no output)"
+
+
+def _truncate(text: str, limit: int = MAX_OUTPUT_CHARS) -> str:
+    return text if len(text) <= limit else text[:limit] + f"\n[... {len(text) - limit} more characters]"
+
+
+def _no_network(*args, **kwargs):
+    raise PermissionError("network access is disabled in the sandbox")
+
+
+def _no_processes(*args, **kwargs):
+    raise PermissionError("starting processes is disabled in the sandbox")
+
+
+class _NoNetworkSocket(socket.socket):
+    # a class rather than a function, so modules subclassing socket.socket (ssl) still import
+    def __init__(self, *args, **kwargs):
+        _no_network()
+
+
+# audit events with path arguments -> positions of the paths that are read or written
+READ_EVENTS = {"os.listdir": (0,), "os.scandir": (0,), "shutil.copyfile": (0,), "shutil.copytree": (0,)}
+WRITE_EVENTS = {
+    "os.chdir": (0,), "os.chmod": (0,), "os.chown": (0,), "os.link": (0, 1), "os.mkdir": (0,), "os.remove": (0,),
+    "os.rename": (0, 1), "os.rmdir": (0,), "os.symlink": (1,), "os.truncate": (0,), "os.utime": (0,),
+    "shutil.copyfile": (1,), "shutil.copytree": (1,), "shutil.move": (0, 1), "shutil.rmtree": (0,),
+}
+DENIED_EVENTS = {
+    "os.exec": "starting processes", "os.fork": "starting processes", "os.forkpty": "starting processes",
+    "os.posix_spawn": "starting processes", "os.spawn": "starting processes", "os.system": "starting processes",
+    "subprocess.Popen": "starting processes", "socket.bind": "network access", "socket.connect": "network access",
+    "socket.getaddrinfo": "network access", "socket.sendto": "network access",
+}
+WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_APPEND
+
+
+class _Confinement:
+    """
+    Audit hook of a worker: file access outside `root` (reads also outside
+    the Python installation), new processes and sockets raise PermissionError.
+    Installed once, it cannot be removed by the snippets.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+        prefixes = {sys.prefix, sys.base_prefix, sys.exec_prefix, sys.base_exec_prefix}
+        self.read_roots = (self.root, *sorted(os.path.realpath(p) for p in prefixes))
+
+    def _check(self, path, roots: tuple, access: str):
+        if path is None or isinstance(path, int):
+            return  # the working directory, or an already open descriptor
+        resolved = os.path.realpath(os.fsdecode(os.fspath(path)))
+        if not any(resolved == root or resolved.startswith(root + os.sep) for root in roots):
+            raise PermissionError(f"{access} {resolved} is outside the sandbox directory")
+
+    def __call__(self, event: str, args: tuple):
+        if event == "open":
+            path, mode, flags = args
+            writing = any(c in mode for c in "wax+") if isinstance(mode, str) else bool((flags or 0) & WRITE_FLAGS)
+            self._check(path, (self.root,) if writing else self.read_roots, "writing" if writing else "reading")
+        elif event in DENIED_EVENTS:
+            raise PermissionError(f"{DENIED_EVENTS[event]} is disabled in the sandbox")
+        else:
+            for index in READ_EVENTS.get(event, ()):
+                self._check(args[index] if index < len(args) else None, self.read_roots, "reading")
+            for index in WRITE_EVENTS.get(event, ()):
+                self._check(args[index] if index < len(args) else None, (self.root,), "writing")
+
+
+def _restrict(memory_bytes: int, root: str):
+    """One-time lockdown of a worker process to the directory `root`."""
+    unshared = False
+    if hasattr(os, "unshare"):
+        try:
+            os.unshare(os.CLONE_NEWNET)
+            unshared = True
+        except OSError:
+            pass
+    if not unshared:
+        # the pipe to the pool is already open; only new sockets are refused
+        socket.socket = _NoNetworkSocket
+        socket.create_connection = _no_network
+        socket.getaddrinfo = _no_network
+        socket.socketpair = _no_network
+    subprocess.Popen._execute_child = _no_processes
+    for name in ("fork", "forkpty", "system", "popen", "posix_spawn", "posix_spawnp", "execv", "execve", "execvp",
+                 "execvpe", "execl", "execle", "execlp", "execlpe", "spawnv", "spawnve", "spawnvp", "spawnvpe"):
+        if hasattr(os, name):
+            setattr(os, name, _no_processes)
+    for limit, value in ((resource.RLIMIT_AS, memory_bytes), (resource.RLIMIT_FSIZE, MAX_FILE_BYTES),
+                         (resource.RLIMIT_CORE, 0), (resource.RLIMIT_NPROC, 0)):
+        try:
+            resource.setrlimit(limit, (value, value))
+        except (ValueError, OSError):
+            logging.debug(f"sandbox: could not set rlimit {limit}")
+    os.chdir(root)
+    tempfile.tempdir = os.environ["TMPDIR"] = root
+    sys.addaudithook(_Confinement(root))
+
+
+def _cpu_seconds_used() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _on_cpu_limit(signum, frame):
+    raise CpuTimeExceeded("CPU time limit exceeded")
+
+
+def _execute(code: str, cpu_seconds: int) -> dict:
+    """Runs `code` like a REPL cell: statements, then the value of a trailing expression."""
+    stdout = io.StringIO()
+    started = time.perf_counter()
+    result, error = None, None
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    try:
+        tree = ast.parse(code, "<sandbox>", "exec")
+        last = tree.body.pop() if tree.body and isinstance(tree.body[-1], ast.Expr) else None
+        namespace = {"__name__": "__sandbox__", "__builtins__": builtins}
+        soft = int(_cpu_seconds_used()) + cpu_seconds + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+        with redirect_stdout(stdout), redirect_stderr(stdout):
+            exec(compile(tree, "<sandbox>", "exec"), namespace)
+            if last is not None:
+                value = eval(compile(ast.Expression(last.value), "<sandbox>", "eval"), namespace)
+                result = None if value is None else repr(value)
+    except CpuTimeExceeded:
+        error = f"CpuTimeExceeded: more than {cpu_seconds}s of CPU time"
+    except (Exception, SystemExit) as e:
+        # drop this function's frame from the traceback
+        error = "".join(traceback.format_exception(type(e), e, e.__traceback__.tb_next)).strip()
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+    return {
+        "stdout": _truncate(stdout.getvalue()),
+        "result": None if result is None else _truncate(result),
+        "error": None if error is None else _truncate(error),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def _worker(conn, cpu_seconds: int, memory_bytes: int, root: str):
+    for name in WARM_MODULES:
+        __import__(name)
+    _restrict(memory_bytes, root)
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pid = os.getpid()
+    while True:
+        try:
+            code = conn.recv()
+        except (EOFError, OSError):
+            return
+        if code is None:
+            return
+        try:
+            reply = _execute(code, cpu_seconds)
+        except MemoryError:
+            reply = {"error": "MemoryError: memory limit exceeded"}
+        if os.getpid() != pid:
+            # a child forked past the guards must not answer on the pool's pipe
+            os._exit(0)
+        conn.send(reply)
+
+
+class _Worker:
+    def __init__(self, process, conn, root: str):
+        self.process = process
+        self.conn = conn
+        self.root = root
+        self.jobs = 0
+
+    def stop(self, graceful: bool = True):
+        """Ends the process (asking it first when `graceful`) and removes its directory."""
+        if graceful:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+            self.process.join(0.5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class SandboxPool:
+    """
+    Pre-forked restricted Python workers; `run` is thread-safe and waits for
+    an idle worker. Workers come from a fork server (or spawn), so they never
+    inherit the graph's threads or open clients.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, cpu_seconds: int = DEFAULT_CPU_SECONDS,
+                 memory_mb: int = DEFAULT_MEMORY_MB, timeout: float = DEFAULT_TIMEOUT,
+                 max_jobs: int = DEFAULT_MAX_JOBS):
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self.size = workers
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_mb * 1024 * 1024
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self.idle: "queue.Queue[_Worker]" = queue.Queue()
+        self.started = False
+        self.stats = {"runs": 0, "errors": 0, "timeouts": 0, "restarts": 0}
+        self.lock = threading.Lock()
+
+    def _spawn(self) -> _Worker:
+        # made here rather than in the worker, so the pool can remove it when the worker is gone
+        root = tempfile.mkdtemp(prefix="sandbox-")
+        parent, child = self.context.Pipe()
+        process = self.context.Process(target=_worker, args=(child, self.cpu_seconds, self.memory_bytes, root),
+                                       name="sandbox", daemon=True)
+        process.start()
+        child.close()
+        return _Worker(process, parent, root)
+
+    def start(self) -> "SandboxPool":
+        with self.lock:
+            if not self.started:
+                for _ in range(self.size):
+                    self.idle.put(self._spawn())
+                self.started = True
+        return self
+
+    def _replace(self, worker: _Worker, reason: str) -> _Worker:
+        logging.info(f"SANDBOX replacing worker {worker.process.pid}: {reason}")
+        worker.stop(graceful=False)
+        with self.lock:
+            self.stats["restarts"] += 1
+        return self._spawn()
+
+    def run(self, code: str) -> SandboxResult:
+        self.start()
+        worker = self.idle.get()
+        started = time.perf_counter()
+        try:
+            worker.conn.send(code)
+            if worker.conn.poll(self.timeout):
+                reply = worker.conn.recv()
+            else:
+                reply = {"error": f"TimeoutError: no result within {self.timeout:.0f}s"}
+                with self.lock:
+                    self.stats["timeouts"] += 1
+                worker = self._replace(worker, "timeout")
+        except (EOFError, OSError) as e:
+            reply = {"error": f"SandboxError: the worker died ({type(e).__name__}), e.g. out of memory"}
+            worker = self._replace(worker, "died")
+        finally:
+            worker.jobs += 1
+            if worker.jobs >= self.max_jobs:
+                worker = self._replace(worker, f"{worker.jobs} jobs")
+            self.idle.put(worker)
+        result = SandboxResult(**{**reply, "seconds": time.perf_counter() - started})
+        with self.lock:
+            self.stats["runs"] += 1
+            self.stats["errors"] += result.error is not None
+        return result
+
+    def close(self):
+        with self.lock:
+            started, self.started = self.started, False
+        while started:
+            try:
+                self.idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+    def __enter__(self) -> "SandboxPool":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def summary(self) -> str:
+        with self.lock:
+            return ", ".join(f"{key} {value}" for key, value in self.stats.items())
+
+
+def python_tool(pool: SandboxPool):
+    """
+    `run_python` LangChain tool on `pool`. A snippet that raises makes the tool
+    raise SandboxError, so ToolNode(handle_tool_errors=True) answers with an
+    error ToolMessage and reflection sees the step as failed.
+    """
+    from langchain_core.tools import StructuredTool
+
+    def run_python(code: str) -> str:
+        result = pool.run(code)
+        if result.error is not None:
+            raise SandboxError(result.as_text())
+        return result.as_text()
+
+    return StructuredTool.from_function(
+        func=run_python,
+        name=PYTHON_TOOL,
+        description=(
+            "Runs a self-contained Python snippet in a sandbox (standard library only, no network or processes, "
+            f"files only in its working directory, {pool.cpu_seconds}s CPU) and returns what it prints and the "
+            "value of its last expression."
+        ),
+    )
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import textwrap
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from erc3 import ERC3
+from langchain_core.runnables import RunnableConfig
+from pydantic import BaseModel, ConfigDict
+
+from erc.checkpoint import SessionJournal
+
+
+class TaskOutcome(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    task: Any
+    result: Any = None
+    error: Optional[str] = None
+    duration_sec: float = 0.0
+
+
+def task_input(task) -> dict:
+    return {
+        "input_task": task.task_text,
+        "messages": [],
+        "step_pointer": 0,
+    }
+
+
+def task_config(task, api, recursion_limit: int = 50, catalog=None) -> RunnableConfig:
+    """
+    Per-task graph config. The task client travels in `configurable`, so tools
+    resolve it from their injected config instead of module globals. So does
+    the task's product catalog (or the future loading it), when there is one.
+    The task id doubles as the checkpointer thread.
+    """
+    configurable = {"task_id": task.task_id, "thread_id": task.task_id, "api": api}
+    if catalog is not None:
+        configurable["catalog"] = catalog
+    return RunnableConfig(recursion_limit=recursion_limit, configurable=configurable)
+
+
+def graph_input(app, task, config: RunnableConfig) -> Optional[dict]:
+    """
+    Fresh input for the task, or None to continue from the last checkpoint
+    when the graph has a checkpointer that already holds this task's thread.
+    """
+    if getattr(app, "checkpointer", None) and app.get_state(config).values:
+        logging.info(f"Resuming Task: {task.task_id} from its last checkpoint")
+        return None
+    return task_input(task)
+
+
+async def agraph_input(app, task, config: RunnableConfig) -> Optional[dict]:
+    if getattr(app, "checkpointer", None) and (await app.aget_state(config)).values:
+        logging.info(f"Resuming Task: {task.task_id} from its last checkpoint")
+        return None
+    return task_input(task)
+
+
+def task_api(config: RunnableConfig):
+    return config["configurable"]["api"]
+
+
+def task_id(config: RunnableConfig) -> str:
+    return config["configurable"]["task_id"]
+
+
+def _keep_open(journal: Optional[SessionJournal], task, error: str) -> bool:
+    """Whether a crashed task stays open for a rerun instead of being completed."""
+    if journal is None:
+        return False
+    if journal.fail(task.task_id, error) >= journal.max_attempts:
+        return False
+    logging.warning(f"Task {task.task_id} left open; rerun the session to resume it")
+    return True
+
+
+def run_task(core: ERC3, app, task, client_factory: Callable, recursion_limit: int = 50,
+             catalog_factory: Optional[Callable] = None, journal: Optional[SessionJournal] = None) -> TaskOutcome:
+    logging.info(f"Starting Task: {task.task_id} ({task.spec_id}): {task.task_text}")
+    started = time.time()
+    if journal is None or journal.status(task.task_id) is None:
+        core.start_task(task)
+    if journal is not None:
+        journal.start(task.task_id)
+    error = None
+    try:
+        api = client_factory(task)
+        catalog = catalog_factory(api) if catalog_factory else None
+        config = task_config(task, api, recursion_limit, catalog)
+        app.invoke(graph_input(app, task, config), config)
+    except Exception as e:
+        logging.error(f"Task {task.task_id} crashed: {e}")
+        error = str(e)
+        if _keep_open(journal, task, error):
+            return TaskOutcome(task=task, error=error, duration_sec=time.time() - started)
+
+    result = core.complete_task(task)
+    if journal is not None:
+        journal.finish(task.task_id, error)
+    return TaskOutcome(task=task, result=result, error=error, duration_sec=time.time() - started)
+
+
+async def arun_task(core: ERC3, app, task, client_factory: Callable, recursion_limit: int = 50,
+                    catalog_factory: Optional[Callable] = None,
+                    journal: Optional[SessionJournal] = None) -> TaskOutcome:
+    logging.info(f"Starting Task: {task.task_id} ({task.spec_id}): {task.task_text}")
+    started = time.time()
+    if journal is None or journal.status(task.task_id) is None:
+        await asyncio.to_thread(core.start_task, task)
+    if journal is not None:
+        journal.start(task.task_id)
+    error = None
+    try:
+        api = await asyncio.to_thread(client_factory, task)
+        catalog = catalog_factory(api) if catalog_factory else None
+        config = task_config(task, api, recursion_limit, catalog)
+        await app.ainvoke(await agraph_input(app, task, config), config)
+    except Exception as e:
+        logging.error(f"Task {task.task_id} crashed: {e}")
+        error = str(e)
+        if _keep_open(journal, task, error):
+            return TaskOutcome(task=task, error=error, duration_sec=time.time() - started)
+
+    result = await asyncio.to_thread(core.complete_task, task)
+    if journal is not None:
+        journal.finish(task.task_id, error)
+    return TaskOutcome(task=task, result=result, error=error, duration_sec=time.time() - started)
+
+
+def report_outcome(outcome: TaskOutcome):
+    task = outcome.task
+    print("=" * 40)
+    print(f"Task: {task.task_id} ({task.spec_id}): {task.task_text}")
+    print(f"Duration: {outcome.duration_sec:.1f}s")
+    if outcome.error:
+        print(f"ERROR: {outcome.error}")
+    result = outcome.result
+    if result is not None and result.eval:
+        explain = textwrap.indent(result.eval.logs, "  ")
+        print(f"\nSCORE: {result.eval.score}\n{explain}\n")
+
+
+def pending_tasks(tasks: list, journal: Optional[SessionJournal]) -> list:
+    if journal is None:
+        return tasks
+    pending = [task for task in tasks if journal.status(task.task_id) != "done"]
+    if len(pending) < len(tasks):
+        logging.info(f"Skipping {len(tasks) - len(pending)} tasks completed in an earlier run")
+    return pending
+
+
+def run_session(
+        core: ERC3,
+        app,
+        tasks: list,
+        max_workers: int = 4,
+        client_factory: Callable = None,
+        recursion_limit: int = 50,
+        on_outcome: Callable = report_outcome,
+        catalog_factory: Optional[Callable] = None,
+        journal: Optional[SessionJournal] = None,
+) -> List[TaskOutcome]:
+    """
+    Runs up to `max_workers` tasks at once against the same compiled graph.
+    Outcomes are reported and returned in task order, not completion order.
+    `catalog_factory(api)`, e.g. `prefetch_catalog`, is started for every task
+    as soon as its client exists. With a `journal`, tasks completed by an
+    earlier run are skipped and crashed ones are left open to resume later.
+    """
+    client_factory = client_factory or core.get_demo_client
+    tasks = pending_tasks(tasks, journal)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(run_task, core, app, task, client_factory, recursion_limit, catalog_factory, journal)
+            for task in tasks
+        ]
+        outcomes = []
+        for future in futures:
+            outcome = future.result()
+            if on_outcome:
+                on_outcome(outcome)
+            outcomes.append(outcome)
+    return outcomes
+
+
+async def arun_session(
+        core: ERC3,
+        app,
+        tasks: list,
+        max_concurrency: int = 64,
+        client_factory: Callable = None,
+        recursion_limit: int = 50,
+        on_outcome: Callable = report_outcome,
+        catalog_factory: Optional[Callable] = None,
+        journal: Optional[SessionJournal] = None,
+) -> List[TaskOutcome]:
+    """
+    Event-loop variant of `run_session`: drives the graph through `ainvoke`, so
+    in-flight tasks cost a coroutine each instead of an OS thread.
+    """
+    client_factory = client_factory or core.get_demo_client
+    tasks = pending_tasks(tasks, journal)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def bounded(task):
+        async with semaphore:
+            return await arun_task(core, app, task, client_factory, recursion_limit, catalog_factory, journal)
+
+    pending = [asyncio.ensure_future(bounded(task)) for task in tasks]
+    outcomes = []
+    for future in pending:
+        outcome = await future
+        if on_outcome:
+            on_outcome(outcome)
+        outcomes.append(outcome)
+    return outcomes
@@ -9,16 +9,23 @@ import operator
 
 class Plan(BaseModel):
     plan: ExecutionPlan
-    is_validated: bool
-    validation_attempts: Optional[int]
-    review: Optional[ConstraintExpertOutput]
+    is_validated: bool = False
+    validation_attempts: int = 0
+    review: Optional[ConstraintExpertOutput] = None
+    from_cache: bool = False
 
 class ExecutionTool(BaseModel):
     step: PlanStep
     tool: str
-    status: str
+    status: str = ''
+    direct: bool = False  # dispatched as planned, without the executor and tool LLM calls
+    heuristic: bool = False  # decided by the executor's DecisionEngine, without its LLM call
 
 class AgentState(TypedDict):
+    """
+    Graph state. Nodes return only the keys they change; in particular they
+    never return `messages` unless adding to it, since its reducer appends.
+    """
     input_task: str
     plan: Optional[Plan]
     executor: Optional[ExecutionTool]
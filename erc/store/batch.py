@@ -0,0 +1,118 @@
+"""
+Several store operations in one tool call.
+
+Each store tool call costs a ToolExpert turn and a ToolNode hop. The batch tool
+takes the operations of a plan segment (add these five items, apply a coupon,
+view the basket) and runs them in order against the task's store client, so the
+whole segment is one agent turn.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, List, Literal, Union
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+from erc.session import task_api
+from erc.store.tools import (
+    READ_ONLY_TOOLS,
+    Req_AddProductToBasket,
+    Req_ApplyCoupon,
+    Req_CheckoutBasket,
+    Req_ListProducts,
+    Req_RemoveCoupon,
+    Req_RemoveItemFromBasket,
+    Req_ViewBasket,
+    call_tool,
+    get_tool_name,
+    get_tool_signature,
+    store_tool,
+    tool_function_name,
+)
+
+BATCH_READ_WORKERS = 4
+
+BATCH_OPERATIONS = [
+    Req_ListProducts,
+    Req_ViewBasket,
+    Req_AddProductToBasket,
+    Req_RemoveItemFromBasket,
+    Req_ApplyCoupon,
+    Req_RemoveCoupon,
+    Req_CheckoutBasket,
+]
+
+BatchOperation = Annotated[Union[tuple(BATCH_OPERATIONS)], Field(discriminator="tool")]
+
+_operation = TypeAdapter(BatchOperation)
+
+
+class Req_Batch(BaseModel):
+    """
+    Runs several store operations in one call, in the given order, e.g. adding
+    all items of an order and applying a coupon. Stops at the first failing
+    operation; the result lists what each operation returned.
+    """
+    tool: Literal["/batch"] = "/batch"
+    operations: List[BatchOperation] = Field(
+        ..., description="Store requests, each with its `tool` (e.g. '/basket/add') and arguments"
+    )
+
+
+def _segments(operations: list) -> List[list]:
+    """Consecutive reads run together as one segment; every write is a segment of its own."""
+    segments = []
+    for index, operation in enumerate(operations):
+        read = get_tool_name(type(operation)) in READ_ONLY_TOOLS
+        if read and segments and segments[-1][0][1]:
+            segments[-1].append((index, read, operation))
+        else:
+            segments.append([(index, read, operation)])
+    return segments
+
+
+class StoreBatch:
+    """Serves `/batch` for one store client."""
+
+    def __init__(self, client, read_workers: int = BATCH_READ_WORKERS):
+        self.client = client
+        self.read_workers = read_workers
+
+    def _run_one(self, operation: BaseModel) -> dict:
+        result = {"tool": get_tool_name(type(operation))}
+        try:
+            response = call_tool(self.client, operation)
+        except Exception as e:
+            return {**result, "status": "failed", "error": f"{type(e).__name__}: {e}"}
+        if isinstance(response, BaseModel):
+            response = response.model_dump()
+        return {**result, "status": "ok", "result": response}
+
+    def run(self, operations: list) -> dict:
+        operations = [_operation.validate_python(o) for o in operations]
+        results = [None] * len(operations)
+        failed_at = None
+        with ThreadPoolExecutor(self.read_workers, thread_name_prefix="store-batch") as pool:
+            for segment in _segments(operations):
+                if len(segment) > 1:
+                    outcomes = pool.map(lambda item: self._run_one(item[2]), segment)
+                else:
+                    outcomes = [self._run_one(segment[0][2])]
+                for (index, _, _), outcome in zip(segment, outcomes):
+                    results[index] = outcome
+                    if outcome["status"] == "failed" and failed_at is None:
+                        failed_at = index
+                if failed_at is not None:
+                    break
+
+        for index, operation in enumerate(operations):
+            if results[index] is None:
+                results[index] = {"tool": get_tool_name(type(operation)), "status": "skipped"}
+        return {"results": results, "failed_at": failed_at}
+
+
+BATCH_TOOL = store_tool(Req_Batch, client=lambda config: StoreBatch(task_api(config)), methods={"/batch": "run"})
+
+# the argument schema only references the operation models, so spell them out
+BATCH_TOOL_DESC = get_tool_signature(Req_Batch, tool_function_name(get_tool_name(Req_Batch))) + "\nOperations: " + ", ".join(
+    f"{get_tool_name(model)}({', '.join(name for name in model.model_fields if name != 'tool')})"
+    for model in BATCH_OPERATIONS
+)
@@ -0,0 +1,188 @@
+"""
+Per-task product catalog.
+
+`/products/list` returns at most 100 products per call, so an agent that pages
+through it pays an LLM round trip per page. `prefetch_catalog` fetches every
+page for a task concurrently as soon as its store client exists, and the
+CATALOG_TOOLS answer SKU lookups and name/price searches from the in-memory
+index in a single call.
+"""
+import bisect
+import logging
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Literal, Optional, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from pydantic import BaseModel, Field
+
+from erc.session import task_api
+from erc.store.tools import get_tool_name, get_tool_signature, store_tool, tool_function_name
+
+MAX_PAGE_SIZE = 100  # /products/list caps `limit` at 100
+PAGE_WORKERS = 8  # concurrent page requests per catalog
+LOAD_WORKERS = 8  # catalogs loading at once
+MIN_PREFIX = 3  # shortest query word matched as a prefix ("lap" -> "laptop")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+_load_pool: Optional[ThreadPoolExecutor] = None
+
+
+def name_tokens(text: str) -> Set[str]:
+    return set(TOKEN_PATTERN.findall(str(text).lower()))
+
+
+def _as_dict(value) -> dict:
+    return value.model_dump() if isinstance(value, BaseModel) else dict(value)
+
+
+def _fetch_page(client, offset: int, limit: int) -> Tuple[List[dict], int]:
+    page = _as_dict(client.list_products(offset=offset, limit=limit))
+    next_offset = page.get("next_offset")
+    return [_as_dict(p) for p in page.get("products") or []], -1 if next_offset is None else next_offset
+
+
+class ProductCatalog:
+    """
+    All products of one store, indexed by SKU, by name/SKU word and by price.
+    Products are the dicts returned by `/products/list`.
+    """
+
+    def __init__(self, products: List[dict]):
+        self.by_sku: Dict[str, dict] = {p["sku"]: p for p in products}
+        self.by_token: Dict[str, Set[str]] = {}
+        for sku, product in self.by_sku.items():
+            for token in name_tokens(product.get("name", "")) | name_tokens(sku):
+                self.by_token.setdefault(token, set()).add(sku)
+        by_price = sorted((product.get("price") or 0, sku) for sku, product in self.by_sku.items())
+        self.prices = [price for price, _ in by_price]
+        self.skus_by_price = [sku for _, sku in by_price]
+
+    @classmethod
+    def load(cls, client, workers: int = PAGE_WORKERS) -> "ProductCatalog":
+        """
+        Fetches every `/products/list` page. The first page tells the page size
+        the server actually serves; the rest are requested `workers` pages at a
+        time until a page reports the end of the list.
+        """
+        products, next_offset = _fetch_page(client, 0, MAX_PAGE_SIZE)
+        page_size = len(products)
+        if next_offset > 0 and page_size:
+            with ThreadPoolExecutor(workers, thread_name_prefix="catalog-page") as pool:
+                done = False
+                while not done:
+                    offsets = [next_offset + i * page_size for i in range(workers)]
+                    for items, next_offset in pool.map(lambda o: _fetch_page(client, o, page_size), offsets):
+                        products.extend(items)
+                        done = next_offset <= 0 or not items
+                        if done:
+                            break
+        logging.info(f"CATALOG LOADED: {len(products)} products")
+        return cls(products)
+
+    def __len__(self):
+        return len(self.by_sku)
+
+    def _token_matches(self, token: str) -> Set[str]:
+        if token in self.by_token:
+            return self.by_token[token]
+        if len(token) < MIN_PREFIX:
+            return set()
+        # "laptops" should find "laptop" and "lap" should find "laptop"
+        matches = set()
+        for indexed, skus in self.by_token.items():
+            if len(indexed) >= MIN_PREFIX and (indexed.startswith(token) or token.startswith(indexed)):
+                matches |= skus
+        return matches
+
+    def _price_range(self, min_price: Optional[float], max_price: Optional[float]) -> List[str]:
+        start = 0 if min_price is None else bisect.bisect_left(self.prices, min_price)
+        end = len(self.prices) if max_price is None else bisect.bisect_right(self.prices, max_price)
+        return self.skus_by_price[start:end]
+
+    def search(
+            self,
+            query: str = "",
+            min_price: Optional[float] = None,
+            max_price: Optional[float] = None,
+            limit: int = 20,
+    ) -> dict:
+        """
+        Products whose name or SKU contains the query words, cheapest first.
+        Products matching every word rank above those matching only some.
+        """
+        matched: Dict[str, int] = {}
+        for token in name_tokens(query):
+            for sku in self._token_matches(token):
+                matched[sku] = matched.get(sku, 0) + 1
+
+        candidates = self._price_range(min_price, max_price)
+        if query.strip():
+            candidates = [sku for sku in candidates if sku in matched]
+            # stable sort keeps price order within the same number of matched words
+            candidates.sort(key=lambda sku: -matched[sku])
+        return {
+            "products": [self.by_sku[sku] for sku in candidates[:max(0, limit)]],
+            "total_matches": len(candidates),
+        }
+
+    def lookup(self, skus: List[str]) -> dict:
+        return {
+            "products": [self.by_sku[sku] for sku in skus if sku in self.by_sku],
+            "unknown_skus": [sku for sku in skus if sku not in self.by_sku],
+        }
+
+
+def prefetch_catalog(client) -> "Future[ProductCatalog]":
+    """
+    Starts loading the catalog of `client` in the background. Meant as the
+    `catalog_factory` of `run_session`, so the pages are fetched while the
+    planner is still thinking.
+    """
+    global _load_pool
+    if _load_pool is None:
+        _load_pool = ThreadPoolExecutor(LOAD_WORKERS, thread_name_prefix="catalog-load")
+    return _load_pool.submit(ProductCatalog.load, client)
+
+
+def task_catalog(config: RunnableConfig) -> ProductCatalog:
+    catalog = config["configurable"].get("catalog")
+    if catalog is None:
+        logging.warning("No prefetched catalog for this task, loading it now")
+        return ProductCatalog.load(task_api(config))
+    return catalog.result() if isinstance(catalog, Future) else catalog
+
+
+class Req_SearchCatalog(BaseModel):
+    """
+    Searches the whole product catalog in one call, cheapest first.
+    Prefer this over paging through /products/list to find products and SKUs.
+    """
+    tool: Literal["/catalog/search"] = "/catalog/search"
+    query: str = Field("", description="Words of the product name or SKU (e.g. 'laptop'); empty matches all")
+    min_price: Optional[float] = Field(None, description="Lowest price to include")
+    max_price: Optional[float] = Field(None, description="Highest price to include")
+    limit: int = Field(20, description="Number of products to return")
+
+
+class Req_LookupProducts(BaseModel):
+    """
+    Returns the products (name, price, stock) for the given SKUs in one call.
+    """
+    tool: Literal["/catalog/lookup"] = "/catalog/lookup"
+    skus: List[str] = Field(..., description="Product SKUs (e.g. ['GPU-4090'])")
+
+
+CATALOG_MODELS = [Req_SearchCatalog, Req_LookupProducts]
+
+CATALOG_TO_METHOD = {
+    "/catalog/search": "search",
+    "/catalog/lookup": "lookup",
+}
+
+CATALOG_TOOLS = [store_tool(t, client=task_catalog, methods=CATALOG_TO_METHOD) for t in CATALOG_MODELS]
+
+CATALOG_TOOLS_DESC = "\n\n".join(
+    get_tool_signature(t, tool_function_name(get_tool_name(t))) for t in CATALOG_MODELS
+)
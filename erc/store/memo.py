@@ -0,0 +1,120 @@
+"""
+Per-task memoization of idempotent store reads.
+
+Plans often view the basket or list the same product page more than once in a
+task. `MemoizingClient` sits in front of a task's store client and answers
+repeated READ_ONLY_TOOLS calls from memory until a mutating call invalidates
+them, as declared in INVALIDATES.
+"""
+import json
+import threading
+from typing import Callable, Dict
+
+from erc.store.tools import INVALIDATES, READ_ONLY_TOOLS, TOOL_TO_METHOD
+
+METHOD_TO_TOOL = {method: tool for tool, method in TOOL_TO_METHOD.items() if method}
+
+STAT_KEYS = ("hits", "misses", "invalidations")
+
+
+def _merge_stats(target: Dict[str, Dict[str, int]], stats: Dict[str, Dict[str, int]]):
+    for tool, counts in stats.items():
+        merged = target.setdefault(tool, dict.fromkeys(STAT_KEYS, 0))
+        for key, count in counts.items():
+            merged[key] += count
+
+
+def format_stats(stats: Dict[str, Dict[str, int]]) -> str:
+    lines = [f"{'tool':16} {'hits':>6} {'misses':>6} {'hit rate':>8} {'invalidated':>11}"]
+    for tool, counts in sorted(stats.items()):
+        calls = counts["hits"] + counts["misses"]
+        rate = counts["hits"] / calls if calls else 0.0
+        lines.append(f"{tool:16} {counts['hits']:6} {counts['misses']:6} {rate:8.1%} {counts['invalidations']:11}")
+    return "\n".join(lines)
+
+
+class MemoizingClient:
+    """
+    Store client wrapper for one task. Read-only methods are cached by their
+    arguments; a mutating method drops the cached results of the tools it
+    invalidates. Failed calls are not cached. Everything else passes through.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.results: Dict[str, Dict[str, object]] = {}  # tool -> arguments key -> result
+        self.generations: Dict[str, int] = {}  # tool -> number of invalidations so far
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+
+    def _count(self, tool: str, key: str, amount: int = 1):
+        counts = self.stats.setdefault(tool, dict.fromkeys(STAT_KEYS, 0))
+        counts[key] += amount
+
+    def _read(self, tool: str, method: Callable, *args, **kwargs):
+        key = json.dumps([args, kwargs], sort_keys=True, default=str)
+        with self.lock:
+            cached = self.results.get(tool, {})
+            if key in cached:
+                self._count(tool, "hits")
+                return cached[key]
+            self._count(tool, "misses")
+            generation = self.generations.get(tool, 0)
+        result = method(*args, **kwargs)
+        with self.lock:
+            # a mutation that finished meanwhile may have made this result stale already
+            if self.generations.get(tool, 0) == generation:
+                self.results.setdefault(tool, {})[key] = result
+        return result
+
+    def _write(self, tool: str, method: Callable, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        finally:
+            # even a failed mutation may have changed the store
+            with self.lock:
+                for stale in INVALIDATES.get(tool, ()):
+                    self.generations[stale] = self.generations.get(stale, 0) + 1
+                    dropped = self.results.pop(stale, {})
+                    if dropped:
+                        self._count(stale, "invalidations", len(dropped))
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.client, name)
+        tool = METHOD_TO_TOOL.get(name)
+        if tool is None or not callable(attribute):
+            return attribute
+        if tool in READ_ONLY_TOOLS:
+            return lambda *args, **kwargs: self._read(tool, attribute, *args, **kwargs)
+        return lambda *args, **kwargs: self._write(tool, attribute, *args, **kwargs)
+
+
+class MemoizingClientFactory:
+    """
+    `client_factory` for `run_session` that puts a MemoizingClient in front of
+    every task's client and keeps them for the hit rate report.
+    """
+
+    def __init__(self, client_factory: Callable):
+        self.client_factory = client_factory
+        self.clients: Dict[str, MemoizingClient] = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, task) -> MemoizingClient:
+        client = MemoizingClient(self.client_factory(task))
+        with self.lock:
+            self.clients[task.task_id] = client
+        return client
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """tool -> hits, misses and invalidated results over all tasks."""
+        totals = {}
+        with self.lock:
+            clients = list(self.clients.values())
+        for client in clients:
+            with client.lock:
+                _merge_stats(totals, client.stats)
+        return totals
+
+    def summary(self) -> str:
+        return format_stats(self.stats())
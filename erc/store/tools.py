@@ -1,8 +1,13 @@
 import json
-from typing import Literal
+import re
+from typing import Any, Callable, Dict, Literal, Optional
 
 import erc3
-from pydantic import BaseModel, Field
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, Field, create_model
+
+from erc.session import task_api
 
 
 class Req_ListProducts(BaseModel):
@@ -83,12 +88,16 @@ ALL_TOOLS = [
 ]
 
 
-def get_tool_signature(model_class):
+def get_tool_name(model_class) -> str:
+    return model_class.model_fields['tool'].default
+
+
+def get_tool_signature(model_class, tool_name: str = None):
     """
     Generates a tool description with arguments.
     """
     schema = model_class.model_json_schema()
-    tool_name = model_class.model_fields['tool'].default
+    tool_name = tool_name or get_tool_name(model_class)
     props = schema.get("properties", {})
     if "tool" in props:
         del props["tool"]
@@ -98,6 +107,8 @@ def get_tool_signature(model_class):
 
 TOOLS_DESC = "\n\n".join([get_tool_signature(t) for t in ALL_TOOLS])
 
+TOOL_MODELS = {get_tool_name(t): t for t in ALL_TOOLS}
+
 TOOL_TO_METHOD = {
     "/products/list": "list_products",
     "/basket/view": "view_basket",
@@ -108,3 +119,66 @@ TOOL_TO_METHOD = {
     "/basket/checkout": "checkout_basket",
     "report_completion": None
 }
+
+# tools that do not change the store; their results can be reused within a task
+READ_ONLY_TOOLS = {"/products/list", "/basket/view"}
+
+# mutating tool -> read-only tools whose earlier results it makes stale
+INVALIDATES = {
+    "/basket/add": {"/basket/view"},
+    "/basket/remove": {"/basket/view"},
+    "/coupon/apply": {"/basket/view"},
+    "/coupon/remove": {"/basket/view"},
+    "/basket/checkout": {"/basket/view", "/products/list"},  # checkout also lowers stock
+}
+
+
+def call_tool(client, request: BaseModel, methods: Dict[str, Optional[str]] = TOOL_TO_METHOD):
+    """
+    Runs a tool request against a store client through `methods` (TOOL_TO_METHOD
+    by default). Tools without a client method (report_completion) return None.
+    """
+    method = methods[get_tool_name(type(request))]
+    if method is None:
+        return None
+    return getattr(client, method)(**request.model_dump(exclude={"tool"}))
+
+
+def tool_function_name(tool_name: str) -> str:
+    """LLM-safe function name for a store path, e.g. "/basket/add" -> "basket_add"."""
+    return re.sub(r"\W+", "_", tool_name).strip("_")
+
+
+def store_tool(
+        model_class,
+        client: Callable[[RunnableConfig], Any] = task_api,
+        methods: Dict[str, Optional[str]] = TOOL_TO_METHOD,
+) -> StructuredTool:
+    """
+    LangChain tool for one request model. `client` resolves the object serving
+    the request from the task config, the store client by default.
+    """
+    fields = {
+        name: (field.annotation, field)
+        for name, field in model_class.model_fields.items()
+        if name != "tool"
+    }
+
+    def run(config: RunnableConfig, **arguments):
+        result = call_tool(client(config), model_class(**arguments), methods)
+        return "OK" if result is None else result
+
+    return StructuredTool.from_function(
+        func=run,
+        name=tool_function_name(get_tool_name(model_class)),
+        description=(model_class.__doc__ or "").strip(),
+        args_schema=create_model(f"{model_class.__name__}Args", **fields),
+    )
+
+
+STORE_TOOLS = [store_tool(t) for t in ALL_TOOLS]
+
+# TOOLS_DESC under the names of STORE_TOOLS, for experts working with those tools
+STORE_TOOLS_DESC = "\n\n".join(
+    get_tool_signature(t, tool_function_name(get_tool_name(t))) for t in ALL_TOOLS
+)
@@ -1,143 +1,181 @@
+import asyncio
 import logging
 import sys
+from typing import Optional
 
 from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import tool, render_text_description
 from langchain_openai import ChatOpenAI
 from langgraph.constants import END
 from langgraph.graph import StateGraph
 from langgraph.prebuilt import ToolNode
 
+from erc.experts.coding import CodingExpert
 from erc.experts.constraint import ConstraintExpert
-from erc.experts.edges import check_review_status, check_execution_status
+from erc.experts.executor import ExecutorExpert
 from erc.experts.planning import PlanningExpert
-from erc.experts.tool import report_task_completion, ExecutorExpert
+from erc.experts.reflection import ReflectionExpert
+from erc.experts.tool import ToolExpert
+from erc.metrics import MetricsRecorder
 from erc.state import AgentState
-from langchain_core.messages import AIMessage
 
 
-# def should_continue(state: AgentState):
-#     messages = state.get("messages", [])
-    
-#     if not messages:
-#         return "planner"
-
-#     last_message = messages[-1]
-    
-#     if isinstance(last_message, AIMessage) and last_message.tool_calls:
-#         return "tools"
-
-#     return "planner"
+def planner_routing(state: AgentState):
+    plan = state.get("plan", None)
+    if plan and plan.is_validated and plan.review and plan.review.is_valid:
+        # plan cache hits and constrained plans with review disabled
+        logging.info(f"PLAN PRE-APPROVED ({plan.review.review_feedback}). Skipping review.")
+        return "executor"
+    return "reviewer"
 
 
-# def workflow(
-#         planner_node,
-#         reviewer_node,
-#         executor_node,
-# ) -> StateGraph[AgentState]:
-#     workflow = StateGraph(AgentState)
+def plan_review_loop(state: AgentState):
+    logging.info("EDGE: planning review_loop")
 
-#     workflow.add_node("planner", planner_node.node)
-#     workflow.add_node("reviewer", reviewer_node.node)
-#     #workflow.add_node("executor", executor_node.node)
+    plan = state.get("plan", None)
+    if not plan:
+        raise Exception("PLANNER EXECUTOR NODE FAILED")
 
+    if plan.validation_attempts >= 5:
+        logging.info("REVIEW LIMIT EXCEEDED.")
+        return "end"
 
-#     workflow.add_node("tools", executor_node)
+    if plan.review.is_valid:
+        logging.info("REVIEW SUCCESSFUL.")
+        return "executor"
+    else:
+        logging.info("REVIEW FAILED.")
+        return "planner"
 
 
+def executor_routing(state: AgentState):
+    if state['executor'].tool == 'code':
+        logging.info("CODE step. Writing code")
+        return "coding"
+    return "tool"
 
-#     workflow.set_entry_point("planner")
 
-#     workflow.add_edge("planner", "reviewer")
+def tool_execute(state: AgentState):
+    logging.info(f"tool_execute routing")
+    messages = state.get("messages", [])
+    if messages and getattr(messages[-1], "tool_calls", None):
+        logging.info(f"tool_execute")
+        return "tools"
 
-#     workflow.add_conditional_edges(
-#         "executor",
-#         should_continue,
-#         {"tools": "tools", "end": END}
-#     )
+    return END
 
-#     workflow.add_conditional_edges(
-#         "reviewer",
-#         check_review_status,
-#         {
-#             "execute": "executor",
-#             "replanning": "planner",
-#             END: END
-#         }
-#     )
 
-#     workflow.add_conditional_edges(
-#         "executor",
-#         check_execution_status,
-#         {
-#             "executor": "executor",
-#             "planner": "planner",
-#             END: END
-#         }
-#     )
+def reflection_routing(state: AgentState):
+    logging.info(f"reflection routing")
 
-#     return workflow
+    if state['step_pointer'] >= len(state['plan'].plan.steps):
+        return END
 
+    if state['executor'].status == 'SUCCESS':
+        logging.info(f"SUCCESS execution. Next step")
+        return 'executor'
 
-def check_review_status(state: AgentState):
-    """Решает, куда идти после Ревью: выполнять или переделывать."""
-    print(f"DEBUG: Check Review Status. Valid? {state.get('plan_is_valid')}")
-    
-    if state.get("plan_is_valid"):
-        return "executor"
-    return "planner"
+    if state['executor'].direct:
+        logging.info(f"Direct call failed. Retrying the step through the LLM")
+        return 'executor'
 
-def should_continue(state: AgentState):
-    """Решает, куда идти после Executor: вызывать тул или обратно к планировщику."""
-    messages = state.get("messages", [])
-    if not messages:
-        return "planner"
+    # a failed step ends the task; there is no replanning
+    logging.info(f"ERROR while execution. Ending the task")
+    return 'error'
 
-    last_message = messages[-1]
-    
-    if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-        print(f"DEBUG: Executor requested tools: {last_message.tool_calls}")
-        return "tools"
-    
-    print("DEBUG: Executor finished step, going back to Planner.")
-    return "planner"
 
 def workflow(
-    planner_node: PlanningExpert,
-    reviewer_node: ConstraintExpert,
-    executor_agent: ExecutorExpert, 
-    tool_node: ToolNode,           
+        planner_node: PlanningExpert,
+        reviewer_node: ConstraintExpert,
+        executor_node: ExecutorExpert,
+        tool_expert: ToolExpert,
+        tool_node: ToolNode,
+        reflection_expert: ReflectionExpert,
+        metrics: Optional[MetricsRecorder] = None,
+        coding_expert: Optional[CodingExpert] = None,
 ) -> StateGraph:
-    
+    """
+    Every expert is added through `runnable()`, so the compiled graph runs the
+    blocking `node` under invoke/stream and the `ainvoke`-based `anode` under
+    ainvoke/astream. With `metrics` every node is timed under its graph name.
+    With `coding_expert`, steps the executor decides as "code" go to it instead
+    of the tool expert; `tool_node` must then serve its sandbox tool.
+    """
     workflow = StateGraph(AgentState)
 
-    workflow.add_node("planner", planner_node.node)
-    workflow.add_node("reviewer", reviewer_node.node)
-    workflow.add_node("executor", executor_agent.node) 
-    workflow.add_node("tools", tool_node)
+    def add_node(name: str, runnable):
+        workflow.add_node(name, metrics.instrument(name, runnable) if metrics else runnable)
+
+    add_node("planner", planner_node.runnable())
+    add_node("reviewer", reviewer_node.runnable())
+    add_node("executor", executor_node.runnable())
+    add_node("tool", tool_expert.runnable())
+    add_node("tool_node", tool_node)
+    add_node("reflection_expert", reflection_expert.runnable())
+    if coding_expert is not None:
+        add_node("coding", coding_expert.runnable())
 
     workflow.set_entry_point("planner")
 
-    workflow.add_edge("planner", "reviewer")
+    workflow.add_conditional_edges(
+        "planner",
+        planner_routing,
+        {
+            "reviewer": "reviewer",
+            "executor": "executor",
+        }
+    )
 
     workflow.add_conditional_edges(
         "reviewer",
-        check_review_status,
+        plan_review_loop,
         {
-            "executor": "executor", 
-            "planner": "planner"
+            "planner": "planner",
+            "executor": "executor",
+            "end": END,
         }
     )
 
+    if coding_expert is None:
+        workflow.add_edge("executor", "tool")
+    else:
+        workflow.add_conditional_edges(
+            "executor",
+            executor_routing,
+            {
+                "coding": "coding",
+                "tool": "tool",
+            }
+        )
+        workflow.add_conditional_edges(
+            "coding",
+            tool_execute,
+            {
+                "tools": "tool_node",
+                END: END,
+            }
+        )
+
     workflow.add_conditional_edges(
-        "executor",
-        should_continue,
+        "tool",
+        tool_execute,
         {
-            "tools": "tools",
-            "planner": "planner"
+            "tools": "tool_node",
+            END: END,
         }
     )
 
-    workflow.add_edge("tools", "executor")
+    workflow.add_edge("tool_node", "reflection_expert")
+
+    workflow.add_conditional_edges(
+        "reflection_expert",
+        reflection_routing,
+        {
+            "executor": "executor",
+            'error': END,
+            END: END
+        }
+    )
 
     return workflow
 
@@ -145,6 +183,17 @@ def workflow(
 if __name__ == "__main__":
     def meta_callback(meta, started):
         print(meta)
+
+
+    @tool
+    def report_task_completion() -> str:
+        """
+        Reports that the task has been completed successfully.
+        """
+        print("-------- >>>>>> !!!!Task completed successfully.")
+        return "SUCCESS"
+
+
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s [%(levelname)s] %(message)s",
@@ -159,47 +208,40 @@ if __name__ == "__main__":
         temperature=0.0,
         max_tokens=1000,
     )
+    tools = [report_task_completion]
+    tools_desc_str = render_text_description(tools)
     p = PlanningExpert(
         persona_path="../prompts/oss-20b-synthetic-persona",
         llm=llm,
-        tools=[report_task_completion],
-        tool_desc="""
-            report_task_completion: Reports that the task has been completed successfully.
-        """,
+        tool_desc=tools_desc_str,
         callback=meta_callback,
     )
     c = ConstraintExpert(
         persona_path="../prompts/oss-20b-synthetic-persona",
         llm=llm,
-        tools=[report_task_completion],
-        tool_desc="""
-            report_task_completion: Reports that the task has been completed successfully.
-        """,
+        tool_desc=tools_desc_str,
         callback=meta_callback,
     )
-    t = ExecutorExpert(
+    e = ExecutorExpert(
         persona_path="../prompts/oss-20b-synthetic-persona",
         llm=llm,
-        tools=[report_task_completion],
-        tool_desc="""
-            report_task_completion: Reports that the task has been completed successfully.
-        """,
+        tool_desc=tools_desc_str,
+        callback=meta_callback,
+    )
+    t = ToolExpert(
+        persona_path="../prompts/oss-20b-synthetic-persona",
+        llm=llm,
+        tools=tools,
         callback=meta_callback,
     )
 
-    app = workflow(p, c, t).compile()
+    app = workflow(p, c, e, t, ToolNode(tools), ReflectionExpert()).compile()
 
     logging.info("🚀 Starting Refactored Agent...")
-    png_bytes = app.get_graph().draw_mermaid_png()
-
-    # with open('img.png', "wb") as f:
-    #     f.write(png_bytes)
 
     config = RunnableConfig(recursion_limit=50)  # TODO: @Viktor, adjust as needed
-    app.invoke({
+    asyncio.run(app.ainvoke({
         "input_task": "Count characters in world raspberry",
-        "consecutive_review_failures": 0,
-        "history": [],
-        "iterations": 0,
-        "plan_is_valid": False,
-    }, config)
+        "messages": [],
+        "step_pointer": 0,
+    }, config))
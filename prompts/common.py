@@ -1,5 +1,5 @@
 import os
-from re import findall
+import re
 from typing import Any
 
 import yaml
@@ -10,8 +10,13 @@ from PromptWizard.promptwizard.glue.common.utils.file import save_jsonlist
 from PromptWizard.promptwizard.glue.promptopt.instantiate import GluePromptOpt
 from PromptWizard.promptwizard.glue.promptopt.techniques.common_logic import DatasetSpecificProcessing
 
+from prompts.compaction import print_report, write_compact_persona
+
 load_dotenv(override=True)
 
+GSM8K_ANSWER_PATTERN = re.compile(r"#### (\-?[0-9\.\,]+)")
+NUMBER_PATTERN = re.compile(r'-?\d+\.?\d*')
+
 
 class GSM8k(DatasetSpecificProcessing):
     TEXT_DELIMITER_PATTERN = r"(?s)(?<=<START>)(.*?)(?=(?:<END>|</START>|</END>))"
@@ -20,10 +25,9 @@ class GSM8k(DatasetSpecificProcessing):
     def dataset_to_jsonl(self, dataset_jsonl: str, **kwargs: Any) -> None:
         def extract_answer_from_output(completion):
             # Your functions for metrics and prompt building
-            ans_re = compile(r"#### (\-?[0-9\.\,]+)")
             self.INVALID_ANS = "[invalid]"
 
-            match = ans_re.search(completion)
+            match = GSM8K_ANSWER_PATTERN.search(completion)
             if match:
                 match_str = match.group(1).strip()
                 match_str = match_str.replace(",", "")
@@ -53,7 +57,7 @@ class GSM8k(DatasetSpecificProcessing):
         answer_flag = True if len(preds) > 1 else False
 
         pred = preds[-1].replace(",", "")
-        pred = [s for s in findall(r'-?\d+\.?\d*', pred)]
+        pred = NUMBER_PATTERN.findall(pred)
 
         if len(pred) == 0:
             return self.INVALID_ANS
@@ -71,14 +75,14 @@ class GSM8k(DatasetSpecificProcessing):
         return pred
 
 
-def update_yaml_file(file_path, config_dict, prefix=""):
+def update_yaml_file(file_path, config_dict, prefix="", output_dir="tmp"):
     with open(file_path, 'r') as file:
         data = yaml.safe_load(file)
 
     for field, value in config_dict.items():
         data[field] = value
 
-    output_path = f"tmp/{file_path.replace('/', f'/{prefix}')}"
+    output_path = os.path.join(output_dir, file_path.replace('/', f'/{prefix}'))
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
     with open(output_path, 'w') as file:
@@ -94,7 +98,7 @@ def get_tasks_from_yaml(file_path):
     return data
 
 
-def save_prompt_to_file(expert, expert_profile, best_prompt):
+def save_prompt_to_file(expert, expert_profile, best_prompt, token_budget=None):
     print(f"{"=" * 20} saving prompt for {expert} into file {"=" * 20}")
     print("-" * 60)
     print(expert_profile)
@@ -105,12 +109,14 @@ def save_prompt_to_file(expert, expert_profile, best_prompt):
         file.write(expert_profile)
     with open(f"{expert}_user.txt", 'w') as file:
         file.write(best_prompt)
+    if token_budget:
+        print_report(write_compact_persona(".", expert, token_budget))
 
 
-def generate_synthetic_examples(t):
+def synthetic_prompt_opt(t, work_dir="tmp", log_dir=None, config_overrides=None):
+    """GluePromptOpt set up to generate synthetic examples for expert `t`; see `process_task` for the dirs."""
     tasks = get_tasks_from_yaml(file_path="configs/tasks.yaml")
     path_to_config = "configs"
-    promptopt_config_path = os.path.join(path_to_config, "promptopt_config_synthetic.yaml")
     setup_config_path = os.path.join(path_to_config, "setup_config_synthetic.yaml")
 
     file_path = 'configs/promptopt_config_synthetic.yaml'
@@ -118,14 +124,22 @@ def generate_synthetic_examples(t):
     config_dict = {
         "task_description": tasks[t]['task_description'],
         "base_instruction": tasks[t]['base_instruction'],
+        **(config_overrides or {}),
     }
-    promptopt_config_path = update_yaml_file(file_path, config_dict, t)
+    promptopt_config_path = update_yaml_file(file_path, config_dict, t, work_dir)
+    if log_dir:
+        dir_info = {**get_tasks_from_yaml(setup_config_path)["dir_info"], "base_dir": log_dir}
+        setup_config_path = update_yaml_file(setup_config_path, {"dir_info": dir_info}, t, work_dir)
 
+    return GluePromptOpt(promptopt_config_path,
+                         setup_config_path,
+                         dataset_jsonl=None,
+                         data_processor=None)
+
+
+def generate_synthetic_examples(t):
     # generate synthetic examples
-    gp = GluePromptOpt(promptopt_config_path,
-                       setup_config_path,
-                       dataset_jsonl=None,
-                       data_processor=None)
+    gp = synthetic_prompt_opt(t)
 
     _, _ = gp.get_best_prompt(
         use_examples=False,
@@ -135,7 +149,13 @@ def generate_synthetic_examples(t):
     )
 
 
-def process_task(t, train_dataset_jsonl):
+def process_task(t, train_dataset_jsonl, work_dir="tmp", log_dir=None):
+    """
+    Optimizes the persona of expert `t` and saves it next to the configs.
+    The patched configs are written under `work_dir`; with `log_dir` the
+    PromptWizard logs go there instead of the shared `dir_info.base_dir`, so
+    several experts can be optimized at once.
+    """
     tasks = get_tasks_from_yaml(file_path="configs/tasks.yaml")
     path_to_config = "configs"
     # generate expert prompts examples
@@ -146,7 +166,10 @@ def process_task(t, train_dataset_jsonl):
     setup_config_path_eval = os.path.join(path_to_config, "setup_config_evaluator.yaml")
     file_path_eval = 'configs/promptopt_config_evaluator.yaml'
 
-    promptopt_config_path_eval = update_yaml_file(file_path_eval, config_dict_eval, t)
+    promptopt_config_path_eval = update_yaml_file(file_path_eval, config_dict_eval, t, work_dir)
+    if log_dir:
+        dir_info = {**get_tasks_from_yaml(setup_config_path_eval)["dir_info"], "base_dir": log_dir}
+        setup_config_path_eval = update_yaml_file(setup_config_path_eval, {"dir_info": dir_info}, t, work_dir)
     gsm8k_processor = GSM8k()
     # Trick to replace regexes in DatasetSpecificProcessing class to avoid ValueError
     DatasetSpecificProcessing.TEXT_DELIMITER_PATTERN = gsm8k_processor.TEXT_DELIMITER_PATTERN
@@ -163,7 +186,7 @@ def process_task(t, train_dataset_jsonl):
         generate_synthetic_examples=False,
     )
 
-    save_prompt_to_file(t, expert_profile, best_prompt)
+    save_prompt_to_file(t, expert_profile, best_prompt, tasks[t].get("token_budget"))
 
 
 def run_task_pipeline(t):
@@ -0,0 +1,110 @@
+"""
+Persona compaction: trims the PromptWizard few-shot examples in
+`<expert>_system.txt` to a token budget and writes `<expert>_system.min.txt`.
+
+    python -m prompts.compaction prompts/oss-20b-synthetic-persona --budget 2500 \
+        --expert-budget error_handling_expert=3500
+"""
+import argparse
+import os
+import re
+
+import tiktoken
+
+DEFAULT_ENCODING = "o200k_base"
+DEFAULT_BUDGET = 2500
+QUESTION_PATTERN = re.compile(r"^\[Question\]", re.MULTILINE)
+TRAILER_PATTERN = re.compile(r"\n\s*\n(?:At the end, wrap only[^\n]*\n)?Keywords:[^\n]*\s*\Z")
+TRUNCATION_MARK = "\n[...]\n"
+
+
+def split_persona(text: str) -> tuple[str, list[str], str]:
+    """
+    Splits a PromptWizard system prompt into instruction header, few-shot
+    examples (one per [Question] block) and the answer-format/keywords trailer.
+    """
+    trailer_match = TRAILER_PATTERN.search(text)
+    body, trailer = (text[:trailer_match.start()], text[trailer_match.start():]) if trailer_match else (text, "")
+
+    starts = [m.start() for m in QUESTION_PATTERN.finditer(body)]
+    if not starts:
+        return body, [], trailer
+    header = body[:starts[0]]
+    examples = [body[start:end] for start, end in zip(starts, starts[1:] + [len(body)])]
+    return header, examples, trailer
+
+
+def compact_persona(text: str, budget: int, encoding) -> tuple[str, int, int]:
+    """
+    Keeps the header and trailer verbatim and as many whole examples, in their
+    original order, as fit into `budget` tokens. If not even the first example
+    fits, a truncated copy of it is kept so the persona still shows the format.
+    Returns (compact text, examples kept, examples total).
+    """
+    header, examples, trailer = split_persona(text)
+    remaining = budget - len(encoding.encode(header)) - len(encoding.encode(trailer))
+
+    kept = []
+    for example in examples:
+        tokens = len(encoding.encode(example))
+        if tokens <= remaining:
+            kept.append(example)
+            remaining -= tokens
+
+    remaining -= len(encoding.encode(TRUNCATION_MARK))
+    if examples and not kept and remaining > 0:
+        tokens = encoding.encode(examples[0])
+        kept.append(encoding.decode(tokens[:remaining]).rstrip() + TRUNCATION_MARK)
+
+    return header + "".join(kept) + trailer, len(kept), len(examples)
+
+
+def write_compact_persona(path: str, expert: str, budget: int = DEFAULT_BUDGET,
+                          encoding_name: str = DEFAULT_ENCODING) -> dict:
+    encoding = tiktoken.get_encoding(encoding_name)
+    with open(os.path.join(path, f"{expert}_system.txt"), "r") as f:
+        text = f.read()
+
+    compact, kept, total = compact_persona(text, budget, encoding)
+    with open(os.path.join(path, f"{expert}_system.min.txt"), "w") as f:
+        f.write(compact)
+
+    return {
+        "expert": expert,
+        "budget": budget,
+        "tokens_before": len(encoding.encode(text)),
+        "tokens_after": len(encoding.encode(compact)),
+        "examples_kept": kept,
+        "examples_total": total,
+    }
+
+
+def print_report(report: dict):
+    print(
+        f"{report['expert']:24} {report['tokens_before']:6} -> {report['tokens_after']:6} tokens "
+        f"(budget {report['budget']}, {report['examples_kept']}/{report['examples_total']} examples)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="directory with <expert>_system.txt files")
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET)
+    parser.add_argument("--expert-budget", action="append", default=[], metavar="EXPERT=TOKENS")
+    parser.add_argument("--encoding", default=DEFAULT_ENCODING)
+    args = parser.parse_args()
+
+    budgets = {}
+    for item in args.expert_budget:
+        expert, tokens = item.split("=", 1)
+        budgets[expert] = int(tokens)
+
+    experts = sorted(
+        f[:-len("_system.txt")] for f in os.listdir(args.path) if f.endswith("_system.txt")
+    )
+    for expert in experts:
+        print_report(write_compact_persona(args.path, expert, budgets.get(expert, args.budget), args.encoding))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Batched evaluation of candidate prompts against a synthetic training set.
+
+Every candidate prompt answers the same questions (as the system prompt, the
+question as the user message). Answers are then extracted and scored for all
+candidates at once with pyarrow compute kernels instead of a Python loop per
+sample, and per-prompt accuracy is reported from one group-by.
+
+    python -m prompts.evaluate prompts/oss-20b-synthetic/planning_expert_train_synthetic.jsonl \
+        prompts/oss-20b-synthetic-persona/planning_expert_system.txt \
+        prompts/oss-20b-synthetic-persona/planning_expert_system.min.txt --limit 200 --mode text
+"""
+import argparse
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import json as pa_json
+
+from prompts.llm_cache import DEFAULT_MAX_BYTES, LLM_CACHE_FILE, cached_llm_calls
+
+DEFAULT_WORKERS = 8
+INVALID_ANSWER = "[invalid]"
+MODES = ("numeric", "text")
+
+# pyarrow compute uses RE2; the patterns mirror GSM8k.extract_final_answer on lowercased text
+FIRST_NUMBER = r"(?P<number>-?\d+\.?\d*)"
+# findall splits every run of digits, dots and minus signs on its own, so the last number is
+# in the last run with a digit; a repeated group captures its last iteration, i.e. that number
+LAST_NUMBER_RUN = r"(?P<run>[-.0-9]*[0-9][-.0-9]*)[^0-9]*$"
+LAST_NUMBER = r"^(?:.*?(?P<number>-?\d+\.?\d*))+"
+ANSWER_BLOCK = r"(?is)<ans_start>(?P<answer>.*?)(?:<ans_end>|$)"
+
+EXAMPLES_SCHEMA = pa.schema([("question", pa.string()), ("final_answer", pa.string())])
+COMPLETIONS_SCHEMA = pa.schema([("prompt", pa.string()), ("example", pa.int64()), ("completion", pa.string())])
+
+
+def _as_strings(values) -> pa.Array:
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    if not isinstance(values, pa.Array):
+        values = pa.array(values, pa.string())
+    return pc.fill_null(values.cast(pa.string()), "")
+
+
+def _group(values: pa.Array, pattern: str, name: str) -> pa.Array:
+    return pc.struct_field(pc.extract_regex(values, pattern), name)
+
+
+def extract_numeric_answers(completions) -> pa.Array:
+    """
+    `GSM8k.extract_final_answer` over a whole batch: the first number after
+    the last <ANS_START>, or the last number of a completion without one,
+    commas removed. Completions without a number give INVALID_ANSWER.
+    """
+    lower = pc.utf8_lower(_as_strings(completions))
+    flagged = pc.match_substring(lower, "<ans_start>")
+    rest = pc.replace_substring(_last_part(lower, "<ans_start>"), ",", "")
+    # each pattern only runs on the rows it decides
+    number = pa.nulls(len(rest), pa.string())
+    unflagged = pc.invert(flagged)
+    first = _group(pc.filter(rest, flagged), FIRST_NUMBER, "number")
+    last = _group(_group(pc.filter(rest, unflagged), LAST_NUMBER_RUN, "run"), LAST_NUMBER, "number")
+    number = pc.replace_with_mask(pc.replace_with_mask(number, flagged, first), unflagged, last)
+    number = pc.replace_substring_regex(number, r"\.$", "")
+    return pc.fill_null(number, INVALID_ANSWER)
+
+
+def _last_part(values: pa.Array, separator: str) -> pa.Array:
+    """What `str.split(separator)[-1]` returns, for every value."""
+    parts = pc.split_pattern(values, separator, max_splits=1, reverse=True)
+    last = pc.subtract(parts.offsets[1:], 1)
+    return pc.take(pc.list_flatten(parts), last)
+
+
+def extract_text_answers(completions) -> pa.Array:
+    """Content of the first <ANS_START> block, normalized; INVALID_ANSWER without a block."""
+    return pc.fill_null(normalize_text(_group(_as_strings(completions), ANSWER_BLOCK, "answer")), INVALID_ANSWER)
+
+
+def normalize_text(values) -> pa.Array:
+    values = pc.replace_substring_regex(pc.utf8_lower(values), r"\s+", " ")
+    return pc.utf8_trim_whitespace(values)
+
+
+def normalize_number(values) -> pa.Array:
+    """'1,250.50' and '1250.5' compare equal."""
+    values = pc.replace_substring(_as_strings(values), ",", "")
+    return pc.fill_null(_strip_zeros(_group(values, FIRST_NUMBER, "number")), INVALID_ANSWER)
+
+
+def _strip_zeros(numbers: pa.Array) -> pa.Array:
+    """'7.50' -> '7.5', '100.0' -> '100'; INVALID_ANSWER and integers stay as they are."""
+    numbers = pc.replace_substring_regex(numbers, r"(\.\d*?)0+$", r"\1")
+    return pc.replace_substring_regex(numbers, r"\.$", "")
+
+
+def score(completions, expected, mode: str = "numeric") -> pa.Array:
+    """
+    Boolean array: whether each completion's extracted answer matches the
+    expected one. Numbers compare after the same normalization on both sides:
+
+    >>> completions = ["<ANS_START>7.50<ANS_END>", "<ANS_START>100.0", "answer 10.0", "7"]
+    >>> score(completions, ["7.50", "100", "10", "7.5"]).to_pylist()
+    [True, True, True, False]
+    """
+    if mode == "numeric":
+        answers, expected = _strip_zeros(extract_numeric_answers(completions)), normalize_number(expected)
+    else:
+        answers, expected = extract_text_answers(completions), normalize_text(_as_strings(expected))
+    return pc.and_(pc.equal(answers, expected), pc.not_equal(answers, INVALID_ANSWER))
+
+
+def load_examples(path: str, limit: Optional[int] = None) -> pa.Table:
+    """question and final_answer columns of a `<expert>_train_synthetic.jsonl` file."""
+    options = pa_json.ParseOptions(explicit_schema=EXAMPLES_SCHEMA, unexpected_field_behavior="ignore")
+    table = pa_json.read_json(path, parse_options=options)
+    return table.slice(0, limit) if limit else table
+
+
+def load_completions(path: str) -> pa.Table:
+    options = pa_json.ParseOptions(explicit_schema=COMPLETIONS_SCHEMA, unexpected_field_behavior="ignore")
+    return pa_json.read_json(path, parse_options=options)
+
+
+def save_completions(table: pa.Table, path: str):
+    with open(path, "w") as f:
+        for batch in table.select(COMPLETIONS_SCHEMA.names).to_batches():
+            f.writelines(json.dumps(row) + "\n" for row in batch.to_pylist())
+
+
+def chat_completion(system: str, question: str) -> str:
+    from PromptWizard.promptwizard.glue.common.llm.llm_mgr import LLMMgr
+
+    return LLMMgr.chat_completion([{"role": "system", "content": system}, {"role": "user", "content": question}])
+
+
+def run_prompts(
+        prompts: Dict[str, str],
+        questions: List[str],
+        workers: int = DEFAULT_WORKERS,
+        complete: Callable[[str, str], str] = chat_completion,
+) -> pa.Table:
+    """Completions of every prompt for every question; failed calls leave a null completion."""
+    jobs = [(name, index) for name in prompts for index in range(len(questions))]
+    done = [0]
+    lock = threading.Lock()
+
+    def run(job):
+        name, index = job
+        try:
+            completion = complete(prompts[name], questions[index])
+        except Exception as e:
+            print(f"{name} #{index} failed: {type(e).__name__}: {e}")
+            completion = None
+        with lock:
+            done[0] += 1
+            if done[0] % 100 == 0 or done[0] == len(jobs):
+                print(f"{done[0]}/{len(jobs)} completions")
+        return completion
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="evaluate") as pool:
+        completions = list(pool.map(run, jobs))
+    return pa.table(
+        {
+            "prompt": pa.array([name for name, _ in jobs], pa.string()),
+            "example": pa.array([index for _, index in jobs], pa.int64()),
+            "completion": pa.array(completions, pa.string()),
+        }
+    )
+
+
+def accuracy(completions: pa.Table, examples: pa.Table, mode: str = "numeric") -> pa.Table:
+    """
+    Per-prompt accuracy of a (prompt, example, completion) table in one pass:
+    the expected answers are gathered by example index, all rows are scored
+    together, then aggregated per prompt.
+    """
+    completions = completions.filter(pc.less(completions["example"], examples.num_rows))
+    expected = pc.take(examples["final_answer"], completions["example"])
+    scored = completions.append_column("correct", score(completions["completion"], expected, mode))
+    scored = scored.append_column("failed", pc.is_null(completions["completion"]))
+    summary = scored.group_by("prompt").aggregate([("correct", "sum"), ("correct", "count"), ("failed", "sum")])
+    summary = summary.append_column("accuracy", pc.divide(pc.cast(summary["correct_sum"], pa.float64()),
+                                                          pc.cast(summary["correct_count"], pa.float64())))
+    return summary.sort_by([("accuracy", "descending")])
+
+
+def format_accuracy(summary: pa.Table) -> str:
+    lines = [f"{'prompt':40} {'accuracy':>8} {'correct':>7} {'total':>6} {'failed':>6}"]
+    for row in summary.to_pylist():
+        lines.append(
+            f"{row['prompt']:40} {row['accuracy']:8.1%} {row['correct_sum']:7} {row['correct_count']:6} "
+            f"{row['failed_sum']:6}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", help="<expert>_train_synthetic.jsonl")
+    parser.add_argument("prompts", nargs="*", help="files with a candidate system prompt each")
+    parser.add_argument("--mode", choices=MODES, default="numeric",
+                        help="numeric: GSM8k-style number answers; text: normalized <ANS_START> block")
+    parser.add_argument("--limit", type=int, help="evaluate the first N examples only")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="LLM calls at once")
+    parser.add_argument("--completions", help="score completions saved with --save instead of calling the LLM")
+    parser.add_argument("--save", help="write the completions to this JSONL file")
+    parser.add_argument("--llm-cache", default=LLM_CACHE_FILE, help="SQLite file of cached LLM responses")
+    parser.add_argument("--no-llm-cache", action="store_true", help="always call the LLM")
+    args = parser.parse_args()
+
+    examples = load_examples(args.dataset, args.limit)
+    if args.completions:
+        completions = load_completions(args.completions)
+    else:
+        prompts = {}
+        for path in args.prompts:
+            with open(path, "r") as f:
+                prompts[os.path.basename(path)] = f.read()
+        with nullcontext() if args.no_llm_cache else cached_llm_calls(args.llm_cache, DEFAULT_MAX_BYTES) as cache:
+            completions = run_prompts(prompts, examples["question"].to_pylist(), args.workers)
+            if cache is not None:
+                print(cache.summary())
+    if args.save:
+        save_completions(completions, args.save)
+    print(format_accuracy(accuracy(completions, examples, args.mode)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+On-disk cache of PromptWizard LLM responses.
+
+A persona optimization issues thousands of completions, and rerunning it after
+a small config tweak repeats most of them verbatim. `cached_llm_calls` puts a
+content-addressed SQLite cache under `LLMMgr.chat_completion`, keyed by model,
+messages and call parameters, so a rerun replays the unchanged prefix of the
+run from disk and only pays for the calls that differ.
+
+    python -m prompts.llm_cache tmp/llm_cache.sqlite            # size and hit counts
+    python -m prompts.llm_cache tmp/llm_cache.sqlite --max-mb 200  # evict down to 200 MB
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+LLM_CACHE_FILE = "tmp/llm_cache.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+EVICT_TO = 0.9  # eviction frees space down to this share of max_bytes, so not every put evicts
+# PromptWizard picks the model from the environment, not from the call
+MODEL_ENV_VARS = ("MODEL_TYPE", "OPENAI_MODEL_NAME", "AZURE_OPENAI_DEPLOYMENT_NAME", "OPENAI_BASE_URL")
+
+
+def model_signature() -> Dict[str, Optional[str]]:
+    return {name: os.environ.get(name) for name in MODEL_ENV_VARS}
+
+
+class LLMResponseCache:
+    """
+    SQLite cache of chat completions, shared by the optimizer processes.
+
+    The key is a hash of the model, the messages, the call parameters and the
+    number of identical calls made before in this process: PromptWizard asks
+    the same question several times to sample different answers, and a
+    replay returns the same sequence of answers instead of the first one over
+    and over. Entries are evicted least recently used first once the stored
+    responses exceed `max_bytes`. Calls that fail or return nothing are not
+    cached.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_FILE, max_bytes: int = DEFAULT_MAX_BYTES,
+                 model: Optional[dict] = None):
+        self.max_bytes = max_bytes
+        self.model = model if model is not None else model_signature()
+        self.occurrences: Dict[str, int] = {}
+        self.stats = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # several optimizer processes write the same file; wait for their locks instead of failing
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+            """
+        )
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def key(self, messages, params: dict) -> str:
+        request = json.dumps({"model": self.model, "messages": messages, "params": params},
+                             sort_keys=True, default=str)
+        digest = hashlib.sha256(request.encode()).hexdigest()
+        with self.lock:
+            occurrence = self.occurrences.get(digest, 0)
+            self.occurrences[digest] = occurrence + 1
+        return f"{digest}:{occurrence}"
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            with self.db:
+                self.db.execute(
+                    "UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key)
+                )
+            self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, response):
+        blob = json.dumps(response)
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now),
+            )
+            self.stats["puts"] += 1
+            self.total_bytes += len(blob)
+            if self.total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * EVICT_TO))
+
+    def _evict(self, target_bytes: int):
+        # other processes add entries too, so start from the real size
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        evicted = []
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if self.total_bytes <= target_bytes:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.stats["evictions"] += len(evicted)
+
+    def shrink(self, max_bytes: int):
+        with self.lock, self.db:
+            self._evict(max_bytes)
+
+    def wrap(self, chat_completion: Callable) -> Callable:
+        def cached(messages, *args, **kwargs):
+            key = self.key(messages, {"args": args, "kwargs": kwargs})
+            response = self.get(key)
+            if response is None:
+                response = chat_completion(messages, *args, **kwargs)
+                if response:
+                    self.put(key, response)
+            return response
+
+        return cached
+
+    def entries(self) -> dict:
+        with self.lock:
+            count, size, hits = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM responses"
+            ).fetchone()
+        return {"entries": count, "bytes": size, "hits": hits}
+
+    def summary(self) -> str:
+        calls = self.stats["hits"] + self.stats["misses"]
+        rate = self.stats["hits"] / calls if calls else 0.0
+        return (
+            f"LLM cache: {self.stats['hits']}/{calls} hits ({rate:.1%}), {self.stats['puts']} stored, "
+            f"{self.stats['evictions']} evicted"
+        )
+
+    def close(self):
+        self.db.close()
+
+
+@contextmanager
+def cached_llm_calls(path: str = LLM_CACHE_FILE, max_bytes: int = DEFAULT_MAX_BYTES) -> Iterator[LLMResponseCache]:
+    """
+    Routes PromptWizard's `LLMMgr.chat_completion` through an LLMResponseCache
+    for the duration of the block, e.g. around `process_task`.
+    """
+    from PromptWizard.promptwizard.glue.common.llm.llm_mgr import LLMMgr
+
+    cache = LLMResponseCache(path, max_bytes)
+    chat_completion = LLMMgr.chat_completion
+    LLMMgr.chat_completion = staticmethod(cache.wrap(chat_completion))
+    try:
+        yield cache
+    finally:
+        LLMMgr.chat_completion = staticmethod(chat_completion)
+        cache.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", default=LLM_CACHE_FILE)
+    parser.add_argument("--max-mb", type=float, help="evict least recently used responses down to this size")
+    args = parser.parse_args()
+
+    cache = LLMResponseCache(args.path)
+    if args.max_mb is not None:
+        cache.shrink(int(args.max_mb * 1024 * 1024))
+        print(f"Evicted {cache.stats['evictions']} responses")
+    entries = cache.entries()
+    print(f"{entries['entries']} responses, {entries['bytes'] / 1024 / 1024:.1f} MB, {entries['hits']} hits served")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
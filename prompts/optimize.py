@@ -0,0 +1,270 @@
+"""
+Parallel persona optimization: runs `process_task` for several experts of
+tasks.yaml at once in a process pool. Each expert gets its own temp configs,
+PromptWizard logs and console log under `tmp/<expert>/`. Outcomes are kept in
+a state file, so a rerun skips the experts that already finished and retries
+the failed ones. LLM responses are cached on disk (`prompts.llm_cache`), so a
+rerun after a config tweak only pays for the calls that changed. LLM calls
+that reach the API are metered per expert for the cost summary.
+
+    cd prompts/oss-20b-synthetic-persona
+    python -m prompts.optimize --dataset-dir ../oss-20b-synthetic --workers 4 \
+        --input-price 0.05 --output-price 0.40
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext, redirect_stderr, redirect_stdout
+from typing import Dict, List, Optional
+
+import tiktoken
+
+from prompts.compaction import DEFAULT_ENCODING
+from prompts.llm_cache import DEFAULT_MAX_BYTES, LLM_CACHE_FILE, cached_llm_calls
+
+DEFAULT_WORKERS = 4
+STATE_FILE = "optimize_state.json"
+TMP_DIR = "tmp"
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators of the chat template
+
+
+class LLMUsage:
+    """Counts PromptWizard LLM calls and estimates their tokens with tiktoken."""
+
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING):
+        try:
+            self.encoding = tiktoken.get_encoding(encoding_name)
+        except Exception:
+            # the BPE file is downloaded on first use; estimate from characters instead
+            self.encoding = None
+        self.calls = 0
+        self.failed_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_seconds = 0.0
+
+    def count_text(self, text) -> int:
+        text = text if isinstance(text, str) else json.dumps(text, default=str)
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_messages(self, messages) -> int:
+        if isinstance(messages, list):
+            return sum(self.count_text(m.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+        return self.count_text(messages)
+
+    def meter(self, chat_completion):
+        def metered(messages, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                response = chat_completion(messages, *args, **kwargs)
+            except Exception:
+                self.failed_calls += 1
+                raise
+            finally:
+                self.calls += 1
+                self.llm_seconds += time.perf_counter() - started
+                self.prompt_tokens += self.count_messages(messages)
+            self.completion_tokens += self.count_text(response or "")
+            return response
+
+        return metered
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "failed_calls": self.failed_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "llm_seconds": round(self.llm_seconds, 1),
+        }
+
+
+def optimize_expert(expert: str, dataset_jsonl: str, llm_cache: Optional[str] = LLM_CACHE_FILE,
+                    llm_cache_bytes: int = DEFAULT_MAX_BYTES) -> dict:
+    """
+    Worker: optimizes one persona with the PromptWizard LLM calls cached and
+    metered, and the console output captured in `tmp/<expert>/optimize.log`.
+    Cache hits are not metered, they cost nothing.
+    """
+    from PromptWizard.promptwizard.glue.common.llm.llm_mgr import LLMMgr
+
+    from prompts.common import process_task
+
+    work_dir = os.path.join(TMP_DIR, expert)
+    os.makedirs(work_dir, exist_ok=True)
+    usage = LLMUsage()
+    chat_completion = LLMMgr.chat_completion
+    LLMMgr.chat_completion = staticmethod(usage.meter(chat_completion))
+    started = time.perf_counter()
+    cache_stats = {}
+    try:
+        with open(os.path.join(work_dir, "optimize.log"), "w") as log, redirect_stdout(log), redirect_stderr(log):
+            with cached_llm_calls(llm_cache, llm_cache_bytes) if llm_cache else nullcontext() as cache:
+                try:
+                    process_task(expert, dataset_jsonl, work_dir=work_dir, log_dir=os.path.join(work_dir, "logs"))
+                except Exception:
+                    traceback.print_exc()
+                    raise
+                finally:
+                    if cache is not None:
+                        cache_stats = {"cache_hits": cache.stats["hits"], "cache_misses": cache.stats["misses"]}
+                        print(cache.summary())
+    except Exception as e:
+        # exceptions of PromptWizard internals may not pickle; send back their text
+        raise RuntimeError(f"{type(e).__name__}: {e} (usage {usage.as_dict()})") from None
+    finally:
+        LLMMgr.chat_completion = staticmethod(chat_completion)
+    return {**usage.as_dict(), **cache_stats, "seconds": round(time.perf_counter() - started, 1)}
+
+
+class OptimizationState:
+    """
+    Per-expert outcome of the runs so far, kept as JSON: status "done" or
+    "failed", attempts, last error, and the usage of the successful run.
+    Rewritten atomically after every expert, so an interrupted run loses
+    nothing but the experts still in flight.
+    """
+
+    def __init__(self, path: str = STATE_FILE):
+        self.path = path
+        self.experts: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.experts = json.load(f)
+
+    def status(self, expert: str) -> Optional[str]:
+        return self.experts.get(expert, {}).get("status")
+
+    def record(self, expert: str, status: str, **fields):
+        entry = self.experts.setdefault(expert, {"attempts": 0})
+        entry.update(status=status, attempts=entry["attempts"] + 1, updated=time.time(), **fields)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.experts, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def cost(usage: dict, input_price: float, output_price: float) -> float:
+    """USD for the estimated tokens; prices are per 1M tokens."""
+    return (usage.get("prompt_tokens", 0) * input_price + usage.get("completion_tokens", 0) * output_price) / 1e6
+
+
+def format_summary(state: OptimizationState, experts: List[str], input_price: float, output_price: float) -> str:
+    lines = [f"{'expert':24} {'status':7} {'tries':>5} {'minutes':>7} {'calls':>6} {'cached':>6} {'tokens in':>10} "
+             f"{'tokens out':>10} {'cost $':>8}"]
+    totals = {"seconds": 0.0, "calls": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    for expert in experts:
+        entry = state.experts.get(expert, {})
+        usage = entry.get("usage", {})
+        for key in totals:
+            totals[key] += usage.get(key, 0)
+        lines.append(
+            f"{expert:24} {entry.get('status', 'pending'):7} {entry.get('attempts', 0):5} "
+            f"{usage.get('seconds', 0) / 60:7.1f} {usage.get('calls', 0):6} {usage.get('cache_hits', 0):6} "
+            f"{usage.get('prompt_tokens', 0):10} "
+            f"{usage.get('completion_tokens', 0):10} {cost(usage, input_price, output_price):8.3f}"
+        )
+    lines.append(
+        f"{'total':24} {'':7} {'':5} {totals['seconds'] / 60:7.1f} {totals['calls']:6} {totals['cache_hits']:6} "
+        f"{totals['prompt_tokens']:10} "
+        f"{totals['completion_tokens']:10} {cost(totals, input_price, output_price):8.3f}"
+    )
+    return "\n".join(lines)
+
+
+def optimize_experts(
+        experts: List[str],
+        dataset_dir: str,
+        workers: int = DEFAULT_WORKERS,
+        retries: int = 0,
+        force: bool = False,
+        state_path: str = STATE_FILE,
+        llm_cache: Optional[str] = LLM_CACHE_FILE,
+        llm_cache_bytes: int = DEFAULT_MAX_BYTES,
+        input_price: float = 0.0,
+        output_price: float = 0.0,
+) -> OptimizationState:
+    """
+    Optimizes `experts` with at most `workers` of them at a time, from the
+    persona directory (the cwd). Experts recorded as done are skipped unless
+    `force`; a failing expert is resubmitted up to `retries` times. All
+    workers share the `llm_cache` file; None disables the cache.
+    """
+    state = OptimizationState(state_path)
+    pending = [e for e in experts if force or state.status(e) != "done"]
+    skipped = len(experts) - len(pending)
+    if skipped:
+        print(f"Skipping {skipped} experts already optimized (see {state_path})")
+
+    started = time.perf_counter()
+    finished = 0
+    tries = dict.fromkeys(pending, 0)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        def submit(expert):
+            tries[expert] += 1
+            dataset_jsonl = os.path.join(dataset_dir, f"{expert}_train_synthetic.jsonl")
+            return executor.submit(optimize_expert, expert, dataset_jsonl, llm_cache, llm_cache_bytes)
+
+        futures = {submit(e): e for e in pending}
+        while futures:
+            future = next(as_completed(futures))
+            expert = futures.pop(future)
+            elapsed = (time.perf_counter() - started) / 60
+            try:
+                usage = future.result()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                state.record(expert, "failed", error=error)
+                if tries[expert] <= retries and not isinstance(e, BrokenProcessPool):
+                    print(f"[{elapsed:6.1f} min] {expert} failed, retrying: {error}")
+                    futures[submit(expert)] = expert
+                    continue
+                finished += 1
+                print(f"[{elapsed:6.1f} min] {finished}/{len(pending)} {expert} FAILED: {error}")
+                continue
+            finished += 1
+            state.record(expert, "done", error=None, usage=usage)
+            print(
+                f"[{elapsed:6.1f} min] {finished}/{len(pending)} {expert} done in {usage['seconds'] / 60:.1f} min, "
+                f"{usage['calls']} LLM calls, {usage.get('cache_hits', 0)} cached, ${cost(usage, input_price, output_price):.3f}"
+            )
+
+    print(format_summary(state, experts, input_price, output_price))
+    return state
+
+
+def main():
+    from prompts.common import get_tasks_from_yaml
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("experts", nargs="*", help="experts to optimize (default: all in configs/tasks.yaml)")
+    parser.add_argument("--dataset-dir", default=".", help="directory with <expert>_train_synthetic.jsonl files")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="experts optimized at once")
+    parser.add_argument("--retries", type=int, default=0, help="resubmissions of a failing expert within a run")
+    parser.add_argument("--force", action="store_true", help="also rerun experts recorded as done")
+    parser.add_argument("--state", default=STATE_FILE)
+    parser.add_argument("--llm-cache", default=LLM_CACHE_FILE, help="SQLite file of cached LLM responses")
+    parser.add_argument("--llm-cache-mb", type=float, default=DEFAULT_MAX_BYTES / 1024 / 1024)
+    parser.add_argument("--no-llm-cache", action="store_true", help="always call the LLM")
+    parser.add_argument("--input-price", type=float, default=0.0, help="USD per 1M prompt tokens")
+    parser.add_argument("--output-price", type=float, default=0.0, help="USD per 1M completion tokens")
+    args = parser.parse_args()
+
+    experts = args.experts or list(get_tasks_from_yaml(file_path="configs/tasks.yaml"))
+    state = optimize_experts(
+        experts, args.dataset_dir, args.workers, args.retries, args.force, args.state,
+        None if args.no_llm_cache else args.llm_cache, int(args.llm_cache_mb * 1024 * 1024),
+        args.input_price, args.output_price,
+    )
+    sys.exit(0 if all(state.status(e) == "done" for e in experts) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from dotenv import load_dotenv
 
-from prompts.common import get_tasks_from_yaml, generate_synthetic_examples
+from prompts.common import get_tasks_from_yaml
+from prompts.synthetic import generate_synthetic_sets
 
 load_dotenv(override=True)
 
@@ -8,5 +9,5 @@ if __name__ == '__main__':
     tasks = get_tasks_from_yaml(file_path="configs/tasks.yaml")
     filtered_tasks = [t for t in tasks if t not in []]
 
-    for t in filtered_tasks:
-        generate_synthetic_examples(t)
+    # appends to the existing <expert>_train_synthetic.jsonl files until each has 500 distinct questions
+    generate_synthetic_sets(filtered_tasks, examples=500)
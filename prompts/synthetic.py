@@ -0,0 +1,251 @@
+"""
+Streaming synthetic training sets: asks PromptWizard for `num_train_examples`
+examples at a time, for every expert at once, until each expert has the
+requested number of distinct examples. Rows are appended to
+`<expert>_train_synthetic.jsonl` as their batch arrives, and questions that
+are near-duplicates (MinHash over word shingles) of a question already written
+are dropped. A rerun continues the existing files.
+
+    cd prompts/oss-20b-synthetic
+    python -m prompts.synthetic --examples 2000 --workers 8
+"""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+DEFAULT_EXAMPLES = 500
+DEFAULT_WORKERS = 8
+DEFAULT_THRESHOLD = 0.7  # estimated Jaccard similarity above which a question is a duplicate
+NUM_PERM = 64
+BANDS = 16  # LSH bands of NUM_PERM // BANDS rows; candidates start around 0.5 similarity
+SHINGLE_WORDS = 3
+MAX_BATCHES_FACTOR = 3  # batches per expert, relative to the batches needed without duplicates
+AVOID_QUESTIONS = 8  # recent questions shown to the next batch of the expert
+AVOID_HINT = "Write new examples that differ in scenario and wording from these existing questions:"
+MERSENNE = (1 << 61) - 1
+TMP_DIR = "tmp"
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set:
+    words = WORD_PATTERN.findall(str(text).lower())
+    grams = [" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))]
+    return {int.from_bytes(hashlib.blake2b(g.encode(), digest_size=8).digest(), "little") for g in grams}
+
+
+class MinHashIndex:
+    """
+    Near-duplicate detection for short texts. Each text gets a MinHash
+    signature; LSH banding finds the texts that share a band with it, and the
+    share of equal signature values estimates their Jaccard similarity. Only
+    the signatures are kept (NUM_PERM 64-bit values per text), not the texts.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = NUM_PERM, bands: int = BANDS,
+                 seed: int = 1):
+        rng = random.Random(seed)
+        self.permutations = [(rng.randrange(1, MERSENNE), rng.randrange(MERSENNE)) for _ in range(num_perm)]
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.signatures: List[array] = []
+        self.buckets: Dict[int, List[int]] = {}  # hash of (band, band values) -> signature indexes
+        self.lock = threading.Lock()
+
+    def signature(self, text: str) -> array:
+        hashes = shingles(text)
+        return array("Q", (min((a * h + b) % MERSENNE for h in hashes) for a, b in self.permutations))
+
+    def similarity(self, a: array, b: array) -> float:
+        return sum(x == y for x, y in zip(a, b)) / len(a)
+
+    def add(self, text: str) -> bool:
+        """Indexes `text` unless it is a near-duplicate of an indexed text; returns whether it was added."""
+        signature = self.signature(text)
+        bands = [hash((band, *signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+        with self.lock:
+            candidates = {index for key in bands for index in self.buckets.get(key, ())}
+            if any(self.similarity(signature, self.signatures[i]) >= self.threshold for i in candidates):
+                return False
+            for key in bands:
+                self.buckets.setdefault(key, []).append(len(self.signatures))
+            self.signatures.append(signature)
+        return True
+
+    def __len__(self):
+        return len(self.signatures)
+
+
+def question_of(row: dict) -> str:
+    return row.get("question") or json.dumps(row, sort_keys=True)
+
+
+class SyntheticSet:
+    """
+    One expert's output file and its dedup index. An existing file is read
+    once to index its questions and is then appended to.
+    """
+
+    def __init__(self, expert: str, path: str, threshold: float = DEFAULT_THRESHOLD):
+        self.expert = expert
+        self.path = path
+        self.index = MinHashIndex(threshold)
+        self.recent = deque(maxlen=AVOID_QUESTIONS)
+        self.existing = 0
+        self.written = 0
+        self.duplicates = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.in_flight = 0
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        question = question_of(json.loads(line))
+                        self.index.add(question)
+                        self.recent.append(question)
+                        self.existing += 1
+        self.file = open(path, "a")
+
+    @property
+    def total(self) -> int:
+        return self.existing + self.written
+
+    def write(self, rows: List[dict]) -> int:
+        """Appends the rows that are not near-duplicates; returns how many were written."""
+        written = 0
+        for row in rows:
+            question = question_of(row)
+            if not self.index.add(question):
+                self.duplicates += 1
+                continue
+            self.file.write(json.dumps(row) + "\n")
+            self.recent.append(question)
+            written += 1
+        self.file.flush()
+        self.written += written
+        return written
+
+    def close(self):
+        self.file.close()
+
+
+def generate_batch(prompt_opt, params, avoid: List[str]) -> List[dict]:
+    """One PromptWizard zero-shot example generation, steered away from `avoid`."""
+    if avoid:
+        params = copy.copy(params)
+        params.base_instruction = "\n".join([params.base_instruction, AVOID_HINT, *(f"- {q}" for q in avoid)])
+    return prompt_opt.generate_best_examples_zero_shot(params=params)
+
+
+def format_summary(sets: List[SyntheticSet]) -> str:
+    lines = [f"{'expert':24} {'rows':>6} {'new':>6} {'dupes':>6} {'batches':>7} {'failed':>6}"]
+    for s in sets:
+        lines.append(
+            f"{s.expert:24} {s.total:6} {s.written:6} {s.duplicates:6} {s.batches:7} {s.failed_batches:6}"
+        )
+    return "\n".join(lines)
+
+
+def generate_synthetic_sets(
+        experts: List[str],
+        out_dir: str = ".",
+        examples: int = DEFAULT_EXAMPLES,
+        workers: int = DEFAULT_WORKERS,
+        threshold: float = DEFAULT_THRESHOLD,
+        batch_size: Optional[int] = None,
+) -> List[SyntheticSet]:
+    """
+    Generates until every expert has `examples` rows, with at most `workers`
+    batches in flight across all experts. An expert stops early after
+    MAX_BATCHES_FACTOR times the batches it would need without duplicates,
+    since by then the generator mostly repeats itself.
+    """
+    from prompts.common import synthetic_prompt_opt
+
+    sets, generators, max_batches = [], {}, {}
+    for expert in experts:
+        work_dir = os.path.join(TMP_DIR, expert)
+        overrides = {"num_train_examples": batch_size} if batch_size else None
+        gp = synthetic_prompt_opt(expert, work_dir, os.path.join(work_dir, "logs"), overrides)
+        synthetic = SyntheticSet(expert, os.path.join(out_dir, f"{expert}_train_synthetic.jsonl"), threshold)
+        per_batch = max(1, int(gp.prompt_opt_param.num_train_examples))
+        missing = max(0, examples - synthetic.total)
+        max_batches[expert] = -(-missing // per_batch) * MAX_BATCHES_FACTOR
+        generators[expert] = (gp.prompt_opt, gp.prompt_opt_param, per_batch)
+        sets.append(synthetic)
+        if synthetic.existing:
+            print(f"{expert}: continuing {synthetic.path} with {synthetic.existing} rows")
+
+    def next_set() -> Optional[SyntheticSet]:
+        # the expert furthest from its target, counting the batches still in flight
+        wanted = [
+            s for s in sets
+            if s.total + s.in_flight * generators[s.expert][2] < examples
+            and s.batches + s.in_flight < max_batches[s.expert]
+        ]
+        return min(wanted, key=lambda s: s.total + s.in_flight * generators[s.expert][2], default=None)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers, thread_name_prefix="synthetic") as pool:
+        futures = {}
+        while True:
+            while len(futures) < workers and (synthetic := next_set()) is not None:
+                prompt_opt, params, _ = generators[synthetic.expert]
+                synthetic.in_flight += 1
+                futures[pool.submit(generate_batch, prompt_opt, params, list(synthetic.recent))] = synthetic
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                synthetic = futures.pop(future)
+                synthetic.in_flight -= 1
+                synthetic.batches += 1
+                try:
+                    rows = future.result() or []
+                except Exception as e:
+                    synthetic.failed_batches += 1
+                    print(f"{synthetic.expert}: batch failed: {type(e).__name__}: {e}")
+                    continue
+                written = synthetic.write(rows)
+                print(
+                    f"[{(time.perf_counter() - started) / 60:6.1f} min] {synthetic.expert}: "
+                    f"+{written}/{len(rows)} rows, {synthetic.total}/{examples}"
+                )
+
+    for synthetic in sets:
+        synthetic.close()
+    print(format_summary(sets))
+    return sets
+
+
+def main():
+    from prompts.common import get_tasks_from_yaml
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("experts", nargs="*", help="experts to generate for (default: all in configs/tasks.yaml)")
+    parser.add_argument("--out-dir", default=".", help="directory of the <expert>_train_synthetic.jsonl files")
+    parser.add_argument("--examples", type=int, default=DEFAULT_EXAMPLES, help="rows wanted per expert")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="batches generated at once")
+    parser.add_argument("--batch-size", type=int, help="examples asked for per batch (num_train_examples)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="MinHash similarity at which a question counts as a duplicate")
+    args = parser.parse_args()
+
+    experts = args.experts or list(get_tasks_from_yaml(file_path="configs/tasks.yaml"))
+    generate_synthetic_sets(experts, args.out_dir, args.examples, args.workers, args.threshold, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()